@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from catalog_index import CatalogIndex
+from catalog_store import read_books
+from cf_engine import CFEngine, NeighborTable, NEIGHBORS_DIR, NEIGHBORS_K
+from history_store import get_store
+from ranking import HybridRanker, TONE_COLUMNS
+from user_profiles import get_profiles, profiles_path_for
+from vector_index import VectorIndex, vector_index_dir_for
+
+# --- GỢI Ý HÀNG LOẠT (FILE QUERY / USER ID -> JSONL) ---
+# Dashboard chỉ gợi ý được từng query qua nút bấm Gradio. Ở đây cả lô request được xử lý cùng lúc:
+#   embed theo batch -> VectorIndex.search_batch (một phép nhân ma trận cho cả lô)
+#   -> láng giềng CF của các kết quả đầu lấy bằng một lần gather trên bảng láng giềng
+#   -> HybridRanker gộp điểm -> ghi JSONL theo đúng thứ tự đầu vào.
+# Nhiều process thì mỗi process nạp model riêng, còn catalogue/index/bảng láng giềng đều là
+# memory-map nên các process dùng chung page của OS. Dùng cho email gợi ý hằng đêm.
+#
+# Đầu vào: file text (mỗi dòng một query, hoặc một user_id với --users) hoặc JSONL với các khóa
+# "query" / "user_id", tùy chọn "category", "tone", "id".
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class BatchRecommender:
+    def __init__(self, catalog, index, embedding_model, neighbors=None, ranker=None, history=None,
+                 profiles=None, top_k=10, candidates=100):
+        self.catalog = catalog
+        self.index = index
+        self.embedding_model = embedding_model
+        self.ranker = ranker or HybridRanker()
+        self.history = history
+        # Hồ sơ sở thích (user_profiles.py): request chỉ có user_id dùng thẳng vector hồ sơ, không embed.
+        # record_profiles=True: cộng embedding của các request có cả query + user_id vào hồ sơ (serve.py)
+        self.profiles = profiles
+        self.record_profiles = False
+        self.top_k = top_k
+        self.candidates = candidates
+
+        # Vị trí catalog <-> hàng của vector index / bảng láng giềng, tính một lần cho cả lô
+        self.index_to_pos = catalog.indexer(np.asarray(index.isbns).astype(str))
+        self.neighbors = neighbors
+        if neighbors is not None:
+            neighbor_isbns = np.asarray(neighbors.isbns).astype(str)
+            self.neighbor_to_pos = catalog.indexer(neighbor_isbns)
+            self.pos_to_neighbor = np.full(len(catalog), -1, dtype=np.int64)
+            valid = self.neighbor_to_pos >= 0
+            self.pos_to_neighbor[self.neighbor_to_pos[valid]] = np.flatnonzero(valid)
+
+    @classmethod
+    def from_paths(cls, base_dir=BASE_DIR, embedding_model=None, load_model=True, open_history=True,
+                   model_name=None, **kwargs):
+        """Nạp mọi thành phần từ thư mục dự án (như dashboard).
+        load_model/open_history=False: để trống model/lịch sử, gán sau (serve.py nạp chúng trong worker sau khi fork)"""
+        if model_name is None:
+            from vector_ingest import MODEL_NAME
+            model_name = MODEL_NAME
+        csv_path = os.path.join(base_dir, "books_with_emotions.csv")
+        if not os.path.exists(csv_path): csv_path = os.path.join(base_dir, "books_cleaned.csv")
+        df = read_books(csv_path)
+        if "large_thumbnail" not in df.columns:
+            df["large_thumbnail"] = df["thumbnail"]
+
+        index_dir = vector_index_dir_for(os.path.join(base_dir, "chroma_db"))
+        if VectorIndex.read_meta(index_dir) is None:
+            raise FileNotFoundError(f"Chưa có vector index '{index_dir}'. Hãy chạy vector_index.py (hoặc reset_all_data.py).")
+        index = VectorIndex.load(index_dir)
+
+        if embedding_model is None and load_model:
+            from vector_ingest import make_embedding_model
+            embedding_model = make_embedding_model(model_name, cache_dir=os.path.join(base_dir, "embedding_cache"))
+
+        neighbors = None
+        neighbors_dir = os.path.join(base_dir, NEIGHBORS_DIR)
+        ratings_path = os.path.join(base_dir, "ratings.csv")
+        if NeighborTable.matches_ratings(neighbors_dir, ratings_path) or \
+                (NeighborTable.exists(neighbors_dir) and not os.path.exists(ratings_path)):
+            neighbors = NeighborTable.load(neighbors_dir)
+        elif os.path.exists(ratings_path):
+            # Bảng cũ hơn ratings.csv (hoặc chưa có): dựng lại trong bộ nhớ, không gửi gợi ý từ bảng cũ.
+            # In ra stderr: stdout có thể là chính file JSONL kết quả
+            if NeighborTable.exists(neighbors_dir):
+                print(f"⚠️ '{neighbors_dir}' không khớp ratings.csv -> dựng lại bảng láng giềng "
+                      f"(chạy build_cf_neighbors.py để lưu lại)", file=sys.stderr)
+            neighbors = NeighborTable.build(CFEngine.from_csv(ratings_path), k=NEIGHBORS_K)
+
+        history = profiles = None
+        if open_history:
+            history_db = os.path.join(base_dir, "user_history.db")
+            history = get_store(history_db)
+            profiles = get_profiles(profiles_path_for(history_db), model_name)
+        return cls(CatalogIndex(df), index, embedding_model, neighbors, history=history, profiles=profiles, **kwargs)
+
+    # --- CÁC BƯỚC THEO LÔ ---
+
+    def resolve_queries(self, requests):
+        """user_id -> câu query ghép từ các lần tìm gần nhất (chỉ để hiển thị khi đã có hồ sơ); query giữ nguyên"""
+        texts = []
+        for req in requests:
+            if req.get("query"):
+                texts.append(str(req["query"]))
+            elif req.get("user_id") is not None and self.history is not None:
+                texts.append(" ".join(self.history.get_recent_interests(str(req["user_id"]))))
+            else:
+                texts.append("")
+        return texts
+
+    def embed(self, texts):
+        return np.asarray(self.embedding_model.embed_documents(texts), dtype=np.float32)
+
+    def profile_vectors(self, requests):
+        """Chỉ số request (chỉ có user_id) -> vector hồ sơ sở thích tính sẵn"""
+        if self.profiles is None:
+            return {}
+        vectors = {}
+        for i, req in enumerate(requests):
+            if not req.get("query") and req.get("user_id") is not None:
+                vector = self.profiles.get(str(req["user_id"]))
+                if vector is not None:
+                    vectors[i] = vector
+        return vectors
+
+    def query_vectors(self, requests, texts, rows, profile=None):
+        """Vector cho các request tại rows: vector hồ sơ nếu có, còn lại embed theo lô.
+        profile: kết quả profile_vectors(requests) nếu đã tra trước"""
+        if profile is None:
+            profile = self.profile_vectors(requests)
+        to_embed = [i for i in rows if i not in profile]
+        vectors = np.zeros((len(rows), self.index.vectors.shape[1]), dtype=np.float32)
+        if to_embed:
+            embedded = self.embed([texts[i] for i in to_embed])
+            slot = {i: j for j, i in enumerate(rows)}
+            vectors[[slot[i] for i in to_embed]] = embedded
+            if self.record_profiles and self.profiles is not None:
+                for i, vector in zip(to_embed, embedded):
+                    if requests[i].get("query") and requests[i].get("user_id") is not None:
+                        self.profiles.update(str(requests[i]["user_id"]), vector)
+        for j, i in enumerate(rows):
+            if i in profile:
+                vectors[j] = profile[i]
+        return vectors
+
+    def search(self, vectors, categories):
+        """Vector search cho cả lô, gom theo thể loại -> mảng (m, candidates) vị trí catalog, -1 = trống"""
+        out = np.full((len(vectors), self.candidates), -1, dtype=np.int64)
+        cats = np.array([c or "" for c in categories], dtype=object)
+        for cat in pd.unique(cats):
+            rows = np.flatnonzero(cats == cat)
+            prefilter = cat if cat and self.index.has_categories else None
+            found, _ = self.index.search_batch(vectors[rows], self.candidates, prefilter)
+            pos = np.where(found >= 0, self.index_to_pos[np.maximum(found, 0)], -1)
+            out[rows, :pos.shape[1]] = pos
+        return out
+
+    def cf_neighbors(self, seeds):
+        """Láng giềng CF cho ma trận vị trí (m, s) -> (m, s, K) vị trí catalog, -1 = không có"""
+        if self.neighbors is None:
+            return None
+        nrows = np.where(seeds >= 0, self.pos_to_neighbor[np.maximum(seeds, 0)], -1)
+        table = np.asarray(self.neighbors.indices)[np.maximum(nrows, 0)]
+        pos = np.where(table >= 0, self.neighbor_to_pos[np.maximum(table, 0)], -1)
+        pos[nrows < 0] = -1
+        return pos
+
+    def recommend_batch(self, requests):
+        """requests: list dict {"query"|"user_id", "category", "tone", "id"} -> list dict kết quả"""
+        texts = self.resolve_queries(requests)
+        # Request chỉ có user_id: có hồ sơ sở thích là gợi ý được, kể cả khi lịch sử tìm kiếm đã bị xóa
+        profile = self.profile_vectors(requests)
+        has_vector = np.array([bool(t.strip()) or i in profile for i, t in enumerate(texts)], dtype=bool)
+        results = [None] * len(requests)
+
+        rows = np.flatnonzero(has_vector)
+        if len(rows):
+            categories = [requests[i].get("category") if requests[i].get("category") != "All" else None for i in rows]
+            candidates = self.search(self.query_vectors(requests, texts, rows, profile), categories)
+            cf = self.cf_neighbors(candidates[:, :self.ranker.cf_seeds])
+            cat_col = self.catalog.column("simple_categories") if self.catalog.has("simple_categories") else None
+            masks = {}
+
+            for j, i in enumerate(rows):
+                sem = candidates[j][candidates[j] >= 0]
+                cf_lists = []
+                if cf is not None:
+                    for seed_rank in range(min(len(sem), cf.shape[1])):
+                        neigh = cf[j, seed_rank]
+                        neigh = neigh[neigh >= 0]
+                        if len(neigh):
+                            cf_lists.append((seed_rank, neigh))
+                col = TONE_COLUMNS.get(requests[i].get("tone"))
+                tone_values = self.catalog.column(col) if col and self.catalog.has(col) else None
+                allowed = None
+                if categories[j] and cat_col is not None:
+                    if categories[j] not in masks:
+                        masks[categories[j]] = cat_col == categories[j]
+                    allowed = masks[categories[j]]
+                pos, scores = self.ranker.fuse(sem, cf_lists, tone_values, allowed, self.top_k)
+                results[i] = self._result(requests[i], texts[i], pos, scores)
+
+        for i in np.flatnonzero(~has_vector):
+            results[i] = dict(self._result(requests[i], texts[i], [], []), error="không có query/lịch sử")
+        return results
+
+    def _result(self, request, text, pos, scores):
+        # Gather thẳng trên mảng cột (không dựng DataFrame cho từng request)
+        pos = np.asarray(pos, dtype=np.int64)
+        columns = [self.catalog.column(c)[pos] for c in ("isbn13", "title", "authors")]
+        items = [{"isbn13": str(isbn), "title": str(title), "authors": None if pd.isna(authors) else str(authors),
+                  "score": round(float(score), 6)}
+                 for isbn, title, authors, score in zip(*columns, scores)]
+        out = {k: request[k] for k in ("id", "user_id", "category", "tone") if request.get(k) is not None}
+        out.update(query=text, results=items)
+        return out
+
+
+# --- ĐỌC ĐẦU VÀO / CHẠY SONG SONG ---
+
+def read_requests(path, users=False, category=None, tone=None):
+    """Mỗi dòng: JSON object, hoặc text (query, hoặc user_id nếu users=True)"""
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                req = json.loads(line)
+            else:
+                req = {"user_id": line} if users else {"query": line}
+            req.setdefault("category", category)
+            req.setdefault("tone", tone)
+            yield req
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+_worker = None
+
+def _init_worker(kwargs):
+    global _worker
+    try:
+        import torch
+        # Mỗi process một luồng, song song hóa bằng số process
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker = BatchRecommender.from_paths(**kwargs)
+
+def _recommend_in_worker(requests):
+    return _worker.recommend_batch(requests)
+
+def run(requests, out, recommender_kwargs=None, workers=1, batch_size=256, recommender=None):
+    """Ghi kết quả JSONL ra out (file object) theo đúng thứ tự đầu vào. Trả về số request đã xử lý."""
+    recommender_kwargs = recommender_kwargs or {}
+    done = 0
+    start = time.perf_counter()
+
+    def write(results):
+        nonlocal done
+        for r in results:
+            out.write(json.dumps(r, ensure_ascii=False) + "\n")
+        done += len(results)
+        elapsed = time.perf_counter() - start
+        print(f"   -> {done:,} request ({done / elapsed:,.1f} request/giây)", file=sys.stderr)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(recommender_kwargs,)) as pool:
+            # Không dùng pool.map: nó đọc hết đầu vào và tạo future cho mọi lô ngay từ đầu.
+            # Cửa sổ tối đa 2 lô/worker đang chạy; lô đầu xong mới đọc lô tiếp -> RAM không tăng
+            # theo số request, kết quả vẫn ghi đúng thứ tự đầu vào.
+            window = deque()
+            for chunk in _chunks(requests, batch_size):
+                if len(window) >= 2 * workers:
+                    write(window.popleft().result())
+                window.append(pool.submit(_recommend_in_worker, chunk))
+            while window:
+                write(window.popleft().result())
+    else:
+        recommender = recommender or BatchRecommender.from_paths(**recommender_kwargs)
+        for chunk in _chunks(requests, batch_size):
+            write(recommender.recommend_batch(chunk))
+
+    elapsed = time.perf_counter() - start
+    if done:
+        print(f"✅ Xong {done:,} request trong {elapsed:.1f}s ({done / elapsed:,.1f} request/giây)", file=sys.stderr)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gợi ý sách hàng loạt: file query/user_id -> JSONL")
+    parser.add_argument("input", help="File đầu vào ('-' = stdin): text mỗi dòng một query/user_id, hoặc JSONL")
+    parser.add_argument("-o", "--output", default="-", help="File JSONL đầu ra ('-' = stdout)")
+    parser.add_argument("--users", action="store_true", help="Dòng text là user_id (gợi ý theo lịch sử tìm kiếm)")
+    parser.add_argument("--category", default=None)
+    parser.add_argument("--tone", default=None, choices=list(TONE_COLUMNS))
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=100, help="Số ứng viên từ vector search mỗi request")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    requests = read_requests(args.input, args.users, args.category, args.tone)
+    kwargs = {"top_k": args.top_k, "candidates": args.candidates}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run(requests, out, kwargs, workers=args.workers, batch_size=args.batch_size)
+    finally:
+        if out is not sys.stdout:
+            out.close()
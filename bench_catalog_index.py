@@ -0,0 +1,88 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog_index import CatalogIndex
+
+# --- BENCHMARK: GHÉP KẾT QUẢ MỖI REQUEST (isin + reindex + iterrows vs CatalogIndex) ---
+# Mô phỏng phần sau vector search của retrieve_semantic_recommendations + format_results:
+# 100 ISBN ứng viên -> khớp catalogue -> lọc category -> sắp theo tone -> gallery.
+
+CATEGORIES = ["Fiction", "Nonfiction", "Children's Fiction", "Children's Nonfiction"]
+
+def make_books(n, seed):
+    rng = np.random.default_rng(seed)
+    isbns = (9780000000000 + rng.choice(10_000_000, size=n, replace=False)).astype(str)
+    words = np.array("the a story of magic war love dark family secret journey world life".split())
+    return pd.DataFrame({
+        "isbn13": isbns,
+        "title": [f"Book {i}" for i in range(n)],
+        "authors": np.where(rng.random(n) < 0.05, None, "Some Author"),
+        "description": [" ".join(rng.choice(words, 40)) for _ in range(n)],
+        "large_thumbnail": np.where(rng.random(n) < 0.1, None, "http://books.example/cover.jpg"),
+        "simple_categories": rng.choice(CATEGORIES, n),
+        "joy": rng.random(n).astype(np.float32),
+    })
+
+def legacy_request(books, isbn_list, category, col):
+    book_recs = books[books["isbn13"].isin(isbn_list)].copy()
+    if not book_recs.empty:
+        book_recs = book_recs.set_index("isbn13")
+        valid_isbns = [i for i in isbn_list if i in book_recs.index]
+        book_recs = book_recs.reindex(valid_isbns).reset_index()
+    book_recs = book_recs[book_recs["simple_categories"] == category]
+    book_recs = book_recs.sort_values(by=col, ascending=False)
+    results = []
+    for _, row in book_recs.iterrows():
+        title = str(row['title'])
+        authors = str(row['authors']) if pd.notna(row['authors']) else "Unknown"
+        desc = str(row.get('description', ''))
+        trunc_desc = " ".join(desc.split()[:20]) + "..."
+        caption = f"{title}\nby {authors}\n\n{trunc_desc}"
+        img = row["large_thumbnail"] if pd.notna(row["large_thumbnail"]) else "cover-not-found.jpg"
+        results.append((img, caption))
+    return results
+
+def indexed_request(catalog, isbn_list, category, col):
+    pos = catalog.positions(isbn_list)
+    pos = pos[catalog.column("simple_categories")[pos] == category]
+    pos = pos[np.argsort(-catalog.column(col)[pos], kind="stable")]
+    return catalog.gallery(catalog.frame(pos).index.to_numpy())
+
+def time_per_request(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for isbn_list in queries:
+            fn(isbn_list)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ ghép kết quả mỗi request")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5_000, 50_000, 200_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'Số sách':>10} | {'dựng index':>10} | {'cũ (ms/req)':>11} | {'mới (ms/req)':>12} | nhanh hơn")
+    for n in args.sizes:
+        books = make_books(n, args.seed)
+        start = time.perf_counter()
+        catalog = CatalogIndex(books)
+        build_s = time.perf_counter() - start
+        queries = [books["isbn13"].to_numpy()[rng.choice(n, args.top_k, replace=False)].tolist()
+                   for _ in range(args.queries)]
+
+        # Kiểm tra hai cách cho cùng kết quả
+        assert legacy_request(books, queries[0], "Fiction", "joy") == indexed_request(catalog, queries[0], "Fiction", "joy")
+
+        repeat = 5 if n <= 50_000 else 1
+        old_ms = time_per_request(lambda q: legacy_request(books, q, "Fiction", "joy"), queries, repeat)
+        new_ms = time_per_request(lambda q: indexed_request(catalog, q, "Fiction", "joy"), queries, repeat * 10)
+        print(f"{n:>10,} | {build_s:>9.2f}s | {old_ms:>11.2f} | {new_ms:>12.3f} | x{old_ms / new_ms:,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog_store import build_catalog, catalog_dir_for, load_catalog, normalize_isbn_series
+from metrics import peak_rss_mb
+
+# --- BENCHMARK: NẠP CATALOGUE (CSV + regex vs CATALOGUE NHỊ PHÂN) ---
+# Mỗi cách nạp chạy trong process riêng để đo peak RSS độc lập.
+
+CATEGORIES = ["Fiction", "Nonfiction", "Children's Fiction", "Children's Nonfiction"]
+
+def make_csv(path, n, seed):
+    rng = np.random.default_rng(seed)
+    words = np.array("the a story of magic war love dark family secret journey world life".split())
+    authors = [f"Author {i}" for i in range(max(1, n // 5))]
+    df = pd.DataFrame({
+        "isbn13": (9780000000000 + rng.choice(10_000_000, size=n, replace=False)).astype(np.float64),
+        "title": [f"Book {i}" for i in range(n)],
+        "authors": rng.choice(authors, n),
+        "categories": rng.choice(["Fiction", "Juvenile Fiction", "History", "Biography"], n),
+        "thumbnail": [f"http://books.example/{i}.jpg" for i in range(n)],
+        "description": [" ".join(rng.choice(words, 60)) for _ in range(n)],
+        "published_year": rng.integers(1900, 2024, n).astype(np.float64),
+        "average_rating": rng.uniform(1, 5, n),
+        "simple_categories": rng.choice(CATEGORIES, n),
+    })
+    for emo in ['joy', 'sadness', 'fear', 'anger', 'surprise']:
+        df[emo] = rng.random(n)
+    df.to_csv(path, index=False)
+
+def run_variant(variant, path):
+    base = peak_rss_mb()
+    start = time.perf_counter()
+    if variant == "csv":
+        books = pd.read_csv(path, dtype={'isbn13': str})
+        books["isbn13"] = normalize_isbn_series(books["isbn13"])
+    else:
+        books = load_catalog(catalog_dir_for(path))
+    # Một thao tác điển hình của dashboard để chắc dữ liệu đã thực sự được chạm tới
+    books["joy"].to_numpy().argsort()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"variant": variant, "rows": len(books), "load_s": elapsed,
+                      "peak_rss_mb": peak_rss_mb(), "base_rss_mb": base}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nạp catalogue sách: CSV vs nhị phân")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5_000, 100_000, 500_000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--variant", choices=["csv", "catalog"], help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.csv)
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "books_with_emotions.csv")
+            make_csv(path, n, args.seed)
+            start = time.perf_counter()
+            build_catalog(path)
+            build_s = time.perf_counter() - start
+            print(f"📚 {n:,} sách (CSV {os.path.getsize(path) / 1024 ** 2:,.1f} MB, build catalogue {build_s:.2f}s)")
+            for variant in ("csv", "catalog"):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant, "--csv", path],
+                                     capture_output=True, text=True, cwd=here)
+                if out.returncode != 0:
+                    print(f"   ❌ {variant}: {out.stderr.strip().splitlines()[-1]}")
+                    continue
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"   {variant:>8}: nạp {r['load_s'] * 1000:8.1f} ms | peak RSS {r['peak_rss_mb']:,.0f} MB "
+                      f"(+{r['peak_rss_mb'] - r['base_rss_mb']:,.0f} MB)")
+
+if __name__ == "__main__":
+    main()
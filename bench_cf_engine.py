@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import peak_rss_mb
+
+# --- BENCHMARK: DỰNG MÔ HÌNH CF (PIVOT DÀY vs CSR THƯA) ---
+# Mỗi cách chạy trong một process riêng để đo peak RSS độc lập.
+
+def make_ratings(path, n_books, n_users, n_ratings, seed):
+    rng = np.random.default_rng(seed)
+    isbns = 9780000000000 + rng.choice(10_000_000, size=n_books, replace=False)
+    df = pd.DataFrame({
+        "user_id": rng.integers(1, n_users + 1, size=n_ratings),
+        "isbn": isbns[rng.integers(0, n_books, size=n_ratings)],
+        "rating": rng.integers(1, 6, size=n_ratings),
+    })
+    df.to_csv(path, index=False)
+
+
+def build_dense(path):
+    # Đúng như init_collaborative_filtering cũ
+    from scipy.sparse import csr_matrix
+    from sklearn.neighbors import NearestNeighbors
+    df_ratings = pd.read_csv(path, dtype={'isbn': str, 'user_id': str})
+    df_ratings['isbn'] = df_ratings['isbn'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    book_pivot = df_ratings.pivot_table(index='isbn', columns='user_id', values='rating').fillna(0)
+    model = NearestNeighbors(metric='cosine', algorithm='brute')
+    model.fit(csr_matrix(book_pivot.values))
+    return len(book_pivot)
+
+
+def build_sparse(path):
+    from cf_engine import CFEngine
+    return len(CFEngine.from_csv(path))
+
+
+def run_variant(variant, path):
+    import sklearn.neighbors  # noqa: F401  (tính import vào RSS nền, không vào thời gian dựng)
+    base = peak_rss_mb()
+    start = time.perf_counter()
+    n = build_dense(path) if variant == "dense" else build_sparse(path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"variant": variant, "books": n, "build_s": elapsed,
+                      "peak_rss_mb": peak_rss_mb(), "base_rss_mb": base}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dựng mô hình Collaborative Filtering")
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--ratings", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dense-limit-gb", type=float, default=2.0,
+                        help="Bỏ qua cách pivot dày nếu ma trận dày vượt quá ngưỡng này")
+    parser.add_argument("--variant", choices=["dense", "sparse"], help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.csv)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ratings.csv")
+        print(f"⏳ Sinh {args.ratings:,} rating ({args.books:,} sách x {args.users:,} user)...")
+        make_ratings(path, args.books, args.users, args.ratings, args.seed)
+
+        dense_gb = args.books * args.users * 8 / 1024 ** 3
+        variants = ["sparse"]
+        if dense_gb <= args.dense_limit_gb:
+            variants.insert(0, "dense")
+        else:
+            print(f"⚠️ Bỏ qua pivot dày: cần ~{dense_gb:,.1f} GB chỉ cho ma trận dày.")
+
+        for variant in variants:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant, "--csv", path],
+                                 capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if out.returncode != 0:
+                print(f"❌ {variant}: {out.stderr.strip().splitlines()[-1]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"   {variant:>6}: {r['books']:,} sách | dựng {r['build_s']:.2f}s | "
+                  f"peak RSS {r['peak_rss_mb']:,.0f} MB (+{r['peak_rss_mb'] - r['base_rss_mb']:,.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench_suite import git_commit, summarize
+from cover_cache import CoverCache
+from cover_standin import make_cover, start_standin
+from metrics import peak_rss_mb
+
+# --- BENCHMARK: CACHE ẢNH BÌA (CHẠY OFFLINE VỚI HOST GIẢ LẬP) ---
+# Host ảnh bìa giả lập (cover_standin.py) chạy trong process, có độ trễ + tỉ lệ 404 / ảnh "không có bìa".
+#   prefetch   tải trước cả catalogue (lạnh): ảnh/s, số 404, số file sau khử trùng, MB gốc vs đã thu nhỏ
+#   reopen     mở lại cache từ đĩa (khởi động lại app): thời gian nạp chỉ mục, hit rate ngay lần đầu
+#   gallery    cache trống, giới hạn dung lượng nhỏ: mỗi request là một gallery gồm các sách chọn theo
+#              phân phối Zipf (sách phổ biến lặp lại nhiều), đo thời gian resolve + hit rate theo từng nửa,
+#              số ảnh bị xóa (LRU) và dung lượng không vượt giới hạn (--recent-s thu nhỏ thời gian giữ
+#              ảnh vừa trả cho gallery, vì cả benchmark chỉ chạy vài giây)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def cover_urls(base_url, n):
+    """URL kiểu Google Books cho n sách"""
+    return [f"{base_url}/books/content?id=B{i:07d}&printsec=frontcover&img=1&zoom=1" for i in range(n)]
+
+
+def dir_mb(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 2**20
+
+
+def bench_prefetch(cache_dir, urls, placeholder, args):
+    cache = CoverCache(cache_dir, placeholder=placeholder, workers=args.workers, max_pending=args.workers * 4)
+    start = time.perf_counter()
+    queued = cache.prefetch(urls, block=True)
+    cache.wait()
+    elapsed = time.perf_counter() - start
+    s = cache.stats()
+    cache.close()
+    # Cỡ ảnh gốc ước lượng trên mẫu (ảnh giả lập được sinh lại giống hệt)
+    sample = [u.split("://", 1)[1].split("/", 1)[1] for u in urls[:50]]
+    original_kb = float(np.mean([len(make_cover("/" + p)) for p in sample])) / 1024
+    resized_kb = s["bytes"] / max(s["files"], 1) / 1024
+    return {"queued": queued, "seconds": elapsed, "per_s": queued / elapsed if elapsed else 0.0,
+            "fetched": s["fetched"], "not_found": s["not_found"], "errors": s["errors"], "files": s["files"],
+            "original_kb": original_kb, "resized_kb": resized_kb, "disk_mb": dir_mb(cache_dir)}
+
+
+def bench_reopen(cache_dir, urls, placeholder):
+    start = time.perf_counter()
+    cache = CoverCache(cache_dir, placeholder=placeholder)
+    load_s = time.perf_counter() - start
+    cache.gallery([(u, "") for u in urls])
+    s = cache.stats()
+    cache.close()
+    return {"load_s": load_s, "hit_rate": s["hit_rate"], "placeholders": s["placeholders"]}
+
+
+def bench_gallery(cache_dir, urls, placeholder, args):
+    cache = CoverCache(cache_dir, placeholder=placeholder, max_bytes=args.max_mb * 2**20, workers=args.workers,
+                       recent_s=args.recent_s)
+    rng = np.random.default_rng(args.seed)
+    halves, latencies = [], []
+    start = time.perf_counter()
+    for half in range(2):
+        before = cache.stats()
+        for _ in range(args.requests // 2):
+            ranks = np.unique(rng.zipf(args.zipf, args.gallery_size * 2) - 1)
+            ranks = ranks[ranks < len(urls)][:args.gallery_size]
+            items = [(urls[r], "") for r in ranks]
+            t0 = time.perf_counter()
+            cache.gallery(items)
+            latencies.append(time.perf_counter() - t0)
+            # Người dùng đọc kết quả giữa hai lần tìm -> thread nền kịp tải một phần
+            time.sleep(args.think_ms / 1000)
+        after = cache.stats()
+        hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+        halves.append(hits / (hits + misses) if hits + misses else 0.0)
+    total = time.perf_counter() - start
+    cache.wait()
+    s = cache.stats()
+    cache.close()
+    result = summarize(latencies, total)
+    result.update(hit_rate_first_half=halves[0], hit_rate_second_half=halves[1], hit_rate=s["hit_rate"],
+                  evicted=s["evicted"], dropped=s["dropped"], cache_mb=s["bytes"] / 2**20, max_mb=args.max_mb,
+                  disk_mb=dir_mb(cache_dir))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache ảnh bìa với host ảnh giả lập (offline)")
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Độ trễ mỗi ảnh của host giả lập")
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--blank-rate", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--gallery-size", type=int, default=40)
+    parser.add_argument("--zipf", type=float, default=1.3, help="Tham số phân phối độ phổ biến của sách")
+    parser.add_argument("--think-ms", type=float, default=20.0)
+    parser.add_argument("--max-mb", type=float, default=1.0, help="Giới hạn cache cho phần gallery (ép LRU)")
+    parser.add_argument("--recent-s", type=float, default=0.5,
+                        help="Ảnh vừa trả cho gallery được giữ bao lâu trước khi được xóa (app mặc định 60s; "
+                             "benchmark chạy nhanh nên để nhỏ)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="bench_covers.json")
+    args = parser.parse_args()
+
+    server = start_standin(latency_ms=args.latency_ms, missing_rate=args.missing_rate, blank_rate=args.blank_rate)
+    urls = cover_urls(server.base_url, args.books)
+    placeholder = os.path.join(BASE_DIR, "cover-not-found.jpg")
+    print(f"🌐 Host giả lập {server.base_url}: {args.books:,} sách, trễ {args.latency_ms:.0f} ms, "
+          f"{args.missing_rate:.0%} không có bìa, {args.blank_rate:.0%} ảnh trống")
+
+    report = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "cpu_count": os.cpu_count(), "config": vars(args)}}
+    work_dir = tempfile.mkdtemp(prefix="bench_covers_")
+    try:
+        print("   -> prefetch cả catalogue...")
+        report["prefetch"] = bench_prefetch(os.path.join(work_dir, "full"), urls, placeholder, args)
+        report["reopen"] = bench_reopen(os.path.join(work_dir, "full"), urls, placeholder)
+        print("   -> gallery (Zipf)...")
+        report["gallery"] = bench_gallery(os.path.join(work_dir, "lru"), urls, placeholder, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    p, r, g = report["prefetch"], report["reopen"], report["gallery"]
+    print(f"\n   prefetch: {p['queued']:,} URL trong {p['seconds']:.1f}s ({p['per_s']:.0f}/s), "
+          f"{p['not_found']:,} không có bìa, {p['errors']:,} lỗi, {p['files']:,} file")
+    print(f"             ảnh gốc ~{p['original_kb']:.0f} KB -> đã thu nhỏ ~{p['resized_kb']:.1f} KB, "
+          f"đĩa {p['disk_mb']:.1f} MB")
+    print(f"   reopen:   nạp chỉ mục {r['load_s'] * 1000:.0f} ms, hit rate {r['hit_rate']:.1%}")
+    print(f"   gallery:  p50 {g['p50_ms']:.2f} ms, p95 {g['p95_ms']:.2f} ms / {args.gallery_size} ảnh; "
+          f"hit rate {g['hit_rate_first_half']:.1%} -> {g['hit_rate_second_half']:.1%}; "
+          f"xóa {g['evicted']:,}, cache {g['cache_mb']:.1f}/{g['max_mb']:.1f} MB")
+    print(f"   peak RSS: {report['peak_rss_mb']:.0f} MB")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n📝 Đã ghi kết quả '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from history_store import HistoryStore, SCHEMA
+
+# --- BENCHMARK: LỊCH SỬ TÌM KIẾM (TRƯỚC / SAU) ---
+# Mỗi "lượt tìm" giống recommend_books: log_search + get_recent_interests + get_history_logs.
+# "Trước" = connect-per-call + commit đồng bộ như bản cũ của gradio-dashboard.py.
+
+class LegacyHistory:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path)
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+    def log_search(self, user_id, query, top_book):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("INSERT INTO search_history (user_id, query, top_book) VALUES (?, ?, ?)", (user_id, query, top_book))
+        conn.commit()
+        conn.close()
+
+    def get_recent_interests(self, user_id, current_query, limit=3):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        rows = conn.execute("SELECT DISTINCT query FROM search_history WHERE user_id = ? AND query != ? ORDER BY id DESC LIMIT ?",
+                            (user_id, current_query, limit)).fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def get_history_logs(self, user_id="guest", limit=10):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        rows = conn.execute("SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp), top_book FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                            (user_id, limit)).fetchall()
+        conn.close()
+        return rows
+
+    def close(self):
+        pass
+
+
+def run(store, threads, searches, users):
+    errors = []
+    # Chỉ kiểm tra được khi mỗi thread có user riêng
+    own_user = users >= threads
+
+    def worker(tid):
+        user_id = f"user_{tid % users}"
+        try:
+            for i in range(searches):
+                query = f"query {tid}-{i}"
+                store.log_search(user_id, query, f"Book {tid}-{i}")
+                store.get_recent_interests(user_id, query)
+                logs = store.get_history_logs(user_id)
+                # Read-your-writes: bảng lịch sử phải có ngay sách vừa log
+                if own_user and (not logs or logs[0][1] != f"Book {tid}-{i}"):
+                    errors.append((tid, i))
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for t in pool: t.start()
+    for t in pool: t.join()
+    elapsed = time.perf_counter() - start
+    store.close()
+    return threads * searches / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lịch sử tìm kiếm: connect-per-call vs HistoryStore")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--searches", type=int, default=200, help="Số lượt tìm mỗi thread")
+    parser.add_argument("--users", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"⏱️ {args.threads} thread x {args.searches} lượt tìm, {args.users} user")
+    with tempfile.TemporaryDirectory() as tmp:
+        before, err_before = run(LegacyHistory(os.path.join(tmp, "legacy.db")), args.threads, args.searches, args.users)
+        after, err_after = run(HistoryStore(os.path.join(tmp, "pooled.db")), args.threads, args.searches, args.users)
+
+    print(f"   Trước (connect-per-call): {before:,.0f} lượt tìm/giây")
+    print(f"   Sau   (HistoryStore):     {after:,.0f} lượt tìm/giây  (x{after / before:.1f})")
+    if err_before or err_after:
+        print(f"   ❌ Lỗi read-your-writes: trước={len(err_before)}, sau={len(err_after)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_suite import git_commit, summarize
+from metrics import peak_rss_mb
+from vector_index import HNSW_FILE, VectorIndex, vector_index_dir_for
+from vector_quant import codes_path
+
+# --- BENCHMARK: CHẾ ĐỘ NÉN VECTOR (RECALL / BỘ NHỚ / QPS) ---
+# Dựng bản int8 và pq từ chính index hiện tại (chroma_db.vectors/), rồi với mỗi chế độ + hệ số rerank
+# chạy một process con riêng (bắt đầu với page cache lạnh): tìm từng query một (như dashboard),
+# đo QPS/p50/p95, recall@k so với tìm chính xác, và bộ nhớ:
+#   hot MB     dữ liệu phải quét mỗi query -> phải nằm trong RAM để chạy nhanh
+#   rerank KB  số byte float32 đọc thêm mỗi query để tính lại điểm chính xác
+#   anon/file  RSS riêng của process / page memory-map đang map. Page của các hàng đã rerank cộng dồn
+#              qua nhiều query nhưng là page sạch, kernel thu hồi được khi thiếu RAM.
+# Query = vector của sách ngẫu nhiên + nhiễu (không cần model). --synthetic N: dữ liệu giả lập theo cụm
+# để ước lượng ở quy mô hàng triệu sách.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RERANK = {"exact": [1], "hnsw": [1], "int8": [1, 4], "pq": [4, 10, 20]}
+
+
+def source_index(args, work_dir):
+    """Thư mục index gốc (exact): index hiện tại, hoặc dựng từ dữ liệu giả lập"""
+    if not args.synthetic:
+        return args.index_dir
+    from bench_vector_index import make_vectors
+    vectors, isbns = make_vectors(args.synthetic, args.dim, args.clusters, args.seed)
+    out = os.path.join(work_dir, "exact")
+    VectorIndex.build(out, isbns, vectors, hnsw=False)
+    return out
+
+
+def build_variant(src, out_dir, kind):
+    """Dựng lại index với mã nén từ vector + ISBN + thể loại của index gốc (không embed lại)"""
+    index = VectorIndex.load(src, backend="exact")
+    meta = VectorIndex.read_meta(src)
+    categories = None
+    if index.category_codes is not None:
+        names = np.array(list(index.categories) + [""], dtype=object)
+        categories = names[np.asarray(index.category_codes)]  # -1 -> ""
+    start = time.perf_counter()
+    VectorIndex.build(out_dir, index.isbns, index.vectors, categories, meta.get("model"),
+                      meta.get("source_version"), hnsw=False, quantization=kind)
+    return time.perf_counter() - start
+
+
+def rss_breakdown_mb():
+    """RSS hiện tại tách phần bộ nhớ riêng (anon) và page file memory-map đang được map (file)"""
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    out["rss_" + line[3:7].lower() + "_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return out
+
+
+def hot_mb(directory, backend):
+    name = {"exact": "vectors.npy", "hnsw": HNSW_FILE}.get(backend)
+    path = os.path.join(directory, name) if name else codes_path(directory, backend)
+    return os.path.getsize(path) / 2**20
+
+
+def drop_page_cache(directory):
+    """Bỏ các file của index khỏi page cache -> process con bắt đầu lạnh như máy phục vụ không đủ RAM
+    cho toàn bộ ma trận, RssFile chỉ còn những page thật sự được đọc"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for name in os.listdir(directory):
+        fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def disk_mb(directory):
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 2**20
+
+
+# --- PROCESS CON: ĐO MỘT CHẾ ĐỘ ---
+
+def phase_run(directory, backend, rerank, work_dir, k, warmup):
+    start = time.perf_counter()
+    index = VectorIndex.load(directory, backend=backend, rerank=rerank)
+    load_s = time.perf_counter() - start
+    queries = np.load(os.path.join(work_dir, "queries.npy"))
+    truth = np.load(os.path.join(work_dir, "truth.npy"))
+    for q in queries[:warmup]:
+        index.search_batch(q, k)
+    found, latencies = [], []
+    start = time.perf_counter()
+    for q in queries:
+        t0 = time.perf_counter()
+        rows, _ = index.search_batch(q, k)
+        latencies.append(time.perf_counter() - t0)
+        found.append(rows[0])
+    result = summarize(latencies, time.perf_counter() - start)
+    result["recall"] = float(np.mean([len(np.intersect1d(f[f >= 0], t)) / len(t) for f, t in zip(found, truth)]))
+    reranked = k * rerank if backend in ("int8", "pq") else 0
+    result.update(load_s=load_s, peak_rss_mb=peak_rss_mb(), hot_mb=hot_mb(directory, backend),
+                  rerank_kb=reranked * index.vectors.shape[1] * 4 / 1024,
+                  disk_mb=disk_mb(directory), **rss_breakdown_mb())
+    return result
+
+
+def run_child(directory, backend, rerank, work_dir, args):
+    result_path = os.path.join(work_dir, f"{backend}.{rerank}.result.json")
+    drop_page_cache(directory)
+    cmd = [sys.executable, os.path.abspath(__file__), "--phase", "run", "--dir", directory, "--backend", backend,
+           "--rerank", str(rerank), "--work-dir", work_dir, "--result", result_path,
+           "--k", str(args.k), "--warmup", str(args.warmup)]
+    out = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+    if out.returncode != 0:
+        lines = (out.stderr or "").strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Báo cáo recall / bộ nhớ / QPS của các chế độ nén vector")
+    parser.add_argument("--index-dir", default=vector_index_dir_for(os.path.join(BASE_DIR, "chroma_db")),
+                        help="Index hiện tại (mặc định chroma_db.vectors/ của dự án)")
+    parser.add_argument("--synthetic", type=int, help="Dùng N vector giả lập theo cụm thay cho index hiện tại")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=["exact", "hnsw", "int8", "pq"])
+    parser.add_argument("--rerank", type=int, nargs="+", help="Hệ số rerank cho int8/pq (mặc định theo chế độ)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.3, help="Độ nhiễu thêm vào vector sách để làm query")
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="bench_quantization.json")
+    parser.add_argument("--phase", choices=["run"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        result = phase_run(args.dir, args.backend, args.rerank[0], args.work_dir, args.k, args.warmup)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+        return
+
+    if not args.synthetic and VectorIndex.read_meta(args.index_dir) is None:
+        print(f"❌ Không có vector index ở '{args.index_dir}'. Chạy vector_index.py (hoặc dùng --synthetic N).")
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        src = source_index(args, work_dir)
+        exact = VectorIndex.load(src, backend="exact")
+        n, dim = exact.vectors.shape
+        print(f"📐 {n:,} vector x {dim} chiều ({src}), {args.queries} query, k={args.k}")
+
+        # Query + kết quả chính xác dùng chung cho mọi chế độ (hàng giữ nguyên thứ tự khi dựng lại)
+        rng = np.random.default_rng(args.seed)
+        rows = rng.integers(0, n, args.queries)
+        queries = np.asarray(exact.vectors[np.sort(rows)]) + args.noise * rng.standard_normal((args.queries, dim))
+        queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+        truth, _ = exact.search_batch(queries, args.k)
+        np.save(os.path.join(work_dir, "queries.npy"), queries)
+        np.save(os.path.join(work_dir, "truth.npy"), truth)
+        del exact
+
+        report = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                           "cpu_count": os.cpu_count(), "count": int(n), "dim": int(dim),
+                           "config": {k: v for k, v in vars(args).items()
+                                      if k not in ("phase", "dir", "backend", "work_dir", "result")}},
+                  "results": []}
+        for mode in args.modes:
+            directory = src
+            if mode == "hnsw" and not os.path.exists(os.path.join(src, HNSW_FILE)):
+                print(f"   ⚠️ Index chưa có {HNSW_FILE} -> bỏ qua hnsw")
+                continue
+            if mode in ("int8", "pq"):
+                directory = os.path.join(work_dir, mode)
+                print(f"   -> dựng {mode}...")
+                build_s = build_variant(src, directory, mode)
+            for rerank in (args.rerank if args.rerank and mode in ("int8", "pq") else DEFAULT_RERANK[mode]):
+                r = run_child(directory, mode, rerank, work_dir, args)
+                r.update(mode=mode, rerank=rerank)
+                if mode in ("int8", "pq"):
+                    r["build_s"] = build_s
+                report["results"].append(r)
+
+    # anon = bộ nhớ riêng của process, file = page memory-map đang map (dùng chung, kernel thu hồi được)
+    print(f"\n   {'chế độ':<8} {'rerank':>6} {'recall':>7} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'hot MB':>8} {'rerank KB':>9} {'anon MB':>8} {'file MB':>8} {'đĩa MB':>8}")
+    for r in report["results"]:
+        if "error" in r:
+            print(f"   {r['mode']:<8} {r['rerank']:>6} ❌ {r['error']}")
+            continue
+        print(f"   {r['mode']:<8} {r['rerank']:>6} {r['recall']:7.3f} {r['throughput_per_s']:8.1f} {r['p50_ms']:8.2f} "
+              f"{r['p95_ms']:8.2f} {r['hot_mb']:8.1f} {r['rerank_kb']:9.0f} {r.get('rss_anon_mb', 0):8.0f} "
+              f"{r.get('rss_file_mb', 0):8.0f} {r['disk_mb']:8.0f}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n📝 Đã ghi kết quả '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
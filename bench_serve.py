@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+
+# --- BENCHMARK: CHẾ ĐỘ PHỤC VỤ NHIỀU PROCESS (serve.py) ---
+# Với mỗi số worker: chạy serve.py trên thư mục dữ liệu, bắn request HTTP song song,
+# đo request/giây + p50/p95, và bộ nhớ (RSS/PSS) của front + worker lấy từ /health.
+# PSS chia đều page dùng chung cho các process -> tổng PSS tăng ít khi thêm worker nghĩa là
+# catalogue/index không bị nhân bản.
+# Dữ liệu giả lập: python bench_suite.py --sizes 20000 --keep-data /tmp/bookrec (rồi --data-dir /tmp/bookrec/20000)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_json(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        return json.load(r)
+
+
+def wait_ready(url, proc, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"serve.py đã thoát (mã {proc.returncode})")
+        try:
+            return get_json(url + "/health", timeout=2)
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("serve.py chưa sẵn sàng")
+
+
+def load_queries(data_dir, n):
+    path = os.path.join(data_dir, "queries.jsonl")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f]
+    else:
+        queries = [{"query": q} for q in ("magic school", "war history", "space adventure", "love story")]
+    return [queries[i % len(queries)] for i in range(n)]
+
+
+def run_load(url, queries, concurrency):
+    def call(q):
+        params = {k: v for k, v in q.items() if v and v != "All"}
+        t0 = time.perf_counter()
+        get_json(f"{url}/recommend?{urlencode(params)}")
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = np.array(list(pool.map(call, queries))) * 1000
+    elapsed = time.perf_counter() - start
+    return {"requests": len(queries), "throughput_per_s": len(queries) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serve.py theo số worker")
+    parser.add_argument("--data-dir", default=BASE_DIR)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--model", default="hash")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}"
+    queries = load_queries(args.data_dir, args.requests)
+    report = []
+    print(f"{'worker':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'RSS tổng MB':>12} {'PSS tổng MB':>12}")
+    for workers in args.workers:
+        proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "serve.py"), "--data-dir", args.data_dir,
+                                 "--workers", str(workers), "--batch-size", str(args.batch_size),
+                                 "--model", args.model, "--port", str(args.port)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        try:
+            wait_ready(url, proc)
+            run_load(url, queries[:min(100, len(queries))], args.concurrency)  # làm nóng
+            r = run_load(url, queries, args.concurrency)
+            health = get_json(url + "/health")
+            procs = [health["front"]] + health["workers"]
+            r.update(workers=workers, rss_mb=sum(p.get("rss_mb", 0) for p in procs),
+                     pss_mb=sum(p.get("pss_mb", 0) for p in procs), processes=procs)
+        except Exception as e:
+            print(f"❌ {workers} worker: {e}")
+            continue
+        finally:
+            proc.terminate()
+            proc.wait(30)
+        report.append(r)
+        print(f"{workers:>6} {r['throughput_per_s']:9.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+              f"{r['rss_mb']:12,.0f} {r['pss_mb']:12,.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "cpu_count": os.cpu_count(), "results": report}, f, indent=1)
+        print(f"📝 Đã ghi kết quả '{args.json}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import peak_rss_mb
+
+# --- BENCHMARK END-TO-END (DỮ LIỆU GIẢ LẬP, CHẠY OFFLINE TRÊN CPU) ---
+# Với mỗi quy mô catalogue:
+#   1. sinh books_with_emotions.csv + ratings.csv + bộ query giả lập (có seed, tái lập được)
+#   2. build: catalogue nhị phân, embedding (HashEmbeddings thay model thật), vector index, bảng láng giềng CF
+#   3. serve: import gradio-dashboard.py trên thư mục dữ liệu đó (BOOKREC_DATA_DIR, EMBEDDING_MODEL=hash)
+#      -> thời gian khởi động, rồi latency từng hàm: retrieve_semantic_recommendations,
+#      retrieve_hybrid_recommendations, get_collaborative_recs, recommend_books
+#      Cache ảnh bìa tắt (COVER_CACHE=0): URL ảnh giả lập trỏ tới books.google.com, không tải mạng
+#      nền trong lúc đo (benchmark riêng của cache ảnh bìa: bench_covers.py, chạy với cover_standin.py)
+# Mỗi bước build/serve chạy trong process riêng (peak RSS độc lập, startup "lạnh").
+# Kết quả: throughput, p50/p95/p99, peak RSS -> file JSON (kèm commit git) để so giữa các commit:
+#   python bench_suite.py --sizes 2000 20000 -o bench_results.json
+#   python bench_suite.py --baseline bench_results.json -o bench_new.json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_PATH = os.path.join(BASE_DIR, "gradio-dashboard.py")
+
+# Từ vựng theo thể loại -> query cùng thể loại gần nhau dưới HashEmbeddings
+VOCAB = {
+    "Fiction": "love war family secret journey murder kingdom betrayal ghost detective island summer "
+               "letters sister village revenge heart storm crown night river".split(),
+    "Nonfiction": "history science economy leadership biology health memoir politics empire brain "
+                  "climate habit money war ocean strategy energy physics culture design".split(),
+    "Children's Fiction": "dragon wizard puppy friendship school magic forest bunny pirate princess "
+                          "monster adventure bear train unicorn robot treehouse giant cat moon".split(),
+    "Children's Nonfiction": "dinosaur planet animal space insect volcano weather body ocean machine "
+                             "numbers alphabet colors shapes farm bird rocket tree river rainbow".split(),
+}
+COMMON_WORDS = "story world life time people new old great little first last best true dark".split()
+TONES = ["All", "Happy", "Sad", "Suspenseful", "Surprising", "Angry"]
+EMOTION_COLUMNS = ["anger", "disgust", "fear", "joy", "sadness", "surprise", "neutral"]
+BENCHMARKS = ["retrieve_semantic_recommendations", "retrieve_hybrid_recommendations",
+              "get_collaborative_recs", "recommend_books"]
+
+
+def summarize(latencies, total_s):
+    lat = np.asarray(latencies, dtype=np.float64) * 1000
+    if not len(lat):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+    return {"count": int(len(lat)), "throughput_per_s": len(lat) / total_s if total_s else 0.0,
+            "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(lat.max())}
+
+
+def measure(fn, items, warmup=()):
+    """Gọi fn(*item) tuần tự, trả về p50/p95/p99 (ms) + throughput"""
+    for item in warmup:
+        fn(*item)
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(*item)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+# --- 1. SINH DỮ LIỆU ---
+
+def make_dataset(data_dir, n_books, n_queries, ratings_per_book, seed):
+    """Ghi books_with_emotions.csv, ratings.csv, queries.jsonl vào data_dir"""
+    from rating_generator import RatingGenerator
+
+    rng = np.random.default_rng(seed)
+    names = list(VOCAB)
+    cats = rng.integers(0, len(names), n_books)
+    isbns = (9780000000000 + np.arange(n_books, dtype=np.int64)).astype(str)
+
+    vocab = [np.array(VOCAB[c]) for c in names]
+    common = np.array(COMMON_WORDS)
+    topic = np.stack([vocab[c][rng.integers(0, len(vocab[c]), 8)] for c in cats])
+    extra = common[rng.integers(0, len(common), (n_books, 4))]
+    descriptions = [" ".join(w) for w in np.concatenate([topic, extra], axis=1)]
+    titles = [f"{a.title()} {b.title()} {i}" for i, (a, b) in enumerate(topic[:, :2])]
+    thumbs = [f"http://books.google.com/books/content?id=b{i}&printsec=frontcover&img=1&zoom=1" for i in range(n_books)]
+
+    books = pd.DataFrame({
+        "isbn13": isbns, "title": titles,
+        "authors": [f"Author {k}" for k in rng.integers(0, max(n_books // 5, 1), n_books)],
+        "simple_categories": np.array(names)[cats], "description": descriptions,
+        "thumbnail": thumbs, "large_thumbnail": [t + "&fife=w800" for t in thumbs],
+    })
+    books["tagged_description"] = books["isbn13"] + " " + books["description"]
+    for col in EMOTION_COLUMNS:
+        books[col] = rng.random(n_books).round(4)
+    books.to_csv(os.path.join(data_dir, "books_with_emotions.csv"), index=False)
+
+    # Nhà phê bình phủ 5% sách + rating ngẫu nhiên (cho CF có dữ liệu thưa như thật)
+    RatingGenerator(isbns, n_ratings=ratings_per_book * n_books, user_min=10, user_max=max(100, n_books // 2),
+                    critics=2, critic_coverage=0.05, zipf=1.0, seed=seed) \
+        .write_csv(os.path.join(data_dir, "ratings.csv"))
+
+    # Query khác nhau từng đôi một (không trúng cache kết quả của dashboard)
+    py_rng = random.Random(seed)
+    queries = {}
+    while len(queries) < n_queries:
+        c = py_rng.choice(names)
+        text = " ".join(py_rng.sample(VOCAB[c], 3) + [py_rng.choice(COMMON_WORDS)])
+        if text not in queries:
+            queries[text] = {"query": text,
+                             "category": c if py_rng.random() < 0.5 else "All",
+                             "tone": py_rng.choice(TONES)}
+    with open(os.path.join(data_dir, "queries.jsonl"), "w", encoding="utf-8") as f:
+        for q in queries.values():
+            f.write(json.dumps(q) + "\n")
+
+
+# --- 2. BUILD (PROCESS RIÊNG) ---
+
+def phase_build(data_dir, model_name):
+    from catalog_store import build_catalog, read_books
+    from cf_engine import CFEngine, NeighborTable, NEIGHBORS_DIR, NEIGHBORS_K
+    from vector_index import VectorIndex, vector_index_dir_for
+    from vector_ingest import make_embedding_model
+
+    csv_path = os.path.join(data_dir, "books_with_emotions.csv")
+    steps = {}
+
+    def step(name, rows, fn):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        steps[name] = {"seconds": elapsed, "rows": rows, "rows_per_s": rows / elapsed if elapsed else 0.0}
+        return out
+
+    n = len(pd.read_csv(csv_path, usecols=["isbn13"]))
+    step("catalogue", n, lambda: build_catalog(csv_path))
+    books = read_books(csv_path)
+
+    model = make_embedding_model(model_name)
+    texts = books["tagged_description"].tolist()
+    vectors = step("embed", n, lambda: np.concatenate(
+        [np.asarray(model.embed_documents(texts[i:i + 4096]), dtype=np.float32) for i in range(0, n, 4096)]))
+    # source_version=None: không có chroma_db/ -> dashboard coi index là mới
+    step("vector_index", n, lambda: VectorIndex.build(
+        vector_index_dir_for(os.path.join(data_dir, "chroma_db")), books["isbn13"].astype(np.uint64),
+        vectors, books["simple_categories"], model_name=model_name))
+
+    ratings_path = os.path.join(data_dir, "ratings.csv")
+    n_ratings = sum(1 for _ in open(ratings_path, encoding="utf-8")) - 1
+    engine = step("cf_engine", n_ratings, lambda: CFEngine.from_csv(ratings_path))
+    step("cf_neighbors", len(engine),
+         lambda: NeighborTable.build(engine, k=NEIGHBORS_K).save(os.path.join(data_dir, NEIGHBORS_DIR),
+                                                                 ratings_path))
+    return {"steps": steps, "total_s": sum(s["seconds"] for s in steps.values()), "peak_rss_mb": peak_rss_mb()}
+
+
+# --- 3. SERVE: CÁC HÀM CỦA DASHBOARD (PROCESS RIÊNG) ---
+
+def phase_serve(data_dir, model_name, n_queries, warmup):
+    os.environ["BOOKREC_DATA_DIR"] = data_dir
+    os.environ["EMBEDDING_MODEL"] = model_name
+    os.environ["COVER_CACHE"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "quiet")
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("dashboard", DASHBOARD_PATH)
+    dash = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dash)
+    import_s = time.perf_counter() - start
+    ready = all(dash.startup.wait(name) for name in dash.startup.stages)
+    startup = {"import_s": import_s, "ready_s": time.perf_counter() - start, "ready": ready,
+               "stages": dash.startup.status()["stages"],
+               "rss_after_startup_mb": peak_rss_mb()}
+    if not ready:
+        return {"startup": startup, "error": "dashboard chưa sẵn sàng"}
+
+    with open(os.path.join(data_dir, "queries.jsonl"), encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f]
+    # Mỗi hàm một lát query riêng: hàm sau không trúng cache của hàm trước
+    per = n_queries + warmup
+    slices = [[(q["query"], q["category"], q["tone"]) for q in queries[i * per:(i + 1) * per]] for i in range(3)]
+    isbns = dash.catalog.column("isbn13")
+    picks = np.random.default_rng(0).integers(0, len(isbns), per)
+    cf_items = [(str(isbns[i]),) for i in picks]
+
+    results = {}
+    for name, items in (("retrieve_semantic_recommendations", slices[0]),
+                        ("retrieve_hybrid_recommendations", slices[1]),
+                        ("get_collaborative_recs", cf_items),
+                        ("recommend_books", slices[2])):
+        results[name] = measure(getattr(dash, name), items[warmup:], items[:warmup])
+    return {"startup": startup, "functions": results, "stage_ms": dash.metrics.stage_summary(),
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def run_phase(phase, data_dir, args):
+    """Chạy một phase trong process con, trả về dict kết quả (hoặc {"error": ...})"""
+    result_path = os.path.join(data_dir, f"{phase}.result.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--phase", phase, "--data-dir", data_dir,
+           "--result", result_path, "--model", args.model, "--queries", str(args.queries), "--warmup", str(args.warmup)]
+    out = subprocess.run(cmd, cwd=BASE_DIR, capture_output=not args.verbose, text=True)
+    if out.returncode != 0:
+        lines = (out.stderr or "").strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {out.returncode}"}
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def missing_dashboard_deps():
+    return [m for m in ("gradio", "dotenv") if importlib.util.find_spec(m) is None]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- BÁO CÁO ---
+
+def print_report(report):
+    for size, r in report["results"].items():
+        print(f"\n📊 {int(size):,} sách")
+        build = r.get("build", {})
+        if "error" in build:
+            print(f"   ❌ build: {build['error']}")
+        else:
+            for name, s in build["steps"].items():
+                print(f"   build {name:<14} {s['seconds']:8.2f}s  {s['rows_per_s']:12,.0f} dòng/s")
+            print(f"   build peak RSS {build['peak_rss_mb']:,.0f} MB")
+        serve = r.get("serve", {})
+        if "skipped" in serve or "error" in serve:
+            print(f"   ⚠️ serve: {serve.get('skipped') or serve.get('error')}")
+            continue
+        st = serve["startup"]
+        print(f"   startup: import {st['import_s']:.2f}s, sẵn sàng sau {st['ready_s']:.2f}s")
+        print(f"   {'hàm':<36} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, s in serve["functions"].items():
+            print(f"   {name:<36} {s['throughput_per_s']:8.1f} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} {s['p99_ms']:8.2f}")
+        print(f"   serve peak RSS {serve['peak_rss_mb']:,.0f} MB")
+
+
+def compare(report, baseline):
+    """In tỉ lệ mới/cũ của p50, p95, throughput và peak RSS cho những quy mô có ở cả hai file"""
+    print(f"\n🔁 So với {baseline['meta'].get('commit')} (tỉ lệ mới/cũ, p50/p95 < 1 là nhanh hơn):")
+    for size, r in report["results"].items():
+        old = baseline["results"].get(size)
+        if not old:
+            continue
+        new_f = r.get("serve", {}).get("functions", {})
+        old_f = old.get("serve", {}).get("functions", {})
+        for name in BENCHMARKS:
+            if name in new_f and name in old_f:
+                a, b = new_f[name], old_f[name]
+                print(f"   {int(size):>8,} {name:<36} p50 x{a['p50_ms'] / b['p50_ms']:.2f}  "
+                      f"p95 x{a['p95_ms'] / b['p95_ms']:.2f}  req/s x{a['throughput_per_s'] / b['throughput_per_s']:.2f}")
+        for phase in ("build", "serve"):
+            a, b = r.get(phase, {}).get("peak_rss_mb"), old.get(phase, {}).get("peak_rss_mb")
+            if a and b:
+                print(f"   {int(size):>8,} {phase + ' peak RSS':<36} x{a / b:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end của hệ gợi ý trên dữ liệu giả lập")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000], help="Số sách của từng quy mô")
+    parser.add_argument("--queries", type=int, default=200, help="Số lần gọi đo cho mỗi hàm")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--ratings-per-book", type=int, default=10)
+    parser.add_argument("--model", default="hash", help="Model embedding (mặc định embedding hash chạy offline)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--keep-data", help="Giữ dữ liệu giả lập trong thư mục này thay vì thư mục tạm")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log của các process con")
+    parser.add_argument("--phase", choices=["build", "serve"], help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        if args.phase == "build":
+            result = phase_build(args.data_dir, args.model)
+        else:
+            result = phase_serve(args.data_dir, args.model, args.queries, args.warmup)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+        return
+
+    report = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                       "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                       "config": {k: v for k, v in vars(args).items() if k not in ("phase", "data_dir", "result")}},
+              "results": {}}
+    missing = missing_dashboard_deps()
+    if missing:
+        print(f"⚠️ Thiếu {', '.join(missing)} -> chỉ đo build, bỏ qua phần dashboard (pip install -r requirements.txt)")
+
+    for n_books in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = os.path.join(args.keep_data, str(n_books)) if args.keep_data else tmp
+            os.makedirs(data_dir, exist_ok=True)
+            print(f"⏳ {n_books:,} sách: sinh dữ liệu...")
+            start = time.perf_counter()
+            # 3 lát query cho 3 hàm tìm kiếm
+            make_dataset(data_dir, n_books, 3 * (args.queries + args.warmup), args.ratings_per_book, args.seed)
+            result = {"generate_s": time.perf_counter() - start}
+
+            print("   -> build...")
+            result["build"] = run_phase("build", data_dir, args)
+            if missing:
+                result["serve"] = {"skipped": f"thiếu {', '.join(missing)}"}
+            elif "error" in result["build"]:
+                result["serve"] = {"skipped": "build lỗi"}
+            else:
+                print("   -> serve (dashboard)...")
+                result["serve"] = run_phase("serve", data_dir, args)
+            report["results"][str(n_books)] = result
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f"\n📝 Đã ghi kết quả '{args.output}'")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from vector_index import VectorIndex
+
+# --- BENCHMARK: VECTOR SEARCH (CHROMA QUA LANGCHAIN vs INDEX LOCAL MEMORY-MAP) ---
+# Vector giả lập theo cụm (giống embedding thật hơn nhiễu Gauss thuần), query = vector sách + nhiễu.
+# Recall@k tính so với kết quả chính xác bằng numpy; QPS đo từng query một (như dashboard).
+# Đường Chroma chạy đúng như dashboard: Chroma.similarity_search_by_vector -> Document -> ISBN.
+
+def make_vectors(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    isbns = 9780000000000 + np.arange(n, dtype=np.uint64)
+    return vectors, isbns
+
+def make_queries(vectors, n_queries, seed):
+    rng = np.random.default_rng(seed + 1)
+    q = vectors[rng.integers(0, len(vectors), n_queries)] + 0.3 * rng.standard_normal((n_queries, vectors.shape[1]))
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype(np.float32)
+
+def ground_truth(vectors, queries, k):
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall(found_isbns, truth_rows, isbns):
+    truth = isbns[truth_rows].astype(str)
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found_isbns, truth)]))
+
+def run(name, search, queries, truth, isbns):
+    search(queries[0])  # làm nóng
+    start = time.perf_counter()
+    found = [search(q) for q in queries]
+    elapsed = time.perf_counter() - start
+    print(f"   {name:<14} {len(queries) / elapsed:10,.0f} QPS   recall@k {recall(found, truth, isbns):.3f}")
+
+def chroma_search(tmp, vectors, isbns, k):
+    """Nạp vector vào Chroma như reset_all_data.py; trả hàm tìm kiếm như dashboard (None nếu thiếu thư viện)"""
+    try:
+        import chromadb
+        from langchain_chroma import Chroma
+    except ImportError:
+        return None
+    persist_dir = os.path.join(tmp, "chroma_db")
+    client = chromadb.PersistentClient(path=persist_dir)
+    collection = client.get_or_create_collection("langchain")
+    ids = isbns.astype(str).tolist()
+    step = getattr(client, "max_batch_size", 5000) or 5000
+    for i in range(0, len(ids), step):
+        collection.upsert(ids=ids[i:i+step], embeddings=vectors[i:i+step].tolist(),
+                          documents=[f"{isbn} Book" for isbn in ids[i:i+step]],
+                          metadatas=[{"isbn": isbn} for isbn in ids[i:i+step]])
+    db = Chroma(client=client, collection_name="langchain")
+
+    def search(q):
+        docs = db.similarity_search_by_vector(q.tolist(), k=k)
+        return [str(d.metadata.get("isbn")) for d in docs]
+    return search
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector search: Chroma vs index local")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--ef", type=int, default=200, help="ef của HNSW lúc tìm kiếm")
+    parser.add_argument("--no-chroma", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        vectors, isbns = make_vectors(n, args.dim, args.clusters, args.seed)
+        queries = make_queries(vectors, args.queries, args.seed)
+        truth = ground_truth(vectors, queries, args.k)
+        print(f"📐 {n:,} vector x {args.dim} chiều, {args.queries} query, k={args.k}")
+        with tempfile.TemporaryDirectory() as tmp:
+            index_dir = os.path.join(tmp, "chroma_db.vectors")
+            start = time.perf_counter()
+            try:
+                VectorIndex.build(index_dir, isbns, vectors, hnsw=True)
+                has_hnsw = True
+            except ImportError:
+                VectorIndex.build(index_dir, isbns, vectors, hnsw=False)
+                has_hnsw = False
+            print(f"   (dựng index local {time.perf_counter() - start:.1f}s)")
+
+            exact = VectorIndex.load(index_dir, backend="exact")
+            run("local exact", lambda q: exact.search(q, args.k), queries, truth, isbns)
+            if has_hnsw:
+                hnsw = VectorIndex.load(index_dir, backend="hnsw", ef=args.ef)
+                run("local hnsw", lambda q: hnsw.search(q, args.k), queries, truth, isbns)
+            else:
+                print("   ⚠️ Không có hnswlib -> bỏ qua HNSW local")
+
+            search = None if args.no_chroma else chroma_search(tmp, vectors, isbns, args.k)
+            if search is not None:
+                run("chroma", search, queries, truth, isbns)
+            elif not args.no_chroma:
+                print("   ⚠️ Chưa cài chromadb/langchain_chroma -> bỏ qua đường Chroma")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import argparse
+import os
+import time
+
+from cf_engine import CFEngine, NeighborTable, NEIGHBORS_DIR, NEIGHBORS_K
+
+# --- CẤU HÌNH ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RATINGS_FILE = os.path.join(BASE_DIR, "ratings.csv")
+OUTPUT_DIR = os.path.join(BASE_DIR, NEIGHBORS_DIR)
+
+def build_neighbors(ratings_file=RATINGS_FILE, output_dir=OUTPUT_DIR, k=NEIGHBORS_K, block_size=None):
+    """Tính sẵn top-K láng giềng cho mọi ISBN và lưu vào cf_neighbors/"""
+    if not os.path.exists(ratings_file):
+        print(f"❌ Không tìm thấy {ratings_file}")
+        return None
+
+    print(f"🔗 Đang tính trước {k} láng giềng CF cho mọi cuốn sách...")
+    start = time.perf_counter()
+    engine = CFEngine.from_csv(ratings_file)
+    table = NeighborTable.build(engine, k=k, block_size=block_size)
+    table.save(output_dir, ratings_path=ratings_file)
+    print(f"✅ Đã lưu bảng láng giềng ({len(table)} sách x {k}) vào '{output_dir}' "
+          f"sau {time.perf_counter() - start:.2f}s")
+    return table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tính trước bảng top-K láng giềng cho Collaborative Filtering")
+    parser.add_argument("--ratings", default=RATINGS_FILE)
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("-k", type=int, default=NEIGHBORS_K)
+    parser.add_argument("--block-size", type=int, default=None)
+    args = parser.parse_args()
+    build_neighbors(args.ratings, args.output, args.k, args.block_size)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# --- CHỈ MỤC CATALOGUE THEO isbn13 ---
+# Dựng một lần lúc khởi động: vị trí theo ISBN, caption đã cắt sẵn, đường dẫn ảnh bìa,
+# các cột số dạng mảng NumPy. Mỗi request chỉ còn là một phép gather theo vị trí,
+# không isin quét cả bảng, không set_index/reindex, không iterrows.
+
+PLACEHOLDER = "cover-not-found.jpg"
+
+def make_caption(title, authors, description):
+    """Caption hiển thị trong Gallery: tên sách, tác giả, 20 từ đầu của mô tả"""
+    authors = str(authors) if pd.notna(authors) else "Unknown"
+    trunc_desc = " ".join(str(description).split()[:20]) + "..."
+    return f"{title}\nby {authors}\n\n{trunc_desc}"
+
+
+class CatalogIndex:
+    def __init__(self, books, placeholder=PLACEHOLDER):
+        # ISBN trùng thì giữ dòng đầu; index của DataFrame = vị trí (0..n-1)
+        self.books = books.drop_duplicates("isbn13").reset_index(drop=True)
+        self._index = pd.Index(self.books["isbn13"])
+        self._columns = {}
+
+        descriptions = self.books["description"] if "description" in self.books.columns else [""] * len(self.books)
+        self.captions = np.array([make_caption(t, a, d) for t, a, d in
+                                  zip(self.books["title"].astype(str), self.books["authors"], descriptions)], dtype=object)
+        thumbs = self.books["large_thumbnail"]
+        self.thumbnails = thumbs.where(thumbs.notna(), placeholder).to_numpy(dtype=object)
+
+    def __len__(self):
+        return len(self.books)
+
+    def has(self, name):
+        return name in self.books.columns
+
+    def column(self, name):
+        """Cột dạng mảng NumPy (cache lại sau lần đầu)"""
+        arr = self._columns.get(name)
+        if arr is None:
+            arr = self._columns[name] = self.books[name].to_numpy()
+        return arr
+
+    def positions(self, isbns):
+        """ISBN -> vị trí trong catalogue, giữ nguyên thứ tự, bỏ ISBN không có"""
+        if len(isbns) == 0:
+            return np.zeros(0, dtype=np.int64)
+        pos = self._index.get_indexer(isbns)
+        return pos[pos >= 0]
+
+    def indexer(self, isbns):
+        """ISBN -> vị trí, giữ nguyên độ dài (-1 = không có trong catalogue)"""
+        return self._index.get_indexer(isbns)
+
+    def frame(self, pos):
+        return self.books.iloc[pos]
+
+    def gallery(self, pos):
+        """Danh sách (ảnh, caption) cho gr.Gallery"""
+        pos = np.asarray(pos, dtype=np.int64)
+        return list(zip(self.thumbnails[pos], self.captions[pos]))
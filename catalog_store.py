@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# --- CATALOGUE DẠNG NHỊ PHÂN THEO CỘT (THAY CHO PARSE CSV LẶP LẠI) ---
+# books_with_emotions.csv bị parse bằng pandas ở mọi script, script nào cũng lặp lại
+# regex bỏ ".0" của isbn13. Bước build này chạy một lần, ghi ra thư mục <tên csv>.catalog/:
+#   isbn13.npy                 uint64 đã chuẩn hóa
+#   <cột số>.npy               float32 (cảm xúc, điểm...) / int64
+#   <cột chuỗi>.codes.npy      mã int32 (-1 = NaN) trỏ vào bảng chuỗi đã intern (không trùng)
+#   <cột chuỗi>.text + .offsets.npy   các chuỗi duy nhất nối liền + vị trí ký tự bắt đầu/kết thúc
+#   schema.json                danh sách cột, số dòng, kích thước/mtime của CSV nguồn
+# Mọi file .npy được mở bằng memory-map, nên nạp gần như tức thời.
+
+SCHEMA_FILE = "schema.json"
+
+def catalog_dir_for(csv_path):
+    """books_with_emotions.csv -> books_with_emotions.catalog/"""
+    return os.path.splitext(csv_path)[0] + ".catalog"
+
+def normalize_isbn_series(series):
+    """Chuẩn hóa isbn13 về chuỗi số (bỏ .0) - bản duy nhất của regex này"""
+    return series.astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+
+def _source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return {"path": os.path.basename(csv_path), "size": st.st_size, "mtime": st.st_mtime}
+
+def _write_strings(out_dir, name, values):
+    codes, uniques = pd.factorize(values)
+    uniques = [str(u) for u in uniques]
+    lengths = np.fromiter((len(u) for u in uniques), dtype=np.int64, count=len(uniques))
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(out_dir, f"{name}.codes.npy"), codes.astype(np.int32))
+    np.save(os.path.join(out_dir, f"{name}.offsets.npy"), offsets)
+    with open(os.path.join(out_dir, f"{name}.text"), "w", encoding="utf-8", newline="") as f:
+        f.write("".join(uniques))
+
+def build_catalog(csv_path, out_dir=None):
+    """Đọc CSV một lần, ghi catalogue nhị phân. Trả về thư mục đã ghi."""
+    out_dir = out_dir or catalog_dir_for(csv_path)
+    df = pd.read_csv(csv_path, dtype={'isbn13': str}, encoding="utf-8")
+    if "isbn13" in df.columns:
+        df["isbn13"] = normalize_isbn_series(df["isbn13"])
+
+    # Ghi ra thư mục tạm rồi đổi tên, tránh để lại catalogue dở dang
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if name == "isbn13":
+            numeric = pd.to_numeric(col, errors="coerce")
+            if numeric.notna().all() and (numeric >= 0).all():
+                np.save(os.path.join(tmp_dir, "isbn13.npy"), numeric.to_numpy(dtype=np.uint64))
+                columns.append({"name": name, "kind": "isbn"})
+                continue
+        if pd.api.types.is_bool_dtype(col) or pd.api.types.is_integer_dtype(col):
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), col.to_numpy(dtype=np.int64))
+            columns.append({"name": name, "kind": "int"})
+        elif pd.api.types.is_float_dtype(col):
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), col.to_numpy(dtype=np.float32))
+            columns.append({"name": name, "kind": "float"})
+        else:
+            # simple_categories, authors... lặp rất nhiều -> intern
+            _write_strings(tmp_dir, name, col)
+            columns.append({"name": name, "kind": "string"})
+
+    schema = {"rows": len(df), "columns": columns, "source": _source_stamp(csv_path)}
+    with open(os.path.join(tmp_dir, SCHEMA_FILE), "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=1)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+def _load_schema(cat_dir):
+    try:
+        with open(os.path.join(cat_dir, SCHEMA_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def is_fresh(csv_path, cat_dir=None):
+    """Catalogue tồn tại và được build từ đúng phiên bản CSV hiện tại"""
+    schema = _load_schema(cat_dir or catalog_dir_for(csv_path))
+    if schema is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    stamp = _source_stamp(csv_path)
+    return schema["source"]["size"] == stamp["size"] and schema["source"]["mtime"] == stamp["mtime"]
+
+def _load_strings(cat_dir, name):
+    codes = np.load(os.path.join(cat_dir, f"{name}.codes.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(cat_dir, f"{name}.offsets.npy"), mmap_mode="r")
+    with open(os.path.join(cat_dir, f"{name}.text"), encoding="utf-8", newline="") as f:
+        text = f.read()
+    # Mỗi chuỗi duy nhất chỉ tạo một object; các dòng trùng dùng chung object đó
+    uniques = np.empty(len(offsets), dtype=object)
+    uniques[:-1] = [text[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    uniques[-1] = np.nan  # mã -1 -> NaN
+    return uniques[codes]
+
+def load_catalog(cat_dir, columns=None):
+    """Nạp catalogue thành DataFrame. isbn13 trả về dạng chuỗi như code cũ vẫn dùng."""
+    schema = _load_schema(cat_dir)
+    if schema is None:
+        raise FileNotFoundError(f"Không có catalogue ở {cat_dir}")
+    data = {}
+    for col in schema["columns"]:
+        name = col["name"]
+        if columns is not None and name not in columns:
+            continue
+        if col["kind"] == "isbn":
+            data[name] = np.load(os.path.join(cat_dir, "isbn13.npy"), mmap_mode="r").astype(str).astype(object)
+        elif col["kind"] == "string":
+            data[name] = _load_strings(cat_dir, name)
+        else:
+            data[name] = np.load(os.path.join(cat_dir, f"{name}.npy"), mmap_mode="r")
+    return pd.DataFrame(data, copy=False)
+
+def load_isbns(cat_dir):
+    """Chỉ cột isbn13 dạng uint64 (memory-map, không tạo chuỗi)"""
+    return np.load(os.path.join(cat_dir, "isbn13.npy"), mmap_mode="r")
+
+def read_books(csv_path, columns=None):
+    """Điểm vào chung cho mọi script: dùng catalogue nhị phân, build lại nếu thiếu hoặc CSV đã đổi"""
+    cat_dir = catalog_dir_for(csv_path)
+    if not is_fresh(csv_path, cat_dir):
+        print(f"🗂️ Đang build catalogue nhị phân từ '{os.path.basename(csv_path)}'...")
+        build_catalog(csv_path, cat_dir)
+    return load_catalog(cat_dir, columns)
+
+if __name__ == "__main__":
+    import sys
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, "books_with_emotions.csv")
+    out = build_catalog(csv_file)
+    print(f"✅ Đã build catalogue '{out}' ({_load_schema(out)['rows']} dòng)")
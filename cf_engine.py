@@ -0,0 +1,218 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, diags
+
+# --- COLLABORATIVE FILTERING TRÊN MA TRẬN THƯA ---
+# Bản cũ: pivot_table(...).fillna(0) tạo ma trận dày ISBN x user rồi mới đổi sang CSR,
+# nên bộ nhớ tăng theo (số sách x số user). Ở đây CSR được dựng thẳng từ các cột
+# của ratings.csv bằng mã số nguyên (factorize), không bao giờ có ma trận dày.
+# Thứ tự hàng/cột và cách gộp rating trùng (trung bình) giống hệt pivot_table,
+# nên kết quả gợi ý không đổi.
+
+def normalize_isbn(isbn):
+    """Chuẩn hóa ISBN về chuỗi số (bỏ .0 nếu có)"""
+    return str(isbn).replace(".0", "").strip()
+
+
+def _row_of(isbns, isbn):
+    pos = int(np.searchsorted(isbns, isbn))
+    if pos < len(isbns) and isbns[pos] == isbn:
+        return pos
+    return -1
+
+
+def rating_matrices(df_ratings):
+    """DataFrame (user_id, isbn, rating) -> (isbns, users, tổng rating, số rating).
+    isbns/users đã sắp xếp; hai ma trận CSR (sách x user) có cùng cấu trúc (rating trùng được cộng dồn)."""
+    isbn = df_ratings['isbn'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    rating = pd.to_numeric(df_ratings['rating'], errors='coerce').to_numpy(dtype=np.float64)
+
+    # sort=True -> thứ tự hàng/cột giống index/columns của pivot_table
+    row, isbns = pd.factorize(isbn, sort=True)
+    col, users = pd.factorize(df_ratings['user_id'], sort=True)
+
+    # pivot_table bỏ qua khóa NaN và giá trị NaN
+    valid = (row >= 0) & (col >= 0) & ~np.isnan(rating)
+    row, col, rating = row[valid], col[valid], rating[valid]
+
+    shape = (len(isbns), len(users))
+    total = coo_matrix((rating, (row, col)), shape=shape).tocsr()
+    count = coo_matrix((np.ones_like(rating), (row, col)), shape=shape).tocsr()
+    return np.asarray(isbns, dtype=str), np.asarray(users), total, count
+
+
+class CFEngine:
+    def __init__(self, matrix, isbns):
+        # matrix: CSR (số sách x số user), isbns: mảng ISBN đã sắp xếp tương ứng từng hàng
+        self.matrix = matrix
+        self.isbns = isbns
+        # Import muộn: dashboard dùng NeighborTable thì không cần nạp sklearn
+        from sklearn.neighbors import NearestNeighbors
+        self.model = NearestNeighbors(metric='cosine', algorithm='brute')
+        self.model.fit(matrix)
+
+    @classmethod
+    def from_frame(cls, df_ratings):
+        """Dựng CSR từ DataFrame có các cột user_id, isbn, rating"""
+        isbns, _, total, count = rating_matrices(df_ratings)
+        # Rating trùng (cùng user, cùng sách) được lấy trung bình như aggfunc='mean'
+        total.data /= count.data
+        total.eliminate_zeros()
+        return cls(total, isbns)
+
+    @classmethod
+    def from_csv(cls, ratings_path):
+        """Đọc ratings.csv (chỉ 3 cột cần dùng) rồi dựng engine"""
+        df_ratings = pd.read_csv(ratings_path, usecols=['user_id', 'isbn', 'rating'],
+                                 dtype={'isbn': str, 'user_id': str})
+        return cls.from_frame(df_ratings)
+
+    def __len__(self):
+        return len(self.isbns)
+
+    def row_of(self, isbn):
+        """Tìm hàng của ISBN bằng tìm kiếm nhị phân trên mảng đã sắp xếp (-1 nếu không có)"""
+        return _row_of(self.isbns, isbn)
+
+    def recommend(self, isbn, n_neighbors=6):
+        """Trả về các ISBN gần nhất (bỏ chính nó), giống get_collaborative_recs cũ"""
+        query_index = self.row_of(normalize_isbn(isbn))
+        if query_index < 0:
+            return []
+        distances, indices = self.model.kneighbors(self.matrix[query_index], n_neighbors=n_neighbors)
+        return [str(self.isbns[idx]) for idx in indices.flatten()[1:]]
+
+
+# --- BẢNG K LÁNG GIỀNG TÍNH SẴN (OFFLINE) ---
+# Mỗi lần gợi ý chỉ dùng vài láng giềng gần nhất, nên tính trước cho mọi ISBN bằng
+# tích ma trận thưa theo khối rồi lưu thành các file .npy. Dashboard memory-map các
+# file này lúc khởi động: một lần tra cứu = đọc K phần tử, không gọi sklearn.
+# Mọi nơi dựng bảng (build_cf_neighbors.py, OnlineCF, batch_recommend.py, benchmark) dùng chung
+# NEIGHBORS_K -> bảng dựng offline dùng lại được cho CF trực tuyến, số gợi ý không đổi theo chế độ.
+# source.json ghi bảng được dựng từ ratings.csv nào (cỡ + mtime) và tới sự kiện rating nào.
+
+NEIGHBORS_DIR = "cf_neighbors"
+NEIGHBORS_K = 10
+SOURCE_FILE = "source.json"
+
+
+def source_stamp(path):
+    """Dấu vết file nguồn (cỡ + mtime) để biết dữ liệu dẫn xuất còn khớp không"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+class NeighborTable:
+    def __init__(self, isbns, indices, scores):
+        # isbns: (n,) đã sắp xếp; indices: (n, K) int32, -1 = không có; scores: (n, K) cosine float32
+        self.isbns = isbns
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def k(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return len(self.isbns)
+
+    @classmethod
+    def build(cls, engine, k=NEIGHBORS_K, block_size=None):
+        """Tính top-K láng giềng cosine cho mọi sách, theo từng khối hàng"""
+        return cls.from_matrix(engine.matrix, engine.isbns, k, block_size)
+
+    @classmethod
+    def from_matrix(cls, matrix, isbns, k=NEIGHBORS_K, block_size=None):
+        """Như build, nhận thẳng ma trận (sách x user) và mảng ISBN tương ứng"""
+        matrix = matrix.astype(np.float32)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix = (diags(1.0 / norms) @ matrix).tocsr()
+        matrix_t = matrix.T.tocsc()
+
+        n = matrix.shape[0]
+        k_eff = min(k, n - 1)
+        # Giới hạn mỗi khối dày ~64M phần tử float32 (~256 MB)
+        if block_size is None:
+            block_size = max(1, min(4096, 64_000_000 // max(n, 1)))
+
+        indices = np.full((n, k), -1, dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+        if k_eff <= 0:
+            return cls(isbns, indices, scores)
+
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            sims = (matrix[start:stop] @ matrix_t).toarray()
+            rows = np.arange(stop - start)
+            # Bỏ chính nó
+            sims[rows, np.arange(start, stop)] = -np.inf
+
+            top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+            top_sims = sims[rows[:, None], top]
+            # Sắp xếp giảm dần theo độ tương đồng, hòa thì theo chỉ số hàng (ổn định)
+            order = np.lexsort((top, -top_sims), axis=1)
+            indices[start:stop, :k_eff] = np.take_along_axis(top, order, axis=1)
+            scores[start:stop, :k_eff] = np.take_along_axis(top_sims, order, axis=1)
+
+        return cls(isbns, indices, scores)
+
+    def save(self, directory, ratings_path=None, last_event_id=0):
+        """ratings_path: ratings.csv dùng để dựng bảng (ghi vào source.json);
+        last_event_id: bảng đã gộp các sự kiện rating trực tuyến tới id này"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "isbns.npy"), self.isbns)
+        np.save(os.path.join(directory, "indices.npy"), self.indices)
+        np.save(os.path.join(directory, "scores.npy"), self.scores)
+        source_path = os.path.join(directory, SOURCE_FILE)
+        if ratings_path is None:
+            # Không rõ nguồn -> bỏ dấu vết cũ (nếu có) thay vì để nó sai
+            if os.path.exists(source_path):
+                os.remove(source_path)
+            return
+        with open(source_path, "w", encoding="utf-8") as f:
+            json.dump({"k": self.k, "ratings_source": source_stamp(ratings_path),
+                       "last_event_id": last_event_id}, f, indent=1)
+
+    @staticmethod
+    def read_source(directory):
+        try:
+            with open(os.path.join(directory, SOURCE_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map bảng láng giềng (không đọc cả file vào RAM)"""
+        return cls(np.load(os.path.join(directory, "isbns.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, "indices.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, "scores.npy"), mmap_mode="r"))
+
+    @staticmethod
+    def exists(directory):
+        return all(os.path.exists(os.path.join(directory, name)) for name in ("isbns.npy", "indices.npy", "scores.npy"))
+
+    @classmethod
+    def matches_ratings(cls, directory, ratings_path):
+        """Bảng ở directory được dựng từ đúng ratings.csv hiện tại (có thể đã gộp thêm rating trực tuyến)"""
+        if not cls.exists(directory) or not os.path.exists(ratings_path):
+            return False
+        source = cls.read_source(directory)
+        if source is None:
+            # Bảng dựng trước khi có source.json: chỉ so thời điểm
+            return os.path.getmtime(os.path.join(directory, "indices.npy")) >= os.path.getmtime(ratings_path)
+        return source.get("ratings_source") == source_stamp(ratings_path)
+
+    def recommend(self, isbn, n_neighbors=6):
+        """Cùng quy ước với CFEngine.recommend: n_neighbors tính cả chính cuốn sách"""
+        row = _row_of(self.isbns, normalize_isbn(isbn))
+        if row < 0:
+            return []
+        neighbors = self.indices[row, :max(n_neighbors - 1, 0)]
+        return [str(self.isbns[idx]) for idx in neighbors if idx >= 0]
@@ -0,0 +1,553 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix, load_npz, save_npz
+
+import metrics
+from cf_engine import NeighborTable, NEIGHBORS_DIR, NEIGHBORS_K, normalize_isbn, rating_matrices, source_stamp
+
+# --- CF CẬP NHẬT TRỰC TUYẾN (RATING MỚI -> LÁNG GIỀNG MỚI TRONG VÀI GIÂY) ---
+# Trước đây CF đóng băng lúc khởi động: thêm rating = sửa ratings.csv rồi khởi động lại app.
+#   * RatingLog: bảng rating_events trong ratings_log.db (SQLite, WAL), ai cũng append được
+#     (API /ratings của dashboard, CLI bên dưới, script khác).
+#   * OnlineCF: snapshot (tổng/số rating dạng CSR + bảng top-K láng giềng) + lớp phủ các hàng
+#     đã đổi. Mỗi lô sự kiện mới chỉ tính lại vector của sách bị rating, láng giềng của chính
+#     chúng, rồi vá danh sách láng giềng của các sách khác có độ tương đồng với chúng thay đổi
+#     (tăng -> chèn/sắp lại; giảm khỏi top-K -> tính lại riêng hàng đó). Kết quả giống dựng lại
+#     toàn bộ, nhưng không quét mọi cặp sách.
+#   * Thread cập nhật tính trên bản làm việc riêng của bảng láng giềng; recommend() đọc bản phục vụ.
+#     Xong mỗi lô mới chép các hàng đã đổi sang bản phục vụ (khóa chỉ trong lúc chép), nên request
+#     không phải chờ trong lúc tính lại láng giềng. Đổi lại bảng top-K tốn gấp đôi RAM (n x K x 8 byte).
+#   * compact(): gộp lớp phủ vào snapshot mới (cf_snapshot/) + ghi cf_neighbors/ để lần khởi động
+#     sau (và serve.py, batch_recommend.py) dùng luôn.
+# Điểm rating trùng (cùng user, cùng sách) vẫn lấy trung bình như CFEngine.
+
+RATINGS_LOG = "ratings_log.db"
+SNAPSHOT_DIR = "cf_snapshot"
+META_FILE = "meta.json"
+
+EVENTS_SCHEMA = '''CREATE TABLE IF NOT EXISTS rating_events
+                   (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, isbn TEXT NOT NULL, rating REAL NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)'''
+
+
+class RatingLog:
+    """Nhật ký sự kiện rating (chỉ append) trong SQLite"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(EVENTS_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append_many(self, events):
+        """events: các (user_id, isbn, rating). Trả về số sự kiện đã ghi; rating không phải số -> ValueError"""
+        rows = []
+        for user_id, isbn, rating in events:
+            rating = float(rating)
+            if not np.isfinite(rating):
+                raise ValueError(f"Rating không hợp lệ: {rating}")
+            rows.append((str(user_id), normalize_isbn(isbn), rating))
+        if rows:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT INTO rating_events (user_id, isbn, rating) VALUES (?, ?, ?)", rows)
+            finally:
+                conn.close()
+        return len(rows)
+
+    def append(self, user_id, isbn, rating):
+        return self.append_many([(user_id, isbn, rating)])
+
+    def read_since(self, last_id, limit=100_000):
+        """Các sự kiện có id > last_id, theo thứ tự id: list (id, user_id, isbn, rating)"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT id, user_id, isbn, rating FROM rating_events WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, limit)).fetchall()
+        finally:
+            conn.close()
+
+    def last_id(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM rating_events").fetchone()[0]
+        finally:
+            conn.close()
+
+
+def _normalize_rows(matrix):
+    """CSR -> CSR float32 có mỗi hàng chuẩn hóa L2 (hàng rỗng giữ nguyên)"""
+    matrix = matrix.astype(np.float32).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+class OnlineCF:
+    def __init__(self, isbns, users, total, count, k=NEIGHBORS_K, table=None, last_event_id=0):
+        """isbns/users: mảng chuỗi đã sắp xếp; total/count: CSR (sách x user) cùng cấu trúc.
+        table: NeighborTable ứng với đúng ma trận này (None -> tự dựng với k láng giềng; có -> dùng k của bảng)."""
+        self.k = table.k if table is not None else k
+        self.last_event_id = last_event_id
+        self._lock = threading.Lock()          # bản phục vụ (recommend), giữ rất ngắn
+        self._write_lock = threading.Lock()    # apply/compact: một luồng cập nhật tại một thời điểm
+        self._set_base(np.asarray(isbns, dtype=str), np.asarray(users, dtype=str), total.tocsr(), count.tocsr())
+        if table is None:
+            table = NeighborTable.from_matrix(self._base, self.isbns, k=k)
+        # Bản làm việc (chỉ luồng cập nhật đọc/ghi) + các hàng đã đổi từ lần công bố trước
+        self._indices = np.array(table.indices, dtype=np.int32)
+        self._scores = np.array(table.scores, dtype=np.float32)
+        self._touched = []
+        self._publish(full=True)
+        self.updates = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _set_base(self, isbns, users, total, count):
+        self._base_isbns, self._base_users = isbns, users
+        self._total, self._count = total, count
+        means = total.copy()
+        means.data = means.data / count.data
+        self._base = _normalize_rows(means)          # vector đã chuẩn hóa của mọi sách trong snapshot
+        # Sách/user mới (chưa có trong snapshot) được đánh số tiếp sau snapshot
+        self._extra_isbns, self._extra_users = {}, {}
+        self._extra_isbn_list, self._extra_user_list = [], []
+        # Lớp phủ: hàng -> {cột: [tổng, số rating]} và vector đã chuẩn hóa (cột, trọng số)
+        self._raw, self._rows = {}, {}
+        self._overlay_ids = np.zeros(0, dtype=np.int64)
+        self._overlay = None
+
+    # --- TRA CỨU ---
+
+    @property
+    def n_books(self):
+        return len(self._base_isbns) + len(self._extra_isbn_list)
+
+    @property
+    def n_users(self):
+        return len(self._base_users) + len(self._extra_user_list)
+
+    def __len__(self):
+        return self.n_books
+
+    @property
+    def isbns(self):
+        if not self._extra_isbn_list:
+            return self._base_isbns
+        return np.concatenate([self._base_isbns, np.array(self._extra_isbn_list, dtype=str)])
+
+    @property
+    def indices(self):
+        with self._lock:
+            return self._served_indices[:self._served_books]
+
+    @property
+    def scores(self):
+        with self._lock:
+            return self._served_scores[:self._served_books]
+
+    @staticmethod
+    def _lookup(sorted_values, extra, value, create, extra_list):
+        pos = int(np.searchsorted(sorted_values, value))
+        if pos < len(sorted_values) and sorted_values[pos] == value:
+            return pos
+        idx = extra.get(value)
+        if idx is None and create:
+            idx = extra[value] = len(sorted_values) + len(extra_list)
+            extra_list.append(value)
+        return -1 if idx is None else idx
+
+    def row_of(self, isbn):
+        return self._lookup(self._base_isbns, self._extra_isbns, isbn, False, self._extra_isbn_list)
+
+    def recommend(self, isbn, n_neighbors=6):
+        """Cùng quy ước với NeighborTable.recommend: n_neighbors tính cả chính cuốn sách"""
+        with self._lock:
+            row = self.row_of(normalize_isbn(isbn))
+            # Sách mới mà lô đang tính chưa công bố -> coi như chưa có
+            if row < 0 or row >= self._served_books:
+                return []
+            neighbors = self._served_indices[row, :max(n_neighbors - 1, 0)].tolist()
+            return [self._isbn_at(idx) for idx in neighbors if idx >= 0]
+
+    def _isbn_at(self, row):
+        n_base = len(self._base_isbns)
+        return str(self._base_isbns[row]) if row < n_base else self._extra_isbn_list[row - n_base]
+
+    # --- VECTOR CỦA SÁCH ---
+
+    def _row_vector(self, row):
+        """(cột, trọng số đã chuẩn hóa) của một sách"""
+        if row in self._rows:
+            return self._rows[row]
+        if row >= len(self._base_isbns):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        start, end = self._base.indptr[row], self._base.indptr[row + 1]
+        return self._base.indices[start:end].astype(np.int64), self._base.data[start:end]
+
+    def _raw_row(self, row):
+        """{cột: [tổng, số rating]} của một sách, khởi tạo từ snapshot lần đầu"""
+        raw = self._raw.get(row)
+        if raw is None:
+            raw = {}
+            if row < len(self._base_isbns):
+                start, end = self._total.indptr[row], self._total.indptr[row + 1]
+                for c, t, n in zip(self._total.indices[start:end].tolist(), self._total.data[start:end].tolist(),
+                                   self._count.data[start:end].tolist()):
+                    raw[c] = [t, n]
+            self._raw[row] = raw
+        return raw
+
+    def _vectors(self, rows):
+        """CSR (len(rows) x n_users) các vector đã chuẩn hóa"""
+        parts = [self._row_vector(r) for r in rows]
+        indptr = np.concatenate([[0], np.cumsum([len(c) for c, _ in parts])])
+        cols = np.concatenate([c for c, _ in parts]) if parts else np.zeros(0, dtype=np.int64)
+        data = np.concatenate([w for _, w in parts]) if parts else np.zeros(0, dtype=np.float32)
+        return csr_matrix((data, cols, indptr), shape=(len(rows), self.n_users))
+
+    def _sims(self, rows):
+        """Cosine của các sách rows với mọi sách -> mảng (len(rows), n_books), chính nó = -inf"""
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = self._vectors(rows)
+        n_base, u_base = self._base.shape
+        sims = np.zeros((len(rows), self.n_books), dtype=np.float32)
+        sims[:, :n_base] = (self._base @ vectors[:, :u_base].T).T.toarray()
+        if len(self._overlay_ids):
+            # Hàng trong lớp phủ: giá trị snapshot đã cũ -> ghi đè bằng vector mới
+            sims[:, self._overlay_ids] = (self._overlay @ vectors.T).T.toarray()
+        sims[np.arange(len(rows)), rows] = -np.inf
+        return sims
+
+    # --- CẬP NHẬT ---
+
+    def _publish(self, full=False):
+        """Chép các hàng đã đổi của bản làm việc sang bản phục vụ (dưới khóa, chỉ O(số hàng đổi))"""
+        rows = np.unique(np.concatenate(self._touched)) if self._touched else np.zeros(0, dtype=np.int64)
+        self._touched = []
+        if full or len(self._served_indices) != len(self._indices):
+            # Lần đầu / bảng vừa nới rộng: chép cả bảng ngoài khóa rồi đổi tham chiếu
+            indices, scores = self._indices.copy(), self._scores.copy()
+            with self._lock:
+                self._served_indices, self._served_scores = indices, scores
+                self._served_books = self.n_books
+            return
+        with self._lock:
+            self._served_indices[rows] = self._indices[rows]
+            self._served_scores[rows] = self._scores[rows]
+            self._served_books = self.n_books
+
+    def _grow_table(self):
+        n = self.n_books
+        if n <= len(self._indices):
+            return
+        capacity = max(n, 2 * len(self._indices), 1024)
+        indices = np.full((capacity, self.k), -1, dtype=np.int32)
+        scores = np.zeros((capacity, self.k), dtype=np.float32)
+        indices[:len(self._indices)] = self._indices
+        scores[:len(self._scores)] = self._scores
+        self._indices, self._scores = indices, scores
+
+    def _set_topk(self, rows, sims):
+        """Ghi top-K (giảm dần theo cosine, hòa thì chỉ số nhỏ trước) cho các hàng rows"""
+        k_eff = min(self.k, sims.shape[1] - 1)
+        if k_eff <= 0:
+            return
+        top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.lexsort((top, -top_sims), axis=1)
+        self._indices[rows] = -1
+        self._scores[rows] = 0.0
+        self._indices[rows, :k_eff] = np.take_along_axis(top, order, axis=1)
+        self._scores[rows, :k_eff] = np.take_along_axis(top_sims, order, axis=1)
+        self._touched.append(np.asarray(rows, dtype=np.int64))
+
+    def _recompute(self, rows, block_size=None):
+        rows = np.asarray(sorted(rows), dtype=np.int64)
+        block_size = block_size or max(1, min(4096, 64_000_000 // max(self.n_books, 1)))
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            self._set_topk(block, self._sims(block))
+
+    def _resort(self, rows):
+        idx, sc = self._indices[rows], self._scores[rows]
+        key = np.where(idx < 0, -np.inf, sc)
+        order = np.lexsort((np.where(idx < 0, np.iinfo(np.int32).max, idx), -key), axis=1)
+        self._indices[rows] = np.take_along_axis(idx, order, axis=1)
+        self._scores[rows] = np.take_along_axis(sc, order, axis=1)
+        self._touched.append(np.asarray(rows, dtype=np.int64))
+
+    def _patch_neighbors(self, b, sims_b, changed):
+        """Vá danh sách láng giềng của các sách khác theo độ tương đồng mới với sách b"""
+        n = self.n_books
+        indices = self._indices[:n]
+        holders = np.flatnonzero((indices == b).any(axis=1))
+        rows = np.union1d(np.flatnonzero(sims_b > 0), holders)
+        rows = rows[~np.isin(rows, changed)]
+        if not len(rows):
+            return set()
+        s = sims_b[rows]
+        idx, sc = indices[rows], self._scores[rows]
+        has_b = idx == b
+        in_list = has_b.any(axis=1)
+        old = np.where(has_b, sc, 0).sum(axis=1)
+
+        # b đã có trong danh sách và điểm giảm: sách khác có thể vượt lên -> tính lại cả hàng
+        dirty = rows[in_list & (s < old)]
+        # điểm tăng/không đổi: cập nhật điểm rồi sắp lại
+        up = in_list & (s >= old)
+        self._scores[rows[up]] = np.where(has_b[up], s[up, None], sc[up])
+        # chưa có: chèn nếu hơn phần tử cuối (hoặc còn chỗ trống)
+        last_idx, last_sc = idx[:, -1], sc[:, -1]
+        beats = ~in_list & ((last_idx < 0) | (s > last_sc) | ((s == last_sc) & (b < last_idx)))
+        ins = rows[beats]
+        self._indices[ins, -1] = b
+        self._scores[ins, -1] = s[beats]
+        self._resort(np.concatenate([rows[up], ins]))
+        return set(dirty.tolist())
+
+    def apply(self, events):
+        """events: các (user_id, isbn, rating) -> số sách có vector thay đổi.
+        Tính trên bản làm việc, recommend() vẫn chạy song song trên bản phục vụ."""
+        started = time.perf_counter()
+        with self._write_lock:
+            changed = set()
+            for user_id, isbn, rating in events:
+                row = self._lookup(self._base_isbns, self._extra_isbns, normalize_isbn(isbn), True, self._extra_isbn_list)
+                col = self._lookup(self._base_users, self._extra_users, str(user_id), True, self._extra_user_list)
+                cell = self._raw_row(row).setdefault(col, [0.0, 0])
+                cell[0] += float(rating)
+                cell[1] += 1
+                changed.add(row)
+            if not changed:
+                return 0
+
+            for row in changed:
+                raw = self._raw[row]
+                cols = np.array(sorted(raw), dtype=np.int64)
+                means = np.array([raw[c][0] / raw[c][1] for c in cols.tolist()], dtype=np.float32)
+                norm = np.linalg.norm(means)
+                self._rows[row] = (cols, means / norm if norm else means)
+            self._overlay_ids = np.array(sorted(self._rows), dtype=np.int64)
+            self._overlay = self._vectors(self._overlay_ids)
+            self._grow_table()
+
+            changed_arr = np.array(sorted(changed), dtype=np.int64)
+            dirty = set()
+            for start in range(0, len(changed_arr), 256):
+                block = changed_arr[start:start + 256]
+                sims = self._sims(block)
+                self._set_topk(block, sims)
+                for b, sims_b in zip(block.tolist(), sims):
+                    dirty |= self._patch_neighbors(b, sims_b, changed_arr)
+            if dirty:
+                self._recompute(dirty)
+            self._publish()
+            self.updates += 1
+        metrics.REGISTRY.histogram("stage", stage="cf_update").observe(time.perf_counter() - started)
+        metrics.inc("cf_books_updated", len(changed))
+        return len(changed)
+
+    def catch_up(self, log, batch=100_000):
+        """Áp dụng mọi sự kiện mới trong log -> số sự kiện đã áp dụng"""
+        applied = 0
+        while True:
+            events = log.read_since(self.last_event_id, batch)
+            if not events:
+                return applied
+            self.apply((u, i, r) for _, u, i, r in events)
+            self.last_event_id = events[-1][0]
+            applied += len(events)
+
+    # --- SNAPSHOT ---
+
+    def compact(self, snapshot_dir, neighbors_dir=None, ratings_path=None):
+        """Gộp lớp phủ vào snapshot mới và ghi xuống đĩa (cf_snapshot/ + cf_neighbors/).
+        Đánh số lại mọi sách nên chặn cả recommend() trong lúc đổi (hiếm, mặc định 10 phút/lần)."""
+        with self._write_lock, self._lock:
+            n_base = len(self._base_isbns)
+            if self._raw:
+                # Bỏ các hàng đã đổi khỏi snapshot cũ rồi thêm bản mới của chúng
+                keep = np.ones(n_base, dtype=bool)
+                keep[[r for r in self._raw if r < n_base]] = False
+                base = self._total.tocoo()
+                counts = self._count.tocoo()
+                mask = keep[base.row]
+                rows = [base.row[mask]]
+                cols = [base.col[mask]]
+                totals, nums = [base.data[mask]], [counts.data[mask]]
+                for r, raw in self._raw.items():
+                    rows.append(np.full(len(raw), r))
+                    cols.append(np.fromiter(raw, dtype=np.int64, count=len(raw)))
+                    totals.append(np.array([t for t, _ in raw.values()]))
+                    nums.append(np.array([c for _, c in raw.values()], dtype=np.float64))
+                row, col = np.concatenate(rows), np.concatenate(cols)
+                total = np.concatenate(totals)
+                count = np.concatenate(nums)
+            else:
+                total_coo = self._total.tocoo()
+                row, col, total, count = total_coo.row, total_coo.col, total_coo.data, self._count.tocoo().data
+
+            # Sắp xếp lại ISBN/user (sách/user mới chen vào đúng vị trí)
+            isbns, users = self.isbns, np.concatenate([self._base_users, np.array(self._extra_user_list, dtype=str)])
+            book_order, user_order = np.argsort(isbns, kind="stable"), np.argsort(users, kind="stable")
+            new_row, new_col = np.empty_like(book_order), np.empty_like(user_order)
+            new_row[book_order] = np.arange(len(book_order))
+            new_col[user_order] = np.arange(len(user_order))
+            shape = (len(isbns), len(users))
+            total_csr = coo_matrix((total, (new_row[row], new_col[col])), shape=shape).tocsr()
+            count_csr = coo_matrix((count, (new_row[row], new_col[col])), shape=shape).tocsr()
+
+            n = self.n_books
+            old_indices = self._indices[:n][book_order]
+            indices = np.where(old_indices >= 0, new_row[np.maximum(old_indices, 0)], -1).astype(np.int32)
+            scores = self._scores[:n][book_order].copy()
+
+            self._set_base(isbns[book_order], users[user_order], total_csr, count_csr)
+            self._indices, self._scores = indices, scores
+            # Chỉ số mới đổi thứ tự hòa điểm -> sắp lại cho đúng quy ước
+            if n:
+                self._resort(np.arange(n))
+            self._touched = []
+            self._served_indices, self._served_scores = self._indices.copy(), self._scores.copy()
+            self._served_books = n
+            table = NeighborTable(self._base_isbns, self._indices, self._scores)
+
+            tmp_dir = snapshot_dir + ".tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            np.save(os.path.join(tmp_dir, "isbns.npy"), self._base_isbns)
+            np.save(os.path.join(tmp_dir, "users.npy"), self._base_users)
+            save_npz(os.path.join(tmp_dir, "total.npz"), self._total)
+            save_npz(os.path.join(tmp_dir, "count.npz"), self._count)
+            table.save(tmp_dir)
+            meta = {"last_event_id": self.last_event_id, "k": self.k, "books": n, "users": len(self._base_users),
+                    "ratings_source": source_stamp(ratings_path) if ratings_path else None,
+                    "compacted_at": time.time()}
+            with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=1)
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            os.replace(tmp_dir, snapshot_dir)
+
+            if neighbors_dir:
+                # Bảng láng giềng cho dashboard/serve.py/batch_recommend.py lần khởi động sau
+                table.save(neighbors_dir, ratings_path, self.last_event_id)
+        metrics.inc("cf_compactions")
+        return meta
+
+    @staticmethod
+    def read_meta(snapshot_dir):
+        try:
+            with open(os.path.join(snapshot_dir, META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @classmethod
+    def open(cls, ratings_path, snapshot_dir, log=None, neighbors_dir=None, k=NEIGHBORS_K):
+        """Nạp snapshot (nếu dựng từ đúng ratings.csv hiện tại), không thì dựng từ ratings.csv; rồi đọc nốt log.
+        k chỉ dùng khi phải tự dựng bảng láng giềng; bảng có sẵn (snapshot / cf_neighbors/) giữ nguyên k của nó."""
+        meta = cls.read_meta(snapshot_dir)
+        if meta is not None and meta.get("ratings_source") == source_stamp(ratings_path):
+            engine = cls(np.load(os.path.join(snapshot_dir, "isbns.npy")), np.load(os.path.join(snapshot_dir, "users.npy")),
+                         load_npz(os.path.join(snapshot_dir, "total.npz")), load_npz(os.path.join(snapshot_dir, "count.npz")),
+                         k=k, table=NeighborTable.load(snapshot_dir), last_event_id=meta["last_event_id"])
+        else:
+            df = pd.read_csv(ratings_path, usecols=["user_id", "isbn", "rating"], dtype={"isbn": str, "user_id": str})
+            isbns, users, total, count = rating_matrices(df)
+            table = None
+            # Bảng láng giềng tính sẵn (build_cf_neighbors.py) từ đúng ratings.csv này, chưa gộp sự kiện
+            # trực tuyến nào -> khớp với ma trận vừa đọc, dùng lại thay vì dựng lại
+            if neighbors_dir and cls._neighbors_match(neighbors_dir, ratings_path):
+                cached = NeighborTable.load(neighbors_dir)
+                if np.array_equal(np.asarray(cached.isbns).astype(str), isbns):
+                    table = cached
+            engine = cls(isbns, users, total, count, k=k, table=table)
+        if log is not None:
+            engine.catch_up(log)
+        return engine
+
+    @staticmethod
+    def _neighbors_match(neighbors_dir, ratings_path):
+        # Chỉ dùng lại bảng chưa gộp sự kiện trực tuyến nào (engine sẽ tự đọc lại log từ đầu)
+        source = NeighborTable.read_source(neighbors_dir) or {}
+        return NeighborTable.matches_ratings(neighbors_dir, ratings_path) and not source.get("last_event_id")
+
+    # --- CHẠY NỀN ---
+
+    def start(self, log, snapshot_dir, neighbors_dir=None, ratings_path=None, poll_interval=1.0,
+              compact_interval=600.0, compact_rows=50_000):
+        """Thread nền: đọc sự kiện mới mỗi poll_interval giây; gộp snapshot sau compact_interval giây
+        hoặc khi lớp phủ vượt compact_rows sách"""
+        last_compact = time.monotonic()
+
+        def loop():
+            nonlocal last_compact
+            while not self._stop.wait(poll_interval):
+                try:
+                    if self.catch_up(log):
+                        metrics.debug(f"🔗 [CF] Đã cập nhật tới sự kiện #{self.last_event_id}")
+                    if self._raw and (len(self._raw) >= compact_rows or
+                                      time.monotonic() - last_compact >= compact_interval):
+                        self.compact(snapshot_dir, neighbors_dir, ratings_path)
+                        last_compact = time.monotonic()
+                except Exception as e:
+                    metrics.error(f"❌ Lỗi cập nhật CF trực tuyến: {e}")
+
+        self._thread = threading.Thread(target=loop, name="cf-online", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    base_dir = os.getenv("BOOKREC_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Nhật ký rating + cập nhật CF trực tuyến")
+    parser.add_argument("--data-dir", default=base_dir)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Ghi một rating")
+    add.add_argument("user_id")
+    add.add_argument("isbn")
+    add.add_argument("rating", type=float)
+    imp = sub.add_parser("import", help="Ghi các rating từ CSV (user_id,isbn,rating)")
+    imp.add_argument("path")
+    sub.add_parser("compact", help="Áp dụng sự kiện mới và ghi snapshot + cf_neighbors/")
+    args = parser.parse_args()
+
+    log = RatingLog(os.path.join(args.data_dir, RATINGS_LOG))
+    if args.command == "add":
+        log.append(args.user_id, args.isbn, args.rating)
+        print(f"✅ Đã ghi rating (sự kiện #{log.last_id()})")
+    elif args.command == "import":
+        total = 0
+        for chunk in pd.read_csv(args.path, usecols=["user_id", "isbn", "rating"], dtype=str, chunksize=100_000):
+            total += log.append_many(chunk.itertuples(index=False, name=None))
+        print(f"✅ Đã ghi {total:,} rating")
+    else:
+        ratings_path = os.path.join(args.data_dir, "ratings.csv")
+        start = time.perf_counter()
+        engine = OnlineCF.open(ratings_path, os.path.join(args.data_dir, SNAPSHOT_DIR), log,
+                               os.path.join(args.data_dir, NEIGHBORS_DIR))
+        meta = engine.compact(os.path.join(args.data_dir, SNAPSHOT_DIR), os.path.join(args.data_dir, NEIGHBORS_DIR),
+                              ratings_path)
+        print(f"✅ Snapshot: {meta['books']:,} sách, tới sự kiện #{meta['last_event_id']} "
+              f"({time.perf_counter() - start:.1f}s)")
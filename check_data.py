@@ -1,7 +1,7 @@
-import pandas as pd
+from catalog_store import read_books
 
-# Đọc file
-df = pd.read_csv("books_with_emotions.csv", encoding="utf-8")
+# Đọc file (catalogue nhị phân, tự build lại nếu CSV đổi)
+df = read_books("books_with_emotions.csv")
 
 # Kiểm tra các cột cảm xúc
 emotions = ['joy', 'sadness', 'fear', 'anger', 'surprise']
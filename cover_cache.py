@@ -0,0 +1,385 @@
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_index import PLACEHOLDER
+
+# --- CACHE ẢNH BÌA CỤC BỘ (ĐÃ THU NHỎ CHO GALLERY) ---
+# Trước đây Gallery nhận thẳng URL large_thumbnail -> mỗi lần tìm, trình duyệt tự tải 100+ ảnh bìa
+# cỡ lớn từ host ngoài. Ở đây:
+#   * Thread pool có giới hạn tải ảnh về (prefetch theo lô, hàng đợi đầy thì bỏ qua chứ không chặn request).
+#   * Ảnh được thu nhỏ về cỡ gallery (JPEG), lưu theo nội dung: tên file = sha256 của ảnh đã thu nhỏ,
+#     nên các URL trỏ tới cùng một ảnh (vd. ảnh "không có bìa" của Google Books) chỉ tốn một file.
+#   * Tổng dung lượng giới hạn bởi max_bytes, vượt thì xóa ảnh lâu không dùng nhất (LRU); ảnh vừa trả
+#     cho gallery trong recent_s giây không bị xóa (trình duyệt có thể chưa tải xong -> 404).
+#   * URL trống / 404 / không phải ảnh -> ảnh thay thế dùng chung (cover-not-found.jpg, cũng thu nhỏ).
+#     "Không có ảnh" được nhớ trong missing_ttl giây, hết hạn thì tải lại. Lỗi mạng/5xx không bị
+#     ghi nhớ: lần sau sẽ thử lại, trong lúc đó vẫn trả URL gốc.
+# Thư mục cache (mặc định cover_cache/ cạnh dữ liệu):
+#   index.db          url -> digest (NULL = không có ảnh), digest -> số byte + lần dùng cuối
+#   ab/abcdef....jpg  ảnh đã thu nhỏ
+# Chạy offline: cover_standin.py giả lập host ảnh bìa (xem bench_covers.py).
+
+COVER_CACHE_DIR = "cover_cache"
+# Khung ảnh trong gallery (rộng, cao); ảnh giữ tỉ lệ, không phóng to
+GALLERY_SIZE = (256, 384)
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+SCHEMA = ['''CREATE TABLE IF NOT EXISTS covers
+             (url TEXT PRIMARY KEY, digest TEXT, checked REAL NOT NULL)''',
+          '''CREATE TABLE IF NOT EXISTS blobs
+             (digest TEXT PRIMARY KEY, bytes INTEGER NOT NULL, last_access REAL NOT NULL)''']
+
+
+class CoverNotFound(Exception):
+    """Host trả lời rõ ràng là không có ảnh (404/410, không phải ảnh) -> dùng ảnh thay thế"""
+
+
+class CoverCache:
+    def __init__(self, cache_dir, placeholder=PLACEHOLDER, size=GALLERY_SIZE, max_bytes=DEFAULT_MAX_BYTES,
+                 workers=8, max_pending=1024, timeout=5.0, missing_ttl=7 * 86400, quality=85, recent_s=60.0):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.size = tuple(size)
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.missing_ttl = missing_ttl
+        self.quality = quality
+        self.recent_s = recent_s
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()      # trạng thái trong RAM (resolve chỉ cần khóa này)
+        self._db_lock = threading.Lock()   # kết nối SQLite dùng chung
+        self._pinned = None                # digest của ảnh thay thế, không bao giờ bị xóa
+        self._blobs = OrderedDict()   # digest -> số byte, thứ tự LRU (cuối = mới dùng)
+        self._urls = {}               # url -> digest
+        self._digest_urls = {}        # digest -> các url cùng nội dung (để dọn khi xóa)
+        self._missing = {}            # url -> thời điểm xác nhận không có ảnh
+        self._inflight = set()
+        self._touched = {}            # digest -> lần dùng cuối chưa ghi DB
+        self._served = {}             # digest -> lần cuối trả cho gallery (chặn xóa trong recent_s giây)
+        self.total_bytes = 0
+        self.counts = dict(hits=0, misses=0, placeholders=0, fetched=0, not_found=0, errors=0,
+                           evicted=0, dropped=0)
+
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "index.db"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            for sql in SCHEMA:
+                self._db.execute(sql)
+        self._load_index()
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cover-fetch")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Prefetch hàng loạt chỉ giữ vài lượt mỗi luồng trong hàng đợi -> lượt tải từ request không phải chờ lâu
+        self._bulk_slots = threading.BoundedSemaphore(workers * 2)
+        self._closed = False
+        self.placeholder = self._prepare_placeholder(placeholder)
+
+    # --- NẠP / GHI CHỈ MỤC ---
+    def _load_index(self):
+        for digest, nbytes in self._db.execute("SELECT digest, bytes FROM blobs ORDER BY last_access"):
+            if os.path.exists(self.path_for(digest)):
+                self._blobs[digest] = nbytes
+                self.total_bytes += nbytes
+        for url, digest, checked in self._db.execute("SELECT url, digest, checked FROM covers"):
+            if digest is None:
+                self._missing[url] = checked
+            elif digest in self._blobs:
+                self._urls[url] = digest
+                self._digest_urls.setdefault(digest, set()).add(url)
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + ".jpg")
+
+    def _prepare_placeholder(self, placeholder):
+        """Ảnh thay thế cũng được thu nhỏ vào cache (cùng cỡ với ảnh bìa thật)"""
+        path = os.path.abspath(placeholder)
+        try:
+            with open(path, "rb") as f:
+                digest = self._pinned = self._store(self._resize(f.read()))
+            return self.path_for(digest)
+        except Exception as e:
+            print(f"⚠️ Không thu nhỏ được ảnh thay thế '{placeholder}': {e}")
+            return path
+
+    # --- TẢI + THU NHỎ ---
+    def _download(self, url):
+        req = urllib.request.Request(url, headers={"User-Agent": "book-recommender-cover-cache"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return r.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 410):
+                raise CoverNotFound(f"HTTP {e.code}") from e
+            raise
+
+    def _resize(self, data):
+        from PIL import Image, UnidentifiedImageError
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.draft("RGB", self.size)  # JPEG: giải mã thẳng ở độ phân giải nhỏ hơn
+            img = img.convert("RGB")
+        except (UnidentifiedImageError, OSError) as e:
+            raise CoverNotFound(f"không phải ảnh: {e}") from e
+        img.thumbnail(self.size)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=self.quality, optimize=True)
+        return out.getvalue()
+
+    def _store(self, data):
+        """Ghi ảnh theo nội dung (bỏ qua nếu đã có), trả về digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        with self._lock:
+            known = digest in self._blobs
+        if not known:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = len(data)
+                self.total_bytes += len(data)
+            self._blobs.move_to_end(digest)
+        with self._db_lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO blobs (digest, bytes, last_access) VALUES (?, ?, ?)",
+                             (digest, len(data), now))
+        return digest
+
+    def _fetch(self, url, bulk=False):
+        try:
+            digest = self._store(self._resize(self._download(url)))
+        except CoverNotFound:
+            now = time.time()
+            with self._lock:
+                self._missing[url] = now
+                self.counts["not_found"] += 1
+            with self._db_lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO covers (url, digest, checked) VALUES (?, NULL, ?)", (url, now))
+        except Exception:
+            # Lỗi mạng / timeout / 5xx: không ghi nhớ, lần sau thử lại
+            with self._lock:
+                self.counts["errors"] += 1
+        else:
+            with self._lock:
+                self.counts["fetched"] += 1
+                self._missing.pop(url, None)
+                if digest not in self._blobs:
+                    return  # vừa bị luồng khác xóa (LRU) -> coi như chưa tải
+                self._urls[url] = digest
+                self._digest_urls.setdefault(digest, set()).add(url)
+            with self._db_lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO covers (url, digest, checked) VALUES (?, ?, ?)",
+                                 (url, digest, time.time()))
+            self._evict()
+        finally:
+            self._release(url, bulk)
+
+    def _evict(self):
+        """Xóa ảnh lâu không dùng nhất tới khi còn dưới 90% max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        removed = []
+        now = time.time()
+        with self._lock:
+            for digest in list(self._blobs):  # từ cũ nhất tới mới nhất
+                if self.total_bytes <= self.max_bytes * 0.9:
+                    break
+                if digest == self._pinned:
+                    continue
+                if now - self._served.get(digest, 0.0) < self.recent_s:
+                    continue  # vừa trả cho gallery, trình duyệt có thể đang tải
+                self._served.pop(digest, None)
+                self.total_bytes -= self._blobs.pop(digest)
+                for url in self._digest_urls.pop(digest, ()):
+                    self._urls.pop(url, None)
+                self._touched.pop(digest, None)
+                self.counts["evicted"] += 1
+                removed.append(digest)
+        with self._db_lock, self._db:
+            self._db.executemany("DELETE FROM covers WHERE digest = ?", [(d,) for d in removed])
+            self._db.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d in removed])
+        for digest in removed:
+            try:
+                os.remove(self.path_for(digest))
+            except FileNotFoundError:
+                pass
+
+    def _release(self, url, bulk):
+        with self._lock:
+            self._inflight.discard(url)
+        self._slots.release()
+        if bulk:
+            self._bulk_slots.release()
+
+    # --- API ---
+    def _should_fetch(self, url, now):
+        if not url or url in self._urls or url in self._inflight:
+            return False
+        checked = self._missing.get(url)
+        return checked is None or now - checked > self.missing_ttl
+
+    def prefetch(self, urls, block=False):
+        """Xếp các URL chưa có vào thread pool. block=False: hàng đợi đầy thì bỏ qua (không chặn request).
+        block=True (tải cả catalogue): chờ theo nhịp tải, chỉ chiếm một phần nhỏ hàng đợi.
+        Trả về số URL đã xếp hàng."""
+        queued = 0
+        now = time.time()
+        for url in urls:
+            if self._closed:
+                break
+            if not isinstance(url, str) or url == PLACEHOLDER:
+                continue
+            with self._lock:
+                if not self._should_fetch(url, now):
+                    continue
+                self._inflight.add(url)
+            if block:
+                self._bulk_slots.acquire()
+            if not self._slots.acquire(blocking=block):
+                with self._lock:
+                    self._inflight.discard(url)
+                    self.counts["dropped"] += 1
+                continue
+            try:
+                self._pool.submit(self._fetch, url, block)
+            except RuntimeError:
+                # Pool đã đóng (tắt app giữa chừng)
+                self._release(url, block)
+                break
+            queued += 1
+        return queued
+
+    def resolve(self, url):
+        """URL ảnh bìa -> đường dẫn ảnh đã thu nhỏ trong cache; không có ảnh -> ảnh thay thế;
+        chưa tải -> URL gốc (và xếp hàng tải cho lần sau)"""
+        with self._lock:
+            now = time.time()
+            digest = self._urls.get(url) if isinstance(url, str) else None
+            if digest is not None:
+                self.counts["hits"] += 1
+                self._blobs.move_to_end(digest)
+                self._touched[digest] = self._served[digest] = now
+                return self.path_for(digest)
+            if not isinstance(url, str) or not url or url == PLACEHOLDER:
+                self.counts["placeholders"] += 1
+                return self.placeholder
+            checked = self._missing.get(url)
+            if checked is not None:
+                self.counts["placeholders"] += 1
+                expired = now - checked > self.missing_ttl
+            else:
+                self.counts["misses"] += 1
+        if checked is None:
+            self.prefetch([url])
+            return url
+        if expired:
+            # Hết hạn ghi nhớ "không có ảnh": vẫn trả ảnh thay thế, tải lại ở nền (có ảnh -> lần sau trúng cache)
+            self.prefetch([url])
+        return self.placeholder
+
+    def gallery(self, items):
+        """[(url, caption)] -> [(ảnh cục bộ hoặc url, caption)] cho gr.Gallery"""
+        return [(self.resolve(url), caption) for url, caption in items]
+
+    def wait(self, timeout=None):
+        """Chờ mọi lượt tải đang chạy xong (dùng cho prefetch hàng loạt / benchmark)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._inflight:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+    def flush(self):
+        """Ghi lần dùng cuối (LRU) xuống DB; gọi định kỳ, không ghi mỗi lần resolve"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with self._db_lock, self._db:
+                self._db.executemany("UPDATE blobs SET last_access = ? WHERE digest = ?",
+                                     [(t, d) for d, t in touched.items()])
+
+    def stats(self):
+        with self._lock:
+            c = dict(self.counts)
+            c.update(covers=len(self._urls), files=len(self._blobs), missing=len(self._missing),
+                     inflight=len(self._inflight), bytes=self.total_bytes, max_bytes=self.max_bytes)
+        served = c["hits"] + c["misses"]
+        c["hit_rate"] = c["hits"] / served if served else 0.0
+        return c
+
+    def close(self):
+        self._closed = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self.flush()
+        self._db.close()
+
+
+def start_flusher(cache, interval=30.0):
+    """Thread nền ghi LRU xuống DB mỗi interval giây"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                cache.flush()
+            except Exception as e:
+                print(f"Lỗi ghi LRU ảnh bìa: {e}")
+    thread = threading.Thread(target=loop, name="cover-flush", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    from catalog_store import read_books
+
+    parser = argparse.ArgumentParser(description="Tải trước + thu nhỏ ảnh bìa của cả catalogue vào cache cục bộ")
+    parser.add_argument("--data-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--cache-dir", help=f"Mặc định <data-dir>/{COVER_CACHE_DIR}")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES // 2**20)
+    parser.add_argument("--limit", type=int, help="Chỉ tải N sách đầu")
+    args = parser.parse_args()
+
+    csv_path = os.path.join(args.data_dir, "books_with_emotions.csv")
+    if not os.path.exists(csv_path): csv_path = os.path.join(args.data_dir, "books_cleaned.csv")
+    books = read_books(csv_path)
+    urls = books["large_thumbnail" if "large_thumbnail" in books.columns else "thumbnail"].dropna().tolist()
+    urls = urls[:args.limit] if args.limit else urls
+
+    placeholder = os.path.join(args.data_dir, PLACEHOLDER)
+    if not os.path.exists(placeholder):
+        placeholder = os.path.join(os.path.dirname(os.path.abspath(__file__)), PLACEHOLDER)
+    cache = CoverCache(args.cache_dir or os.path.join(args.data_dir, COVER_CACHE_DIR),
+                       placeholder=placeholder, max_bytes=args.max_mb * 2**20,
+                       workers=args.workers, max_pending=args.workers * 4)
+    start = time.perf_counter()
+    print(f"⏳ Tải trước {len(urls):,} ảnh bìa ({args.workers} luồng)...")
+    # block=True: hàng đợi có giới hạn làm nhịp cho vòng lặp, không xếp hàng cả triệu URL vào RAM
+    queued = cache.prefetch(urls, block=True)
+    cache.wait()
+    s = cache.stats()
+    cache.close()
+    elapsed = time.perf_counter() - start
+    print(f"✅ {queued:,} URL tải trong {elapsed:.1f}s ({queued / elapsed if elapsed else 0:,.1f}/s): "
+          f"{s['fetched']:,} ảnh, {s['not_found']:,} không có bìa, {s['errors']:,} lỗi mạng; "
+          f"cache {s['files']:,} file, {s['bytes'] / 2**20:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import hashlib
+import io
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- HOST ẢNH BÌA GIẢ LẬP (CHẠY OFFLINE) ---
+# Thay cho books.google.com khi test / benchmark cover_cache.py không có mạng.
+# Mỗi đường dẫn luôn cho cùng một kết quả (theo hash của URL):
+#   * missing_rate: trả 404 (sách không có bìa)
+#   * blank_rate:   trả cùng một ảnh "không có bìa" (như Google Books) -> thử khử trùng theo nội dung
+#   * error_rate:   trả 503 (lỗi tạm thời, cache không được ghi nhớ)
+#   * còn lại: ảnh JPEG cỡ bìa lớn (mặc định 600x900), màu + họa tiết riêng cho từng URL
+# latency_ms: thêm độ trễ mỗi request như host ở xa.
+
+COVER_SIZE = (600, 900)
+
+
+def _bucket(path):
+    """Số ngẫu nhiên cố định trong [0, 1) cho mỗi đường dẫn"""
+    return int.from_bytes(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest(), "little") / 2**64
+
+
+@lru_cache(maxsize=2048)
+def make_cover(path, size=COVER_SIZE):
+    from PIL import Image, ImageDraw
+    seed = hashlib.sha256(path.encode("utf-8")).digest()
+    img = Image.new("RGB", size, tuple(seed[:3]))
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    for i in range(8):
+        x, y = seed[3 + i] * w // 256, seed[11 + i] * h // 256
+        draw.rectangle([x, y, x + w // 4, y + h // 6], fill=tuple(seed[19 + i:22 + i]))
+    draw.text((w // 10, h // 2), path[-40:], fill=(255, 255, 255))
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, missing_rate=0.1, blank_rate=0.05, error_rate=0.0, latency_ms=0.0):
+        super().__init__(address, StandinHandler)
+        self.missing_rate = missing_rate
+        self.blank_rate = blank_rate
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.requests += 1
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+        b = _bucket(self.path)
+        if b < server.missing_rate:
+            self.send_error(404)
+            return
+        b -= server.missing_rate
+        if b < server.error_rate:
+            self.send_error(503)
+            return
+        b -= server.error_rate
+        body = make_cover("/blank" if b < server.blank_rate else self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_standin(port=0, **kwargs):
+    """Chạy host giả lập trong thread nền; port=0 -> cổng trống bất kỳ. Trả về server (.base_url, .shutdown())"""
+    server = StandinServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="cover-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host ảnh bìa giả lập cho test/benchmark offline")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--blank-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StandinServer(("127.0.0.1", args.port), args.missing_rate, args.blank_rate, args.error_rate,
+                           args.latency_ms)
+    print(f"🌐 Ảnh bìa giả lập: {server.base_url}/<bất kỳ>.jpg")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,8 +1,8 @@
-import pandas as pd
-import numpy as np
-import random
 import os
 
+from catalog_store import read_books
+from rating_generator import RatingGenerator
+
 # 1. Setup đường dẫn tuyệt đối (tránh lỗi không tìm thấy file)
 base_dir = os.path.dirname(os.path.abspath(__file__))
 csv_file_path = os.path.join(base_dir, "books_with_emotions.csv")
@@ -15,11 +15,12 @@ if not os.path.exists(csv_file_path):
 
 try:
     print(f"📖 Đang đọc sách từ: {csv_file_path}")
-    books = pd.read_csv(csv_file_path)
+    # Chỉ cần cột isbn13 (đã chuẩn hóa sẵn trong catalogue nhị phân)
+    books = read_books(csv_file_path, columns=["isbn13"])
     
-    # Lấy TẤT CẢ ISBN và xử lý chuỗi (bỏ .0)
+    # Lấy TẤT CẢ ISBN
     if "isbn13" in books.columns:
-        all_isbns = books['isbn13'].astype(str).str.replace(r'\.0$', '', regex=True).unique().tolist()
+        all_isbns = books['isbn13'].unique().tolist()
     else:
         print("❌ File sách không có cột 'isbn13'.")
         exit()
@@ -31,36 +32,15 @@ except Exception as e:
     exit()
 
 # 3. SINH DỮ LIỆU RATINGS (ĐẢM BẢO PHỦ KÍN 100%)
-user_ids = []
-book_isbns = []
-ratings = []
-
 print("⏳ Đang sinh dữ liệu (Chế độ: Phủ kín 100% sách)...")
 
-# Giai đoạn 1: Ép buộc MỖI cuốn sách phải được rate bởi ít nhất 2 người
+# Giai đoạn 1: User 1-3 là "nhà phê bình" rate MỌI cuốn sách 3-5 sao
 # (Để đảm bảo sách nào tìm cũng thấy có dữ liệu)
-for isbn in all_isbns:
-    # Giả sử User 1 đến User 5 là những "nhà phê bình" đọc hết mọi sách
-    for critic_id in range(1, 4): 
-        user_ids.append(critic_id)
-        book_isbns.append(isbn)
-        ratings.append(np.random.randint(3, 6)) # Rate từ 3 đến 5 sao
-
-# Giai đoạn 2: Tạo thêm nhiễu ngẫu nhiên (cho tự nhiên)
-NUM_EXTRA_RATINGS = 5000 
-for _ in range(NUM_EXTRA_RATINGS):
-    user_ids.append(np.random.randint(10, 1000)) # User ngẫu nhiên từ 10-1000
-    book_isbns.append(random.choice(all_isbns))
-    ratings.append(np.random.randint(1, 6))
-
-# 4. Lưu file
-df_ratings = pd.DataFrame({
-    "user_id": user_ids,
-    "isbn": book_isbns,
-    "rating": ratings
-})
+# Giai đoạn 2: 5000 rating ngẫu nhiên 1-5 sao từ user 10-999 (cho tự nhiên)
+# Sinh vector hóa, có seed, ghi thẳng ra CSV theo chunk (xem rating_generator.py)
+generator = RatingGenerator(all_isbns, n_ratings=5000, user_min=10, user_max=1000, critics=3)
+num_rows = generator.write_csv(ratings_file_path)
 
-df_ratings.to_csv(ratings_file_path, index=False)
 print(f"✅ Đã tạo xong '{ratings_file_path}'")
-print(f"📊 Tổng số dòng đánh giá: {len(df_ratings)}")
+print(f"📊 Tổng số dòng đánh giá: {num_rows}")
 print("👉 Bây giờ bạn hãy chạy lại gradio-dashboard.py để test nhé!")
\ No newline at end of file
@@ -0,0 +1,256 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- CACHE EMBEDDING TRÊN ĐĨA (THEO HASH NỘI DUNG) ---
+# Cùng một mô tả sách bị embed lại bằng all-MiniLM-L6-v2 ở mỗi lần rebuild.
+# Cache này lưu vector float32 trong một file memory-map, khóa = hash(model + văn bản),
+# nên rebuild một corpus không đổi sẽ không chạy model lần nào.
+# Cấu trúc thư mục (mỗi model một thư mục con):
+#   vectors.f32    ma trận (capacity x dim) float32, memory-map
+#   index.npz      keys (khóa 16 byte của từng slot, b'' = slot trống) + last_used ("đồng hồ" lần
+#                  dùng cuối, để evict LRU); số slot đã cấp = độ dài mảng, ghi cùng một lần os.replace
+#   meta.json      model, dim
+# An toàn khi crash: index.npz chỉ được ghi sau khi vector đã flush, và slot bị evict được ghi
+# xuống index.npz (đánh dấu trống) trước khi bị ghi đè bằng vector khác -> mở lại sau crash chỉ mất
+# các mục chưa flush (cache miss), không bao giờ trả vector của văn bản khác. Thread nền flush định kỳ.
+# Bản cũ lưu keys.npy / last_used.npy / meta["size"] thành ba file riêng: vẫn đọc được, lấy phần đầu
+# nhất quán ngắn nhất nếu các file lệch nhau (crash giữa các lần ghi), lần flush sau chuyển sang index.npz.
+
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    def __init__(self, directory, model_name, max_entries=1_000_000):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, model_name.replace("/", "__"))
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._clock = 0
+        self._dirty = False
+        self._index = {}
+        self._free = []
+        self._n = 0
+        self.dim = None
+        self._vectors = None
+        self._keys = np.zeros(0, dtype=f"S{KEY_BYTES}")
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._load()
+
+    # --- LƯU / ĐỌC ---
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if meta.get("model") != self.model_name:
+            return
+        try:
+            keys, last_used = self._read_index(meta)
+            capacity = os.path.getsize(self._path("vectors.f32")) // (4 * meta["dim"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Không đọc được chỉ mục cache embedding ({e}), bắt đầu cache trống")
+            return
+        self.dim = meta["dim"]
+        # Chỉ tin phần đầu mà mọi mảng (và file vector) đều có
+        self._n = min(len(keys), len(last_used), capacity)
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._keys = np.zeros(capacity, dtype=f"S{KEY_BYTES}")
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._keys[:self._n] = keys[:self._n]
+        self._last_used[:self._n] = last_used[:self._n]
+        self._clock = int(self._last_used[:self._n].max(initial=0))
+        for slot, key in enumerate(self._keys[:self._n]):
+            if key:
+                self._index[bytes(key)] = slot
+            else:
+                self._free.append(slot)
+
+    def _read_index(self, meta):
+        if os.path.exists(self._path("index.npz")):
+            with np.load(self._path("index.npz")) as data:
+                return data["keys"], data["last_used"]
+        if not os.path.exists(self._path("keys.npy")):
+            # Crash sau khi ghi meta.json lần đầu, trước khi có chỉ mục -> cache trống
+            return np.zeros(0, dtype=f"S{KEY_BYTES}"), np.zeros(0, dtype=np.int64)
+        # Định dạng cũ: ba file ghi lần lượt, meta["size"] có thể lệch với keys.npy / last_used.npy
+        size = meta.get("size", 0)
+        return np.load(self._path("keys.npy"))[:size], np.load(self._path("last_used.npy"))[:size]
+
+    def flush(self):
+        """Ghi index + vector xuống đĩa"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._save_index()
+            self._dirty = False
+
+    def _save_index(self):
+        # Vector trước, khóa sau: khóa trên đĩa luôn trỏ tới vector đã ghi xong. Khóa + last_used (và số
+        # slot) nằm chung index.npz, ghi ra file tạm rồi os.replace -> crash giữa chừng vẫn còn bản cũ
+        # nguyên vẹn, không có trạng thái "nửa mới nửa cũ".
+        self._vectors.flush()
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim}, f)
+        os.replace(tmp, self._path("meta.json"))
+        with open(self._path("index.npz.tmp"), "wb") as f:
+            np.savez(f, keys=self._keys[:self._n], last_used=self._last_used[:self._n])
+        os.replace(self._path("index.npz.tmp"), self._path("index.npz"))
+        for name in ("keys.npy", "last_used.npy"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    # --- QUẢN LÝ SLOT ---
+    def _grow(self, needed):
+        capacity = len(self._keys)
+        new_capacity = min(self.max_entries, max(1024, capacity * 2, needed))
+        if new_capacity <= capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self._keys = np.concatenate([self._keys, np.zeros(new_capacity - capacity, dtype=self._keys.dtype)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(new_capacity - capacity, dtype=np.int64)])
+
+    def _evict(self, count):
+        """Bỏ các slot lâu không dùng nhất (ít nhất 10% cache một lần để đỡ evict liên tục)"""
+        count = min(self._n, max(count, self.max_entries // 10))
+        used = np.flatnonzero(self._keys[:self._n] != b"")
+        victims = used[np.argpartition(self._last_used[used], count - 1)[:count]] if count < len(used) else used
+        for slot in victims:
+            del self._index[bytes(self._keys[slot])]
+            self._keys[slot] = b""
+            self._free.append(int(slot))
+        self.evictions += len(victims)
+        # Ghi slot trống xuống đĩa trước khi chúng được ghi đè (mất điện lúc này không làm khóa cũ
+        # trỏ vào vector mới)
+        self._save_index()
+
+    def _alloc(self):
+        if self._free:
+            return self._free.pop()
+        if self._n >= len(self._keys):
+            self._grow(self._n + 1)
+        if self._n >= len(self._keys):
+            self._evict(1)
+            return self._free.pop()
+        self._n += 1
+        return self._n - 1
+
+    # --- API ---
+    def key(self, text):
+        h = hashlib.blake2b(digest_size=KEY_BYTES)
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    def get_many(self, texts):
+        """Trả về list vector (np.float32) hoặc None cho văn bản chưa có trong cache"""
+        keys = [self.key(t) for t in texts]
+        out = []
+        with self._lock:
+            for key in keys:
+                slot = self._index.get(key)
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    self._clock += 1
+                    self._last_used[slot] = self._clock
+                    out.append(np.array(self._vectors[slot]))
+        return out
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            for text, vec in zip(texts, vectors):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None:
+                    slot = self._alloc()
+                    self._index[key] = slot
+                    self._keys[slot] = key
+                self._clock += 1
+                self._last_used[slot] = self._clock
+                self._vectors[slot] = vec
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._index), "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class CachedEmbeddings(Embeddings):
+    """Bọc một model Embeddings (vd HuggingFaceEmbeddings), chỉ gọi model cho văn bản chưa có trong cache"""
+
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        if missing:
+            # Văn bản trùng trong cùng lô chỉ embed một lần
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = np.asarray(self.model.embed_documents(unique), dtype=np.float32)
+            self.cache.put_many(unique, vectors)
+            by_text = dict(zip(unique, vectors))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        # Luôn trả về vector đã làm tròn float32 để hit/miss cho cùng kết quả
+        return [vec.tolist() for vec in cached]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def start_flusher(cache, interval=60.0):
+    """Thread nền flush cache mỗi interval giây (nếu có mục mới) -> crash chỉ mất tối đa interval giây"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            if cache._dirty:
+                try:
+                    cache.flush()
+                except Exception as e:
+                    print(f"Lỗi ghi cache embedding: {e}")
+    thread = threading.Thread(target=loop, name="embedding-cache-flush", daemon=True)
+    thread.start()
+    return thread
+
+
+def cached_embedding_model(model, directory, model_name, max_entries=1_000_000, flush_interval=60.0):
+    """Tạo CachedEmbeddings, flush định kỳ và khi thoát"""
+    cache = EmbeddingCache(directory, model_name, max_entries=max_entries)
+    atexit.register(cache.flush)
+    if flush_interval:
+        start_flusher(cache, flush_interval)
+    return CachedEmbeddings(model, cache)
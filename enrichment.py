@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# --- LÀM GIÀU DỮ LIỆU: THỂ LOẠI + CẢM XÚC THEO CHUNK, SONG SONG, CÓ CHECKPOINT ---
+# new.py chấm từng dòng bằng books.apply(..., axis=1), new2.py và các notebook thì điền
+# số ngẫu nhiên vì chạy model transformer "quá chậm". Module này chia corpus thành chunk,
+# chạy song song trên nhiều process và ghi kết quả từng chunk ra thư mục checkpoint,
+# nên chạy lại sẽ bỏ qua các chunk đã xong. Hai backend:
+#   * "keyword": cùng luật từ khóa như new.py cũ, nhưng vector hóa bằng str.contains trên cả chunk
+#   * "model":   model cảm xúc + zero-shot chạy local theo batch (như notebook gốc)
+# Đầu ra là đúng các cột dashboard đang dùng: simple_categories + 5 cột cảm xúc.
+
+EMOTIONS = ["joy", "sadness", "fear", "anger", "surprise"]
+OUTPUT_COLUMNS = ["simple_categories"] + EMOTIONS
+
+# Luật của classify_and_emotion cũ, theo đúng thứ tự ưu tiên
+CATEGORY_KEYWORDS = [
+    ("Science Fiction", ["sci", "space"]),
+    ("Fantasy", ["fantasy", "dragon"]),
+    ("Mystery", ["mystery", "crime"]),
+    ("Horror", ["horror"]),
+    ("Romance", ["love"]),
+    ("Fiction", ["fiction"]),
+]
+DEFAULT_CATEGORY = "Non-Fiction"
+EMOTION_KEYWORDS = {
+    "joy": ["happy", "love"],
+    "sadness": ["sad", "death"],
+    "fear": ["dark", "kill"],
+    "anger": ["war", "hate"],
+    "surprise": ["shock"],
+}
+
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+CATEGORY_MODEL = "facebook/bart-large-mnli"
+CATEGORY_LABELS = ["Fiction", "Nonfiction"]
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _keyword_pattern(words):
+    return "|".join(map(re.escape, words))
+
+
+class KeywordBackend:
+    """Phân loại bằng từ khóa, mỗi luật là một regex chạy trên cả cột"""
+
+    name = "keyword"
+
+    def __init__(self):
+        self.category_patterns = [(cat, _keyword_pattern(words)) for cat, words in CATEGORY_KEYWORDS]
+        self.emotion_patterns = {emo: _keyword_pattern(words) for emo, words in EMOTION_KEYWORDS.items()}
+
+    def classify(self, frame):
+        categories = frame["categories"] if "categories" in frame else pd.Series("", index=frame.index)
+        descriptions = frame["description"] if "description" in frame else pd.Series("", index=frame.index)
+        # NaN -> "" (bản cũ dùng str(NaN) = "nan", không chứa từ khóa nào nên kết quả như nhau)
+        text = (categories.fillna("").astype(str) + " " + descriptions.fillna("").astype(str)).str.lower()
+
+        matches = [text.str.contains(p, regex=True).to_numpy() for _, p in self.category_patterns]
+        out = pd.DataFrame(index=frame.index)
+        out["simple_categories"] = np.select(matches, [cat for cat, _ in self.category_patterns],
+                                             default=DEFAULT_CATEGORY)
+        for emo, pattern in self.emotion_patterns.items():
+            out[emo] = text.str.contains(pattern, regex=True).to_numpy(dtype=np.float64)
+        return out
+
+
+class ModelBackend:
+    """Model local chạy theo batch: cảm xúc = max điểm trên từng câu của mô tả,
+    thể loại = giữ simple_categories sẵn có, zero-shot Fiction/Nonfiction cho dòng còn thiếu"""
+
+    name = "model"
+
+    def __init__(self, batch_size=32, device=None, emotion_model=EMOTION_MODEL, category_model=CATEGORY_MODEL):
+        import torch
+        from transformers import pipeline
+
+        if device is None:
+            device = 0 if torch.cuda.is_available() else -1
+        self.batch_size = batch_size
+        self.emotion = pipeline("text-classification", model=emotion_model, top_k=None,
+                                device=device, truncation=True)
+        self._category_model = category_model
+        self._device = device
+        self._zero_shot = None
+
+    @property
+    def zero_shot(self):
+        # Chỉ nạp model zero-shot (rất nặng) khi thực sự có dòng thiếu thể loại
+        if self._zero_shot is None:
+            from transformers import pipeline
+            self._zero_shot = pipeline("zero-shot-classification", model=self._category_model, device=self._device)
+        return self._zero_shot
+
+    def _emotion_scores(self, descriptions):
+        sentences, owners = [], []
+        for row, desc in enumerate(descriptions):
+            parts = [s.strip() for s in str(desc).split(".") if s.strip()] if pd.notna(desc) else []
+            sentences.extend(parts)
+            owners.extend([row] * len(parts))
+
+        scores = np.zeros((len(descriptions), len(EMOTIONS)), dtype=np.float64)
+        if not sentences:
+            return scores
+        col = {emo: i for i, emo in enumerate(EMOTIONS)}
+        per_sentence = np.zeros((len(sentences), len(EMOTIONS)), dtype=np.float64)
+        for i, prediction in enumerate(self.emotion(sentences, batch_size=self.batch_size)):
+            for item in prediction:
+                if item["label"] in col:
+                    per_sentence[i, col[item["label"]]] = item["score"]
+        # owners đã tăng dần -> max theo từng sách bằng một lần reduceat
+        owners = np.asarray(owners)
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        scores[owners[starts]] = np.maximum.reduceat(per_sentence, starts, axis=0)
+        return scores
+
+    def classify(self, frame):
+        descriptions = frame["description"].tolist() if "description" in frame else [""] * len(frame)
+        out = pd.DataFrame(index=frame.index)
+        if "simple_categories" in frame:
+            out["simple_categories"] = frame["simple_categories"].to_numpy(dtype=object)
+        else:
+            out["simple_categories"] = np.full(len(frame), np.nan, dtype=object)
+
+        missing = np.flatnonzero(pd.isna(out["simple_categories"]).to_numpy())
+        if len(missing):
+            texts = [str(descriptions[i]) for i in missing]
+            results = self.zero_shot(texts, CATEGORY_LABELS, batch_size=self.batch_size)
+            if isinstance(results, dict):
+                results = [results]
+            out.iloc[missing, 0] = [r["labels"][0] for r in results]
+
+        scores = self._emotion_scores(descriptions)
+        for i, emo in enumerate(EMOTIONS):
+            out[emo] = scores[:, i]
+        return out
+
+
+BACKENDS = {"keyword": KeywordBackend, "model": ModelBackend}
+
+
+def make_backend(name="keyword", **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {name} (chọn {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
+
+
+# --- CHECKPOINT ---
+
+def _input_columns(frame):
+    return [c for c in ("categories", "description", "simple_categories") if c in frame.columns]
+
+
+def _fingerprint(frame):
+    """Hash nội dung đầu vào: đổi dữ liệu thì checkpoint cũ không được dùng lại"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _chunk_path(checkpoint_dir, i):
+    return os.path.join(checkpoint_dir, f"chunk_{i:06d}.pkl")
+
+
+def _prepare_checkpoint(checkpoint_dir, manifest, resume):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+    old = None
+    try:
+        with open(path, encoding="utf-8") as f:
+            old = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    if not resume or old != manifest:
+        if old is not None:
+            print("♻️ Checkpoint cũ không khớp dữ liệu/cấu hình hiện tại, chạy lại từ đầu.")
+        for name in os.listdir(checkpoint_dir):
+            if name.startswith("chunk_"):
+                os.remove(os.path.join(checkpoint_dir, name))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+
+def _save_chunk(checkpoint_dir, i, result):
+    path = _chunk_path(checkpoint_dir, i)
+    result.to_pickle(path + ".tmp")
+    os.replace(path + ".tmp", path)  # chunk chỉ "xong" khi file đã ghi trọn
+
+
+# --- CHẠY SONG SONG ---
+
+_worker_backend = None
+
+
+def _init_worker(backend_name, backend_kwargs):
+    global _worker_backend
+    try:
+        import torch
+        # Mỗi process một luồng, song song hóa bằng số process
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker_backend = make_backend(backend_name, **backend_kwargs)
+
+
+def _classify_in_worker(i, frame):
+    return i, _worker_backend.classify(frame)
+
+
+def enrich(books, backend="keyword", chunk_size=2000, workers=1, checkpoint_dir=None, resume=True,
+           backend_kwargs=None):
+    """Trả về DataFrame (cùng index với books) gồm simple_categories + 5 cột cảm xúc.
+    checkpoint_dir: mỗi chunk xong được ghi ra đĩa; chạy lại cùng dữ liệu sẽ tiếp tục từ chỗ dừng."""
+    backend_kwargs = backend_kwargs or {}
+    frame = books[_input_columns(books)].reset_index(drop=True)
+    n_chunks = -(-len(frame) // chunk_size) if len(frame) else 0
+    bounds = [(i, i * chunk_size, min(len(frame), (i + 1) * chunk_size)) for i in range(n_chunks)]
+
+    results = {}
+    if checkpoint_dir:
+        manifest = {"backend": backend, "backend_kwargs": backend_kwargs, "chunk_size": chunk_size,
+                    "rows": len(frame), "fingerprint": _fingerprint(frame)}
+        _prepare_checkpoint(checkpoint_dir, manifest, resume)
+        for i, _, _ in bounds:
+            if os.path.exists(_chunk_path(checkpoint_dir, i)):
+                results[i] = pd.read_pickle(_chunk_path(checkpoint_dir, i))
+        if results:
+            print(f"⏩ Tiếp tục từ checkpoint: {len(results)}/{n_chunks} chunk đã xong.")
+
+    todo = [(i, a, b) for i, a, b in bounds if i not in results]
+    start = time.perf_counter()
+    done_rows = 0
+
+    def finish(i, result):
+        nonlocal done_rows
+        results[i] = result
+        if checkpoint_dir:
+            _save_chunk(checkpoint_dir, i, result)
+        done_rows += len(result)
+        rate = done_rows / max(time.perf_counter() - start, 1e-9)
+        print(f"   ✔️ chunk {i + 1}/{n_chunks} ({done_rows:,} dòng, {rate:,.0f} dòng/giây)")
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(backend, backend_kwargs)) as pool:
+            futures = [pool.submit(_classify_in_worker, i, frame.iloc[a:b]) for i, a, b in todo]
+            for future in as_completed(futures):
+                finish(*future.result())
+    elif todo:
+        engine = make_backend(backend, **backend_kwargs)
+        for i, a, b in todo:
+            finish(i, engine.classify(frame.iloc[a:b]))
+
+    if not results:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS, index=books.index)
+    out = pd.concat([results[i] for i in range(n_chunks)])
+    out.index = books.index
+    return out[OUTPUT_COLUMNS]
+
+
+def apply_enrichment(books, **kwargs):
+    """Ghi đè/ thêm các cột kết quả vào books (tại chỗ) và trả về books"""
+    enriched = enrich(books, **kwargs)
+    for col in OUTPUT_COLUMNS:
+        books[col] = enriched[col]
+    return books
+
+
+if __name__ == "__main__":
+    from catalog_store import build_catalog
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Gán thể loại + cảm xúc cho toàn bộ sách")
+    parser.add_argument("--input", default=os.path.join(base_dir, "books_with_emotions.csv"))
+    parser.add_argument("--output", default=None, help="Mặc định ghi đè --input")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="keyword")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch của model (backend 'model')")
+    parser.add_argument("--checkpoint", default=os.path.join(base_dir, "enrichment_checkpoint"))
+    parser.add_argument("--no-resume", action="store_true", help="Bỏ checkpoint cũ, chạy lại từ đầu")
+    args = parser.parse_args()
+
+    books = pd.read_csv(args.input, dtype={'isbn13': str}, encoding="utf-8")
+    start = time.perf_counter()
+    apply_enrichment(books, backend=args.backend, chunk_size=args.chunk_size, workers=args.workers,
+                     checkpoint_dir=args.checkpoint, resume=not args.no_resume,
+                     backend_kwargs={"batch_size": args.batch_size} if args.backend == "model" else None)
+    output = args.output or args.input
+    books.to_csv(output, index=False, encoding="utf-8")
+    build_catalog(output)
+    print(f"✅ Đã gán thể loại/cảm xúc cho {len(books)} sách trong {time.perf_counter() - start:.1f}s -> '{output}'")
@@ -0,0 +1,153 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from cf_engine import CFEngine, NeighborTable, NEIGHBORS_K
+from ranking import HybridRanker
+
+# --- ĐÁNH GIÁ OFFLINE: XẾP HẠNG LAI vs CÁCH CŨ (CHẤT LƯỢNG + ĐỘ TRỄ) ---
+# Không cần model/ChromaDB: dựng một "thế giới" giả lập có đáp án đúng.
+#   * Mỗi sách có vector chủ đề thật z; vector search chỉ thấy z + nhiễu (embedding không hoàn hảo)
+#   * User thích các sách gần vector sở thích của họ -> ratings -> bảng láng giềng CF thật
+#   * Mỗi query có ý định thật q và Tone; sách liên quan = top theo z·q + độ hợp Tone
+# So sánh: chỉ ngữ nghĩa / ngữ nghĩa + Tone sắp xếp lại (bản cũ) / weighted / rrf.
+
+TONES = ["joy", "sadness", "fear", "anger", "surprise"]
+
+
+def _normalize(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def make_world(n_books, n_users, ratings_per_user, dim, embed_noise, seed):
+    rng = np.random.default_rng(seed)
+    z = _normalize(rng.standard_normal((n_books, dim)))
+    observed = _normalize(z + embed_noise * rng.standard_normal((n_books, dim)) / np.sqrt(dim))
+    emotions = {t: rng.random(n_books) for t in TONES}
+    isbns = (9780000000000 + np.arange(n_books)).astype(str)
+
+    # Sở thích user = gần một cuốn sách ngẫu nhiên; chọn sách bằng Gumbel top-k trên z·u
+    user_vecs = _normalize(z[rng.integers(0, n_books, n_users)] + 0.5 * rng.standard_normal((n_users, dim)) / np.sqrt(dim))
+    rows_u, rows_b, vals = [], [], []
+    for start in range(0, n_users, 256):
+        u = user_vecs[start:start + 256]
+        logits = (u @ z.T) / 0.1 + rng.gumbel(size=(len(u), n_books))
+        picked = np.argpartition(-logits, ratings_per_user - 1, axis=1)[:, :ratings_per_user]
+        affinity = np.take_along_axis(u @ z.T, picked, axis=1)
+        rows_u.append(np.repeat(np.arange(start, start + len(u)), ratings_per_user))
+        rows_b.append(picked.ravel())
+        vals.append(np.clip(np.rint(3 + 4 * affinity.ravel() + rng.normal(0, 0.5, picked.size)), 1, 5))
+    ratings = pd.DataFrame({"user_id": np.concatenate(rows_u).astype(str),
+                            "isbn": isbns[np.concatenate(rows_b)],
+                            "rating": np.concatenate(vals)})
+    table = NeighborTable.build(CFEngine.from_frame(ratings), k=NEIGHBORS_K)
+    # Hàng của bảng láng giềng (ISBN đã sắp xếp) <-> vị trí sách
+    row_to_pos = pd.Index(isbns).get_indexer(np.asarray(table.isbns).astype(str))
+    pos_to_row = np.full(n_books, -1)
+    pos_to_row[row_to_pos] = np.arange(len(row_to_pos))
+    return {"z": z, "observed": observed, "emotions": emotions, "table": table,
+            "row_to_pos": row_to_pos, "pos_to_row": pos_to_row}
+
+
+def make_queries(world, n_queries, dim, query_noise, tone_strength, n_relevant, seed):
+    rng = np.random.default_rng(seed + 1)
+    z = world["z"]
+    queries = []
+    for _ in range(n_queries):
+        intent = _normalize(z[rng.integers(0, len(z))] + 0.3 * rng.standard_normal(dim) / np.sqrt(dim))
+        tone = rng.choice(TONES + [None])
+        grade = z @ intent + (tone_strength * world["emotions"][tone] if tone else 0.0)
+        relevant = np.argpartition(-grade, n_relevant - 1)[:n_relevant]
+        observed = _normalize(intent + query_noise * rng.standard_normal(dim) / np.sqrt(dim))
+        queries.append({"vector": observed, "tone": tone, "relevant": relevant})
+    return queries
+
+
+def ndcg_at(ranked, relevant, k):
+    gains = np.isin(ranked[:k], relevant).astype(np.float64)
+    discounts = 1.0 / np.log2(np.arange(2, len(gains) + 2))
+    ideal = discounts[:min(k, len(relevant))].sum()
+    return float((gains * discounts).sum() / ideal) if ideal else 0.0
+
+
+def evaluate(world, queries, rankers, candidates, top_k):
+    observed, table = world["observed"], world["table"]
+    row_to_pos, pos_to_row = world["row_to_pos"], world["pos_to_row"]
+
+    def cf_lookup(pos):
+        row = pos_to_row[pos]
+        if row < 0:
+            return np.empty(0, dtype=np.int64)
+        neighbors = np.asarray(table.indices[row])
+        return row_to_pos[neighbors[neighbors >= 0]]
+
+    methods = {"semantic": None, "semantic+tone_sort": None, **rankers}
+    report = {}
+    for name, ranker in methods.items():
+        ndcg, recall, latency, truncated = [], [], [], 0
+        for q in queries:
+            started = time.perf_counter()
+            sims = observed @ q["vector"]
+            pos = np.argpartition(-sims, candidates - 1)[:candidates]
+            pos = pos[np.argsort(-sims[pos])]
+            tone_values = world["emotions"][q["tone"]] if q["tone"] else None
+            if ranker is None:
+                if name == "semantic+tone_sort" and tone_values is not None:
+                    pos = pos[np.argsort(-tone_values[pos], kind="stable")]
+                ranked = pos[:top_k]
+            else:
+                ranked, _, info = ranker.rank(pos, cf_lookup, tone_values, top_k=top_k, started=started)
+                truncated += info["truncated"]
+            latency.append((time.perf_counter() - started) * 1000)
+            ndcg.append(ndcg_at(ranked, q["relevant"], 10))
+            recall.append(np.isin(q["relevant"], ranked).mean())
+        lat = np.array(latency)
+        report[name] = {"ndcg@10": float(np.mean(ndcg)), f"recall@{top_k}": float(np.mean(recall)),
+                        "p50_ms": float(np.percentile(lat, 50)), "p95_ms": float(np.percentile(lat, 95)),
+                        "budget_truncated": truncated}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá offline xếp hạng lai (chất lượng + độ trễ)")
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ratings-per-user", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--embed-noise", type=float, default=1.0, help="Độ sai của embedding so với chủ đề thật")
+    parser.add_argument("--query-noise", type=float, default=0.5)
+    parser.add_argument("--tone-strength", type=float, default=0.3, help="Mức Tone ảnh hưởng tới độ liên quan thật")
+    parser.add_argument("--candidates", type=int, default=100, help="Số ứng viên lấy từ vector search")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--cf-weight", type=float, default=0.5)
+    parser.add_argument("--tone-weight", type=float, default=0.5)
+    parser.add_argument("--cf-seeds", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+
+    print(f"⏳ Dựng thế giới giả lập: {args.books:,} sách, {args.users:,} user...")
+    world = make_world(args.books, args.users, args.ratings_per_user, args.dim, args.embed_noise, args.seed)
+    queries = make_queries(world, args.queries, args.dim, args.query_noise, args.tone_strength, args.top_k, args.seed)
+    rankers = {method: HybridRanker(method=method, cf_weight=args.cf_weight, tone_weight=args.tone_weight,
+                                    cf_seeds=args.cf_seeds, budget_ms=args.budget_ms)
+               for method in ("weighted", "rrf")}
+    report = evaluate(world, queries, rankers, args.candidates, args.top_k)
+
+    print(f"{'cách xếp hạng':<20} {'nDCG@10':>8} {f'recall@{args.top_k}':>10} {'p50 ms':>8} {'p95 ms':>8} {'hết NS':>7}")
+    for name, r in report.items():
+        print(f"{name:<20} {r['ndcg@10']:8.3f} {r[f'recall@{args.top_k}']:10.3f} "
+              f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['budget_truncated']:7d}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": report}, f, indent=1)
+        print(f"📝 Đã ghi báo cáo '{args.json}'")
+
+
+if __name__ == "__main__":
+    main()
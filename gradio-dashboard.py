@@ -1,177 +1,311 @@
+import asyncio
+import threading
+import time
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 import os
-import sqlite3
 import gradio as gr
 
-from langchain_community.document_loaders import TextLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
+from catalog_index import CatalogIndex, PLACEHOLDER
+from catalog_store import read_books
+from cover_cache import COVER_CACHE_DIR, CoverCache, start_flusher
+from cf_engine import CFEngine, NeighborTable, NEIGHBORS_DIR
+from cf_online import OnlineCF, RatingLog, RATINGS_LOG, SNAPSHOT_DIR as CF_SNAPSHOT_DIR
+from history_store import get_store
+import metrics
+from metrics import LatencyTracker
+from query_cache import SearchCache
+from ranking import HybridRanker, TONE_COLUMNS
+from startup import StagedStartup
+from user_profiles import get_profiles, profiles_path_for
+from vector_index import VectorIndex, vector_index_dir_for, is_fresh as vector_index_is_fresh
+from vector_ingest import MODEL_NAME, make_embedding_model, manifest_path
 
 # --- CẤU HÌNH ĐƯỜNG DẪN (FIX LỖI WINDOWS/ONEDRIVE) ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# BOOKREC_DATA_DIR: đọc dữ liệu ở thư mục khác (vd. bộ dữ liệu giả lập của bench_suite.py)
+BASE_DIR = os.getenv("BOOKREC_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
 def get_abs_path(filename):
     return os.path.join(BASE_DIR, filename)
 
 # --- 1. DATABASE LỊCH SỬ ---
+# Dùng HistoryStore (pool kết nối + WAL + ghi nền theo lô) thay vì connect mỗi lần gọi
+# Hồ sơ sở thích (user_profiles.db cạnh user_history.db): trung bình embedding các query đã tìm,
+# trọng số giảm một nửa sau PROFILE_HALF_LIFE_DAYS ngày -> fallback chỉ tra một vector tính sẵn.
+history_store = None
+profile_store = None
+
 def init_db():
+    global history_store, profile_store
+    try:
+        history_store = get_store(get_abs_path('user_history.db'))
+    except Exception as e: print(f"Lỗi khởi tạo DB lịch sử: {e}")
     try:
-        conn = sqlite3.connect(get_abs_path('user_history.db'))
-        c = conn.cursor()
-        # Tạo bảng có thêm cột top_book
-        c.execute('''CREATE TABLE IF NOT EXISTS search_history 
-                     (id INTEGER PRIMARY KEY, user_id TEXT, query TEXT, top_book TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-        conn.commit()
-        conn.close()
-    except: pass
+        profile_store = get_profiles(profiles_path_for(get_abs_path('user_history.db')), EMBEDDING_MODEL,
+                                     half_life=float(os.getenv("PROFILE_HALF_LIFE_DAYS", "7")) * 86400)
+    except Exception as e: print(f"Lỗi khởi tạo hồ sơ user: {e}")
 
 def log_search(user_id, query, top_book_title):
     try:
-        conn = sqlite3.connect(get_abs_path('user_history.db'))
-        c = conn.cursor()
-        if query.strip():
-            # Lưu cả query và tên sách Top 1
-            c.execute("INSERT INTO search_history (user_id, query, top_book) VALUES (?, ?, ?)", 
-                      (user_id, query, top_book_title))
-            conn.commit()
-        conn.close()
-    except Exception as e: print(f"Lỗi log: {e}")
+        startup.wait("history")
+        if history_store and query.strip():
+            # Lưu cả query và tên sách Top 1 (commit ở thread nền)
+            with metrics.timer("db_log"):
+                history_store.log_search(user_id, query, top_book_title)
+    except Exception as e: metrics.error(f"Lỗi log: {e}")
+
+def update_profile(user_id, query):
+    """Cộng embedding của query (thường đã có trong cache tìm kiếm) vào hồ sơ của user.
+    Gọi sau khi đã tính xong fallback của request: query vừa gõ không tính là sở thích "gần đây"
+    của chính request đó (giống get_recent_interests bỏ qua current_query)."""
+    try:
+        startup.wait("history")
+        if profile_store is None or not query.strip() or not startup.is_ready("embedding"): return
+        with metrics.timer("profile_update"):
+            profile_store.update(user_id, search_cache.embedding(query, embed_query))
+    except Exception as e: metrics.error(f"Lỗi cập nhật hồ sơ user: {e}")
+
+def get_profile_vector(user_id):
+    try:
+        startup.wait("history")
+        if not profile_store: return None
+        return profile_store.get(user_id)
+    except Exception as e:
+        metrics.error(f"Lỗi đọc hồ sơ user: {e}")
+        return None
 
 def get_recent_interests(user_id, current_query="", limit=3):
     # Hàm này giữ nguyên để phục vụ gợi ý
     try:
-        conn = sqlite3.connect(get_abs_path('user_history.db'))
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT query FROM search_history WHERE user_id = ? AND query != ? ORDER BY id DESC LIMIT ?", (user_id, current_query, limit))
-        rows = c.fetchall()
-        conn.close()
-        return [row[0] for row in rows]
+        startup.wait("history")
+        if not history_store: return []
+        return history_store.get_recent_interests(user_id, current_query, limit)
     except: return []
 
 def get_history_logs(user_id="guest", limit=10):
     """Hàm lấy lịch sử SÁCH TOP 1 để hiển thị"""
     try:
-        conn = sqlite3.connect(get_abs_path('user_history.db'))
-        c = conn.cursor()
-        # Lấy thời gian và Tên sách (top_book) thay vì query
-        c.execute("SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp), top_book FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
-        rows = c.fetchall()
-        conn.close()
-        return rows 
+        startup.wait("history")
+        if not history_store: return []
+        with metrics.timer("history_read"):
+            return history_store.get_history_logs(user_id, limit)
     except: return []
 
 # --- 2. HỆ THỐNG COLLABORATIVE FILTERING ---
-cf_model = None
-book_pivot = None
-book_index_map = None 
+# Ưu tiên bảng láng giềng tính sẵn (build_cf_neighbors.py, memory-map, không gọi sklearn).
+# Nếu chưa có hoặc đã cũ hơn ratings.csv thì dựng CFEngine (CSR thẳng từ ratings.csv).
+# CF_ONLINE=1 (mặc định): OnlineCF đọc rating mới từ ratings_log.db mỗi CF_POLL_INTERVAL giây,
+# chỉ cập nhật láng giềng của các sách bị ảnh hưởng, gộp snapshot mỗi CF_COMPACT_INTERVAL giây.
+CF_ONLINE = os.getenv("CF_ONLINE", "1") == "1"
+cf_engine = None
+rating_log = None
 
 def init_collaborative_filtering():
-    global cf_model, book_pivot, book_index_map
+    global cf_engine, rating_log
     print("🔄 Đang khởi tạo Collaborative Filtering...")
     ratings_path = get_abs_path("ratings.csv")
+    neighbors_dir = get_abs_path(NEIGHBORS_DIR)
     
     if not os.path.exists(ratings_path):
         print("⚠️ Không tìm thấy ratings.csv -> Bỏ qua CF.")
         return
 
     try:
-        # Ép kiểu dữ liệu isbn thành string ngay từ đầu
-        df_ratings = pd.read_csv(ratings_path, dtype={'isbn': str, 'user_id': str})
-        
-        # Xử lý sạch ISBN (bỏ .0 nếu có)
-        df_ratings['isbn'] = df_ratings['isbn'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-        
-        book_pivot = df_ratings.pivot_table(index='isbn', columns='user_id', values='rating').fillna(0)
-        book_index_map = {isbn: i for i, isbn in enumerate(book_pivot.index)}
-        book_sparse = csr_matrix(book_pivot.values)
-        cf_model = NearestNeighbors(metric='cosine', algorithm='brute')
-        cf_model.fit(book_sparse)
-        print(f"✅ CF Model OK! ({len(book_pivot)} sách trong hệ thống gợi ý)")
+        if CF_ONLINE:
+            rating_log = RatingLog(get_abs_path(RATINGS_LOG))
+            snapshot_dir = get_abs_path(CF_SNAPSHOT_DIR)
+            cf_engine = OnlineCF.open(ratings_path, snapshot_dir, rating_log, neighbors_dir)
+            cf_engine.start(rating_log, snapshot_dir, neighbors_dir, ratings_path,
+                            poll_interval=float(os.getenv("CF_POLL_INTERVAL", "1")),
+                            compact_interval=float(os.getenv("CF_COMPACT_INTERVAL", "600")))
+            print(f"✅ CF Model OK! (trực tuyến, {len(cf_engine)} sách, tới sự kiện #{cf_engine.last_event_id})")
+            return
+        if NeighborTable.matches_ratings(neighbors_dir, ratings_path):
+            cf_engine = NeighborTable.load(neighbors_dir)
+            print(f"✅ CF Model OK! (bảng láng giềng tính sẵn, {len(cf_engine)} sách)")
+            return
+        cf_engine = CFEngine.from_csv(ratings_path)
+        print(f"✅ CF Model OK! ({len(cf_engine)} sách trong hệ thống gợi ý)")
     except Exception as e:
         print(f"❌ Lỗi khởi tạo CF: {e}")
 
+def rate_books(events):
+    """Ghi các (user_id, isbn, rating) vào nhật ký; CF trực tuyến áp dụng ở lần đọc log kế tiếp"""
+    startup.wait("cf")
+    if rating_log is None:
+        raise RuntimeError("CF trực tuyến đang tắt (CF_ONLINE=0) hoặc chưa có ratings.csv")
+    return rating_log.append_many(events)
+
 def get_collaborative_recs(isbn, n_neighbors=6):
-    if cf_model is None or book_index_map is None: return []
-    
-    # Chuẩn hóa input ISBN
-    isbn = str(isbn).replace(".0", "").strip()
-    
-    if isbn not in book_index_map:
-        # print(f"DEBUG: ISBN {isbn} không có trong dữ liệu ratings")
-        return []
+    startup.wait("cf")
+    if cf_engine is None: return []
     try:
-        query_index = book_index_map[isbn]
-        distances, indices = cf_model.kneighbors(book_pivot.iloc[query_index, :].values.reshape(1, -1), n_neighbors=n_neighbors)
-        
-        recs = []
-        for i in range(1, len(distances.flatten())):
-            idx = indices.flatten()[i]
-            recs.append(book_pivot.index[idx])
-        return recs
+        return cf_engine.recommend(isbn, n_neighbors=n_neighbors)
     except: return []
 
-# --- 3. KHỞI ĐỘNG ---
+# --- 3. KHỞI ĐỘNG (THEO GIAI ĐOẠN, CHẠY NỀN) ---
+# Các thành phần nặng được nạp trong thread nền ngay khi import; UI bind ngay lập tức.
+# Request nào cần thành phần chưa xong sẽ chờ stage đó (startup.wait).
 print("🚀 Đang khởi động ứng dụng...")
-init_db()
-init_collaborative_filtering()
 load_dotenv()
+startup = StagedStartup()
 
-# LOAD SÁCH (CỰC KỲ QUAN TRỌNG: ÉP KIỂU STRING)
-csv_path = get_abs_path("books_with_emotions.csv")
-if not os.path.exists(csv_path): csv_path = get_abs_path("books_cleaned.csv")
+books = None
+catalog = None
+embedding_model = None
+db_books = None
+vector_index = None
+CATEGORY_PREFILTER = False
+PERSIST_DIR = get_abs_path("chroma_db")
+# "local": tìm trên ma trận embedding memory-map (chroma_db.vectors/, trả thẳng ISBN);
+# thiếu/cũ thì tự quay về Chroma. "chroma": luôn qua wrapper LangChain như trước.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "local")
+# Cách tìm trên index local: "auto" (bản nén nếu reset_all_data.py --quantization, HNSW nếu lớn),
+# hoặc ép "exact" / "hnsw" / "int8" / "pq". VECTOR_RERANK: số ứng viên tính lại chính xác = k * hệ số
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", "4"))
+# "hash" = embedding thay thế chạy offline (hash_embedding.py), index phải dựng bằng cùng model
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", MODEL_NAME)
+
+# Ảnh bìa: tải về, thu nhỏ cỡ gallery và phục vụ từ cover_cache/ (COVER_CACHE=0: trả URL gốc như cũ).
+# COVER_PREFETCH=1: tải trước ảnh của cả catalogue ở thread nền sau khi nạp sách
+COVER_CACHE = os.getenv("COVER_CACHE", "1") == "1"
+cover_cache = None
+if COVER_CACHE:
+    # Gradio chỉ phục vụ file nằm trong thư mục được cho phép -> khai báo trước khi dựng UI
+    gr.set_static_paths(paths=[get_abs_path(COVER_CACHE_DIR)])
+
+startup.stage("history")(init_db)
+startup.stage("cf")(init_collaborative_filtering)
+
+@startup.stage("catalog")
+def load_books():
+    global books, catalog
+    # LOAD SÁCH (CỰC KỲ QUAN TRỌNG: ÉP KIỂU STRING)
+    csv_path = get_abs_path("books_with_emotions.csv")
+    if not os.path.exists(csv_path): csv_path = get_abs_path("books_cleaned.csv")
 
-try:
-    # dtype={'isbn13': str} là chìa khóa để sửa lỗi tìm kiếm
-    books = pd.read_csv(csv_path, dtype={'isbn13': str})
-    
-    # Chuẩn hóa cột ISBN một lần nữa cho chắc chắn
-    if "isbn13" in books.columns:
-        books["isbn13"] = books["isbn13"].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-    
-    if "large_thumbnail" not in books.columns:
-        books["large_thumbnail"] = books["thumbnail"]
+    try:
+        # Catalogue nhị phân (memory-map, isbn13 đã chuẩn hóa); tự build lại nếu CSV đổi
+        df = read_books(csv_path)
         
-    print(f"✅ Đã load {len(books)} cuốn sách vào bộ nhớ.")
-except Exception as e:
-    print(f"❌ LỖI KHÔNG ĐỌC ĐƯỢC FILE SÁCH: {e}")
-    exit()
+        if "large_thumbnail" not in df.columns:
+            df["large_thumbnail"] = df["thumbnail"]
 
-# LOAD VECTOR DB
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-PERSIST_DIR = get_abs_path("chroma_db")
-db_books = None
-
-if os.path.exists(PERSIST_DIR):
+        # Chỉ mục theo isbn13 + caption/ảnh bìa tính sẵn (index của books = vị trí trong catalog)
+        catalog = CatalogIndex(df)
+        books = catalog.books
+            
+        print(f"✅ Đã load {len(books)} cuốn sách vào bộ nhớ.")
+    except Exception as e:
+        print(f"❌ LỖI KHÔNG ĐỌC ĐƯỢC FILE SÁCH: {e}")
+        raise
+
+@startup.stage("covers", deps=["catalog"])
+def load_cover_cache():
+    global cover_cache
+    if not COVER_CACHE: return
+    workers = int(os.getenv("COVER_WORKERS", "8"))
+    placeholder = get_abs_path(PLACEHOLDER)
+    if not os.path.exists(placeholder):
+        placeholder = os.path.join(os.path.dirname(os.path.abspath(__file__)), PLACEHOLDER)
+    cache = CoverCache(get_abs_path(COVER_CACHE_DIR), placeholder=placeholder,
+                       max_bytes=int(os.getenv("COVER_CACHE_MB", "512")) * 2**20, workers=workers)
+    start_flusher(cache)
+    for key in ("hit_rate", "files", "bytes", "not_found", "errors", "evicted", "dropped"):
+        metrics.REGISTRY.gauge(f"cover_cache_{key}", lambda k=key: cover_cache.stats()[k])
+    cover_cache = cache
+    stats = cache.stats()
+    print(f"✅ Cache ảnh bìa: {stats['files']} file, {stats['bytes'] / 2**20:.1f} MB")
+    if os.getenv("COVER_PREFETCH", "0") == "1":
+        # block=True: hàng đợi có giới hạn làm nhịp, request vẫn xếp hàng tải được (bỏ qua nếu đầy)
+        threading.Thread(target=cache.prefetch, args=(catalog.thumbnails.tolist(), True),
+                         name="cover-prefetch", daemon=True).start()
+
+def index_has_categories():
+    """Index dựng bởi reset_all_data.py bản mới có simple_categories trong metadata"""
+    try:
+        sample = db_books.get(limit=1, include=["metadatas"])
+        return bool(sample["metadatas"]) and "simple_categories" in sample["metadatas"][0]
+    except Exception:
+        return False
+
+@startup.stage("embedding")
+def load_embedding_model():
+    global embedding_model
+    # torch/transformers được import muộn trong make_embedding_model, không chặn lúc import module.
+    # Bọc cache embedding trên đĩa (dùng chung thư mục với reset_all_data.py)
+    embedding_model = make_embedding_model(EMBEDDING_MODEL, cache_dir=get_abs_path("embedding_cache"))
+
+def load_local_index():
+    """Nạp vector index memory-map nếu đã export từ đúng phiên bản chroma_db hiện tại"""
+    global vector_index, CATEGORY_PREFILTER
+    index_dir = vector_index_dir_for(PERSIST_DIR)
+    if not vector_index_is_fresh(PERSIST_DIR, index_dir):
+        print("⚠️ Chưa có vector index local (hoặc đã cũ) -> dùng ChromaDB. Chạy vector_index.py để export.")
+        return False
+    index = VectorIndex.load(index_dir, backend=VECTOR_BACKEND, rerank=VECTOR_RERANK)
+    # Làm nóng model + page của ma trận
+    index.search(embedding_model.embed_query("test"), 1)
+    vector_index = index
+    CATEGORY_PREFILTER = index.has_categories
+    print(f"✅ Vector index local: {len(index)} vector ({index.backend})")
+    return True
+
+@startup.stage("vector_db", deps=["embedding"])
+def load_vector_db():
+    global db_books, CATEGORY_PREFILTER
+    if RETRIEVAL_BACKEND == "local":
+        try:
+            if load_local_index(): return
+        except Exception as e:
+            print(f"⚠️ Lỗi nạp vector index local: {e} -> dùng ChromaDB.")
+    from langchain_chroma import Chroma
+    if not os.path.exists(PERSIST_DIR):
+        print("❌ Không tìm thấy thư mục chroma_db. Hãy chạy reset_all_data.py trước!")
+        raise FileNotFoundError(PERSIST_DIR)
     try:
         db_books = Chroma(persist_directory=PERSIST_DIR, embedding_function=embedding_model)
-        # Test connection
+        # Test connection (đồng thời làm nóng model + index, giờ chạy nền)
         db_books.similarity_search("test", k=1)
         print("✅ Kết nối ChromaDB thành công!")
+        CATEGORY_PREFILTER = index_has_categories()
+        if not CATEGORY_PREFILTER:
+            print("⚠️ Index chưa có metadata thể loại -> lọc sau. Chạy lại reset_all_data.py để lọc trước.")
     except Exception as e:
         print(f"⚠️ Lỗi kết nối DB: {e}")
-        # Fallback RAM mode...
-else:
-    print("❌ Không tìm thấy thư mục chroma_db. Hãy chạy reset_all_data.py trước!")
-
-# --- 4. LOGIC TÌM KIẾM (CÓ DEBUG LOG) ---
-def retrieve_semantic_recommendations(query, category="All", tone="All", top_k=100):
-    if not db_books: return pd.DataFrame()
-    
-    print(f"\n🔎 [DEBUG] Đang tìm kiếm: '{query}'")
-    
-    # 1. Tìm trong Vector DB
-    try:
-        recs = db_books.similarity_search(query, k=top_k)
-        print(f"   -> Tìm thấy {len(recs)} vector tương đồng.")
-    except Exception as e:
-        print(f"   -> Lỗi vector search: {e}")
-        return pd.DataFrame()
-
-    # 2. Trích xuất ISBN
+        raise
+
+startup.on_complete(startup.report)
+startup.start()
+
+# Ghi metrics JSON định kỳ (METRICS_DUMP=đường dẫn) + profiler lấy mẫu (PROFILE_SAMPLING=1), đều tùy chọn
+if os.getenv("METRICS_DUMP"):
+    metrics.REGISTRY.start_json_dump(os.getenv("METRICS_DUMP"), float(os.getenv("METRICS_DUMP_INTERVAL", "60")))
+profiler = metrics.profiler_from_env()
+
+def get_health():
+    """Trạng thái + thời gian nạp của từng thành phần"""
+    return startup.status()
+
+# --- 4. LOGIC TÌM KIẾM (ĐO THỜI GIAN TỪNG STAGE) ---
+# Mỗi stage (embed, ann_search, isbn_extract, catalog_join, filter, rank, format, cf, db_log...)
+# ghi vào histogram của metrics.py, xem ở /metrics (Prometheus) hoặc /metrics.json.
+# Log từng request chỉ in khi LOG_LEVEL=debug.
+# Cache LRU/TTL cho embedding của query và danh sách ISBN của vector search
+search_cache = SearchCache(maxsize=1024, ttl=3600)
+for _layer in ("embeddings", "results"):
+    metrics.REGISTRY.gauge(f"search_cache_{_layer}_hit_rate", lambda l=_layer: search_cache.stats()[l]["hit_rate"])
+    metrics.REGISTRY.gauge(f"search_cache_{_layer}_size", lambda l=_layer: search_cache.stats()[l]["size"])
+
+def get_index_version():
+    """Phiên bản index = mtime của manifest (reset_all_data.py ghi lại mỗi lần dựng/đồng bộ)"""
+    for path in (manifest_path(PERSIST_DIR), os.path.join(PERSIST_DIR, "chroma.sqlite3")):
+        if os.path.exists(path):
+            return os.path.getmtime(path)
+    return None
+
+def extract_isbns(recs):
     isbn_list = []
     for i, rec in enumerate(recs):
         # Ưu tiên lấy từ metadata (do reset_all_data.py tạo ra)
@@ -187,113 +321,309 @@ def retrieve_semantic_recommendations(query, category="All", tone="All", top_k=1
             val = str(val).replace(".0", "").strip()
             if val.isdigit(): 
                 isbn_list.append(val)
+    return isbn_list
+
+def search_isbns(query, top_k, category=None):
+    """Vector search (qua cache) -> danh sách ISBN theo thứ tự tương đồng.
+    Có category thì lọc ngay trong Chroma theo metadata simple_categories."""
+    search_cache.check_version(get_index_version())
+    return search_cache.search(query, top_k, embed=embed_query, search_by_vector=search_by_vector, category=category)
+
+def embed_query(text):
+    with metrics.timer("embed"):
+        return embedding_model.embed_query(text)
+
+def search_by_vector(vector, k, cat=None):
+    """Vector search thẳng bằng vector (không qua cache) -> danh sách ISBN"""
+    if vector_index is not None:
+        # Index local trả thẳng ISBN, không có bước trích xuất
+        with metrics.timer("ann_search"):
+            return vector_index.search(vector, k, cat).tolist()
+    where = {"simple_categories": cat} if cat else None
+    with metrics.timer("ann_search"):
+        recs = db_books.similarity_search_by_vector(list(map(float, vector)), k=k, filter=where)
+    with metrics.timer("isbn_extract"):
+        return extract_isbns(recs)
+
+def get_cache_stats():
+    return search_cache.stats()
+
+def semantic_positions(query, category="All", top_k=100):
+    """Vector search -> vị trí trong catalog theo thứ tự tương đồng, đã lọc thể loại (None nếu lỗi)"""
+    metrics.debug(f"\n🔎 [DEBUG] Đang tìm kiếm: '{query}'")
+    
+    # 1-2. Tìm trong Vector DB + trích xuất ISBN (có cache)
+    # Lọc thể loại ngay trong vector search -> luôn có đủ top_k kết quả đúng thể loại.
+    # Index cũ chưa có metadata thể loại thì vẫn lọc sau như trước.
+    prefilter = category if category != "All" and CATEGORY_PREFILTER else None
+    try:
+        isbn_list = search_isbns(query, top_k, prefilter)
+    except Exception as e:
+        metrics.inc("vector_search_errors")
+        metrics.error(f"   -> Lỗi vector search: {e}")
+        return None
     
     # In ra vài ISBN đầu tiên để kiểm tra
     if isbn_list:
-        print(f"   -> Trích xuất được {len(isbn_list)} ISBN hợp lệ. Ví dụ: {isbn_list[:3]}")
+        metrics.debug(f"   -> Trích xuất được {len(isbn_list)} ISBN hợp lệ. Ví dụ: {isbn_list[:3]}")
     else:
-        print("   -> ⚠️ CẢNH BÁO: Không trích xuất được ISBN nào từ kết quả vector!")
-        return pd.DataFrame()
-
-    # 3. Đối chiếu với DataFrame Books
-    # Lọc những ISBN có tồn tại trong file CSV
-    book_recs = books[books["isbn13"].isin(isbn_list)].copy()
-    print(f"   -> Khớp được {len(book_recs)} cuốn sách trong file CSV.")
+        metrics.inc("empty_results")
+        metrics.debug("   -> ⚠️ CẢNH BÁO: Không trích xuất được ISBN nào từ kết quả vector!")
+        return None
 
-    # Sắp xếp theo đúng thứ tự tìm kiếm (quan trọng)
-    if not book_recs.empty:
-        book_recs = book_recs.set_index("isbn13")
-        # Chỉ giữ lại những isbn có trong list tìm kiếm và sắp xếp theo thứ tự đó
-        valid_isbns = [i for i in isbn_list if i in book_recs.index]
-        book_recs = book_recs.reindex(valid_isbns).reset_index()
+    # 3. Đối chiếu với catalog: gather theo vị trí, giữ đúng thứ tự tìm kiếm
+    with metrics.timer("catalog_join"):
+        pos = catalog.positions(isbn_list)
+    metrics.debug(f"   -> Khớp được {len(pos)} cuốn sách trong file CSV.")
 
     # 4. Lọc Category
-    if category != "All" and "simple_categories" in book_recs.columns:
-        original_count = len(book_recs)
-        book_recs = book_recs[book_recs["simple_categories"] == category]
-        print(f"   -> Sau khi lọc Category '{category}': còn {len(book_recs)}/{original_count} cuốn.")
+    if category != "All" and catalog.has("simple_categories"):
+        original_count = len(pos)
+        with metrics.timer("filter"):
+            pos = pos[catalog.column("simple_categories")[pos] == category]
+        metrics.debug(f"   -> Sau khi lọc Category '{category}': còn {len(pos)}/{original_count} cuốn.")
+    return pos
+
+def retrieve_semantic_recommendations(query, category="All", tone="All", top_k=100):
+    if not (startup.wait("vector_db") and startup.wait("catalog")): return pd.DataFrame()
+    pos = semantic_positions(query, category, top_k)
+    if pos is None: return pd.DataFrame()
 
     # 5. Lọc Tone
     if tone != "All":
-        tone_map = {"Happy": "joy", "Surprising": "surprise", "Angry": "anger", "Suspenseful": "fear", "Sad": "sadness"}
-        col = tone_map.get(tone)
-        if col and col in book_recs.columns:
-            book_recs = book_recs.sort_values(by=col, ascending=False)
-            print(f"   -> Đã sắp xếp lại theo cảm xúc '{tone}'.")
-
-    return book_recs
+        col = TONE_COLUMNS.get(tone)
+        if col and catalog.has(col):
+            with metrics.timer("filter"):
+                pos = pos[np.argsort(-catalog.column(col)[pos], kind="stable")]
+            metrics.debug(f"   -> Đã sắp xếp lại theo cảm xúc '{tone}'.")
+
+    return catalog.frame(pos)
+
+# Xếp hạng lai: ứng viên ngữ nghĩa + láng giềng CF của 5 kết quả đầu + độ hợp Tone, gộp điểm
+# trong ngân sách 200ms. HYBRID_RANKING = False để quay lại kiểu cũ (Tone sắp xếp lại toàn bộ).
+HYBRID_RANKING = True
+ranker = HybridRanker(method="weighted", semantic_weight=1.0, cf_weight=0.5, tone_weight=0.5,
+                      cf_seeds=5, budget_ms=200)
+
+def cf_positions(pos):
+    """Láng giềng CF của sách tại vị trí pos -> vị trí trong catalog"""
+    return catalog.positions(get_collaborative_recs(str(catalog.column("isbn13")[pos])))
+
+def retrieve_hybrid_recommendations(query, category="All", tone="All", top_k=100):
+    started = time.perf_counter()
+    if not (startup.wait("vector_db") and startup.wait("catalog")): return pd.DataFrame()
+    pos = semantic_positions(query, category, top_k)
+    if pos is None: return pd.DataFrame()
+
+    col = TONE_COLUMNS.get(tone)
+    tone_values = catalog.column(col) if col and catalog.has(col) else None
+    allowed = None
+    if category != "All" and catalog.has("simple_categories"):
+        # Láng giềng CF cũng phải đúng thể loại đã chọn
+        allowed = catalog.column("simple_categories") == category
+
+    with metrics.timer("rank"):
+        pos, _, info = ranker.rank(pos, cf_lookup=cf_positions if startup.is_ready("cf") else None,
+                                   tone_values=tone_values, allowed=allowed, top_k=top_k, started=started)
+    if info["truncated"]: metrics.inc("rank_budget_exhausted")
+    metrics.debug(f"   -> [RANK] {ranker.method}: {len(pos)} kết quả, CF từ {info['cf_seeds_used']} sách, "
+          f"{info['elapsed_ms']:.0f}ms{' (hết ngân sách)' if info['truncated'] else ''}")
+    return catalog.frame(pos)
+
+def primary_recommendations(query, category, tone):
+    if HYBRID_RANKING:
+        return retrieve_hybrid_recommendations(query, category, tone)
+    return retrieve_semantic_recommendations(query, category, tone)
 
 def format_results(df):
-    results = []
-    if df.empty: return results
-    for _, row in df.iterrows():
-        title = str(row['title'])
-        authors = str(row['authors']) if pd.notna(row['authors']) else "Unknown"
-        # Xử lý mô tả ngắn
-        desc = str(row.get('description', ''))
-        trunc_desc = " ".join(desc.split()[:20]) + "..."
-        
-        caption = f"{title}\nby {authors}\n\n{trunc_desc}"
-        img = row["large_thumbnail"] if pd.notna(row["large_thumbnail"]) else "cover-not-found.jpg"
-        results.append((img, caption))
-    return results
-
-def recommend_books(query, category, tone):
-    # 1. Content-Based Search (Tìm kiếm nội dung trước)
-    content_df = retrieve_semantic_recommendations(query, category, tone)
-    current_results = format_results(content_df)
+    # df luôn là một phần của books (index = vị trí trong catalog) -> lấy caption/ảnh tính sẵn
+    if df.empty: return []
+    with metrics.timer("format"):
+        items = catalog.gallery(df.index.to_numpy())
+        # Ảnh đã có trong cache -> file cục bộ đã thu nhỏ; chưa có -> URL gốc + xếp hàng tải nền
+        return cover_cache.gallery(items) if cover_cache is not None else items
+
+def cf_secondary(content_df):
+    """Gợi ý từ cộng đồng cho cuốn Top 1 -> (gallery, tiêu đề) hoặc ([], "")"""
+    if content_df.empty: return [], ""
+    top_isbn = str(content_df.iloc[0]['isbn13'])
+    top_title = str(content_df.iloc[0]['title'])
     
-    top_book_log = "Không tìm thấy"
-    if not content_df.empty:
-        # Lấy tiêu đề cuốn sách đầu tiên tìm thấy
-        top_book_log = str(content_df.iloc[0]['title'])
+    metrics.debug(f"🔗 [CF] Đang tìm sách liên quan đến: {top_title} ({top_isbn})")
+    with metrics.timer("cf"):
+        cf_isbns = get_collaborative_recs(top_isbn)
     
-    user_id = "guest"
-    # Gọi hàm log với ĐỦ 3 THAM SỐ
-    log_search(user_id, query, top_book_log)
+    if cf_isbns:
+        # Giữ thứ tự xếp hạng của CF
+        cf_df = catalog.frame(catalog.positions(cf_isbns))
+        if not cf_df.empty:
+            return format_results(cf_df), f"Vì bạn quan tâm '{top_title}' (Cộng đồng cũng đọc)"
+    return [], ""
+
+def history_fallback_df(user_id, query, top_k=100):
+    """Sách gần hồ sơ sở thích của user nhất (một lần tra vector, không embed lại).
+    User chưa có hồ sơ (lịch sử từ trước khi có user_profiles.db) thì tìm theo các query gần đây."""
+    if not (startup.wait("vector_db") and startup.wait("catalog")): return pd.DataFrame()
+    vector = get_profile_vector(user_id)
+    if vector is None:
+        recent = get_recent_interests(user_id, query)
+        if not recent: return pd.DataFrame()
+        metrics.inc("profile_miss")
+        return retrieve_semantic_recommendations(" ".join(recent), top_k=50)
+    metrics.inc("profile_hit")
+    try:
+        isbns = search_by_vector(vector, top_k)
+    except Exception as e:
+        metrics.error(f"   -> Lỗi tìm theo hồ sơ user: {e}")
+        return pd.DataFrame()
+    with metrics.timer("catalog_join"):
+        return catalog.frame(catalog.positions(isbns))
+
+def fallback_secondary(hist_df, content_df=None):
+    """Fallback lịch sử (bỏ sách đã có trong kết quả chính), không có thì ngẫu nhiên -> (gallery, tiêu đề)"""
+    if not startup.wait("catalog"): return [], ""
+    if content_df is not None and not hist_df.empty:
+        hist_df = hist_df[~hist_df.index.isin(content_df.index)]
+    if not hist_df.empty:
+        return format_results(hist_df.head(8)), "Dựa trên lịch sử tìm kiếm gần đây"
+    return format_results(books.sample(8)), "Có thể bạn sẽ thích (Ngẫu nhiên)"
+
+def top_book_title(content_df):
+    # Lấy tiêu đề cuốn sách đầu tiên tìm thấy
+    return "Không tìm thấy" if content_df.empty else str(content_df.iloc[0]['title'])
+
+# Đo p50/p95 end-to-end, in tóm tắt sau mỗi 50 request
+sync_latency = LatencyTracker("recommend_books")
+async_latency = LatencyTracker("recommend_books_async")
 
-    # 2. Collaborative Filtering (Gợi ý từ cộng đồng)
-    secondary_results = []
-    msg = ""
-    
-    if not content_df.empty:
-        top_isbn = str(content_df.iloc[0]['isbn13'])
-        top_title = str(content_df.iloc[0]['title'])
-        
-        print(f"🔗 [CF] Đang tìm sách liên quan đến: {top_title} ({top_isbn})")
-        cf_isbns = get_collaborative_recs(top_isbn)
-        
-        if cf_isbns:
-            cf_df = books[books['isbn13'].isin(cf_isbns)]
-            if not cf_df.empty:
-                secondary_results = format_results(cf_df)
-                msg = f"Vì bạn quan tâm '{top_title}' (Cộng đồng cũng đọc)"
-
-    # 3. Fallback History / Random (Nếu không tìm thấy gì)
-    if not secondary_results:
-        print("⚠️ Fallback: Dùng lịch sử hoặc Random.")
+def recommend_books(query, category, tone):
+    with sync_latency.track():
+        # 1. Content-Based Search (Tìm kiếm nội dung trước)
+        content_df = primary_recommendations(query, category, tone)
+        current_results = format_results(content_df)
         
-        recent = get_recent_interests(user_id, query)
-        if recent:
-            hist_query = " ".join(recent)
-            hist_df = retrieve_semantic_recommendations(hist_query, top_k=50)
-            if not hist_df.empty:
-                secondary_results = format_results(hist_df.sample(frac=1).head(8))
-                msg = "Dựa trên lịch sử tìm kiếm gần đây"
-    
-    if not secondary_results:
-         secondary_results = format_results(books.sample(8))
-         msg = "Có thể bạn sẽ thích (Ngẫu nhiên)"
+        user_id = "guest"
+        # Gọi hàm log với ĐỦ 3 THAM SỐ
+        log_search(user_id, query, top_book_title(content_df))
+
+        # 2. Collaborative Filtering (Gợi ý từ cộng đồng)
+        secondary_results, msg = cf_secondary(content_df)
+
+        # 3. Fallback History / Random (Nếu không tìm thấy gì)
+        if not secondary_results:
+            metrics.inc("fallback")
+            metrics.debug("⚠️ Fallback: Dùng lịch sử hoặc Random.")
+            secondary_results, msg = fallback_secondary(history_fallback_df(user_id, query), content_df)
 
-    # 4. Lấy lại lịch sử mới nhất để cập nhật UI
-    updated_history = get_history_logs(user_id)
+        # 4. Lấy lại lịch sử mới nhất để cập nhật UI
+        updated_history = get_history_logs(user_id)
 
+    # Hồ sơ sở thích cập nhật sau cùng (fallback ở trên chưa tính query này)
+    update_profile(user_id, query)
     return current_results, secondary_results, msg, updated_history
 
+# Chạy trước tìm kiếm fallback (lịch sử) song song với tìm kiếm chính; tắt nếu muốn tiết kiệm CPU
+SPECULATIVE_FALLBACK = True
+
+async def recommend_books_async(query, category, tone):
+    """Bản async cho Gradio: các nhánh độc lập chạy song song trên thread pool"""
+    with async_latency.track():
+        user_id = "guest"
+        # Tìm kiếm fallback được khởi động ngay, song song với tìm kiếm chính
+        fallback_task = None
+        if SPECULATIVE_FALLBACK:
+            fallback_task = asyncio.ensure_future(asyncio.to_thread(history_fallback_df, user_id, query))
+
+        # 1. Content-Based Search
+        content_df = await asyncio.to_thread(primary_recommendations, query, category, tone)
+        current_results = format_results(content_df)
+
+        # Ghi log: HistoryStore chỉ xếp hàng (thread nền commit), nhưng có thể phải chờ stage history
+        # -> chạy ngoài event loop
+        await asyncio.to_thread(log_search, user_id, query, top_book_title(content_df))
+
+        # 2 + 4. CF và đọc lịch sử chạy song song (đọc lịch sử vẫn thấy bản ghi vừa log)
+        (secondary_results, msg), updated_history = await asyncio.gather(
+            asyncio.to_thread(cf_secondary, content_df),
+            asyncio.to_thread(get_history_logs, user_id))
+
+        # 3. Fallback: dùng kết quả đã chạy trước (nếu có)
+        if not secondary_results:
+            metrics.inc("fallback")
+            metrics.debug("⚠️ Fallback: Dùng lịch sử hoặc Random.")
+            hist_df = await fallback_task if fallback_task else await asyncio.to_thread(history_fallback_df, user_id, query)
+            secondary_results, msg = await asyncio.to_thread(fallback_secondary, hist_df, content_df)
+        elif fallback_task:
+            # Không cần nữa; bỏ qua kết quả (và lỗi nếu có)
+            fallback_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            fallback_task.cancel()
+
+    # Sau fallback, ngoài event loop (có thể phải embed query nếu cache hết hạn)
+    await asyncio.to_thread(update_profile, user_id, query)
+    return current_results, secondary_results, msg, updated_history
+
+# Streaming: thời gian tới kết quả đầu tiên (gallery chính) đo riêng với tổng thời gian
+first_result_latency = LatencyTracker("recommend_books_stream:first_result")
+stream_latency = LatencyTracker("recommend_books_stream")
+
+async def recommend_books_stream(query, category, tone):
+    """Bản streaming cho Gradio: yield gallery chính ngay khi vector search xong,
+    sau đó điền gợi ý bổ sung + bảng lịch sử khi từng phần sẵn sàng.
+    Mỗi lần yield đủ 4 output; phần chưa có thì gr.update() (giữ nguyên trên UI)."""
+    start = time.perf_counter()
+    user_id = "guest"
+    fallback_task = None
+    if SPECULATIVE_FALLBACK:
+        fallback_task = asyncio.ensure_future(asyncio.to_thread(history_fallback_df, user_id, query))
+
+    # 1. Content-Based Search -> hiển thị ngay
+    content_df = await asyncio.to_thread(primary_recommendations, query, category, tone)
+    current_results = format_results(content_df)
+    first_result_latency.record(time.perf_counter() - start)
+    yield current_results, gr.update(), gr.update(), gr.update()
+
+    await asyncio.to_thread(log_search, user_id, query, top_book_title(content_df))
+
+    # 2 + 4. CF và lịch sử chạy song song, cái nào xong trước hiện trước
+    cf_task = asyncio.ensure_future(asyncio.to_thread(cf_secondary, content_df))
+    history_task = asyncio.ensure_future(asyncio.to_thread(get_history_logs, user_id))
+    secondary, msg, history = gr.update(), gr.update(), gr.update()
+    pending = {cf_task, history_task}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if history_task in done:
+            history = history_task.result()
+        if cf_task in done:
+            secondary, msg = cf_task.result()
+            if secondary:
+                if fallback_task:
+                    fallback_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                    fallback_task.cancel()
+            else:
+                # 3. Fallback: dùng kết quả đã chạy trước (nếu có)
+                metrics.inc("fallback")
+                metrics.debug("⚠️ Fallback: Dùng lịch sử hoặc Random.")
+                hist_df = await fallback_task if fallback_task else await asyncio.to_thread(history_fallback_df, user_id, query)
+                secondary, msg = await asyncio.to_thread(fallback_secondary, hist_df, content_df)
+        yield current_results, secondary, msg, history
+
+    stream_latency.record(time.perf_counter() - start)
+    await asyncio.to_thread(update_profile, user_id, query)
+
+def get_latency_stats():
+    return [sync_latency.summary(), async_latency.summary(),
+            first_result_latency.summary(), stream_latency.summary()]
+
 # --- 5. UI ---
-categories = ["All"]
-if "simple_categories" in books.columns:
-    categories += sorted(books["simple_categories"].dropna().unique().tolist())
+# UI bind ngay, chưa cần catalog: danh sách thể loại + lịch sử được điền khi trang tải xong
+def get_categories():
+    categories = ["All"]
+    if startup.wait("catalog") and "simple_categories" in books.columns:
+        categories += sorted(books["simple_categories"].dropna().unique().tolist())
+    return categories
+
+def on_page_load():
+    return gr.update(choices=get_categories(), value="All"), get_history_logs()
 
 with gr.Blocks(theme=gr.themes.Glass()) as dashboard:
     gr.Markdown("# AI Book Recommender (Hybrid System)")
@@ -302,7 +632,7 @@ with gr.Blocks(theme=gr.themes.Glass()) as dashboard:
     with gr.Row():
         with gr.Column(scale=1):
             inp = gr.Textbox(label="Bạn muốn tìm sách gì?", placeholder="Ví dụ: Harry Potter, magic, history...")
-            cat = gr.Dropdown(categories, label="Thể loại", value="All")
+            cat = gr.Dropdown(["All"], label="Thể loại", value="All")
             tone = gr.Dropdown(["All", "Happy", "Sad", "Suspenseful", "Surprising", "Angry"], label="Cảm xúc", value="All")
             btn = gr.Button("Tìm kiếm", variant="primary")
             
@@ -311,7 +641,7 @@ with gr.Blocks(theme=gr.themes.Glass()) as dashboard:
             history_table = gr.Dataframe(
                 headers=["Thời gian", "Sách Top 1 Đề xuất"],  # Đổi tên cột
                 datatype=["str", "str"],
-                value=get_history_logs(), 
+                value=[], 
                 interactive=False
             )
             
@@ -321,8 +651,50 @@ with gr.Blocks(theme=gr.themes.Glass()) as dashboard:
             out2 = gr.Gallery(label="Gợi ý bổ sung", columns=5, height=300, object_fit="contain")
 
     # Cập nhật sự kiện click: Thêm history_table vào danh sách outputs
-    btn.click(recommend_books, [inp, cat, tone], [out1, out2, lbl, history_table])
+    # (streaming: gallery chính hiện trước, gợi ý bổ sung + lịch sử điền dần)
+    btn.click(recommend_books_stream, [inp, cat, tone], [out1, out2, lbl, history_table])
+    dashboard.load(on_page_load, outputs=[cat, history_table])
+
+def create_app():
+    """FastAPI app: /health (trạng thái từng thành phần), /ready (503 tới khi nạp xong),
+    /metrics (Prometheus), /metrics.json, POST /ratings (rating mới cho CF) + UI Gradio"""
+    from fastapi import Body, FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        return get_health()
+
+    @app.get("/ready")
+    def ready():
+        status = get_health()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/metrics.json")
+    def json_metrics():
+        return JSONResponse(metrics.snapshot())
+
+    @app.post("/ratings")
+    def add_ratings(body=Body(...)):
+        """Body: {"user_id", "isbn", "rating"} hoặc list các object đó"""
+        events = body if isinstance(body, list) else [body]
+        try:
+            accepted = rate_books([(e["user_id"], e["isbn"], e["rating"]) for e in events])
+        except (KeyError, TypeError, ValueError) as e:
+            return JSONResponse({"error": f"Sự kiện không hợp lệ: {e}"}, status_code=400)
+        except RuntimeError as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+        return JSONResponse({"accepted": accepted}, status_code=202)
+
+    return gr.mount_gradio_app(app, dashboard, path="/")
 
 if __name__ == "__main__":
-    print("🌐 App đang chạy tại: http://127.0.0.1:7860")
-    dashboard.launch()
\ No newline at end of file
+    import uvicorn
+    print("🌐 App đang chạy tại: http://127.0.0.1:7860 (trạng thái: /health, /ready, /metrics)")
+    uvicorn.run(create_app(), host="127.0.0.1", port=7860)
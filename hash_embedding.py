@@ -0,0 +1,55 @@
+import hashlib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# --- EMBEDDING THAY THẾ CHẠY OFFLINE (KHÔNG CẦN MODEL/MẠNG) ---
+# Vector của một câu = tổng vector ngẫu nhiên (seed = hash của từ) của các từ, chuẩn hóa L2.
+# Cùng giao diện embed_documents/embed_query với HuggingFaceEmbeddings; câu có chung từ thì gần nhau.
+# Dùng cho benchmark (bench_suite.py) và chạy thử trên CPU; KHÔNG dùng để gợi ý thật.
+# Tên model: "hash" (384 chiều như all-MiniLM-L6-v2) hoặc "hash-<số chiều>".
+
+HASH_MODEL_PREFIX = "hash"
+DEFAULT_DIM = 384
+_TOKEN = re.compile(r"\w+")
+
+
+def is_hash_model(model_name):
+    return str(model_name).split("-")[0] == HASH_MODEL_PREFIX
+
+
+class HashEmbeddings:
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+        self._word_vector = lru_cache(maxsize=200_000)(self._make_word_vector)
+
+    @classmethod
+    def from_name(cls, model_name):
+        """"hash" -> 384 chiều, "hash-64" -> 64 chiều"""
+        parts = str(model_name).split("-", 1)
+        return cls(int(parts[1]) if len(parts) > 1 else DEFAULT_DIM)
+
+    @property
+    def model_name(self):
+        return f"{HASH_MODEL_PREFIX}-{self.dim}"
+
+    def _make_word_vector(self, word):
+        seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def embed_array(self, texts):
+        """Mảng float32 (n, dim) đã chuẩn hóa; câu rỗng -> vector 0"""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _TOKEN.findall(str(text).lower()):
+                out[i] += self._word_vector(word)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
@@ -0,0 +1,198 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# --- KHO LỊCH SỬ TÌM KIẾM (POOL KẾT NỐI + GHI NỀN THEO LÔ) ---
+# Thay cho kiểu "mỗi lần gọi mở một sqlite3.connect rồi commit ngay":
+#   * Pool kết nối dùng chung giữa các worker của Gradio (thread-safe).
+#   * WAL mode: người đọc không chặn người ghi và ngược lại.
+#   * Index (user_id, id) cho các truy vấn "ORDER BY id DESC" theo user.
+#   * Một thread ghi nền gom các INSERT thành một transaction (1 lần fsync/lô).
+# Đọc theo user luôn thấy các bản ghi đã log trước đó (read-your-writes).
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS search_history
+            (id INTEGER PRIMARY KEY, user_id TEXT, query TEXT, top_book TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)'''
+INDEX = "CREATE INDEX IF NOT EXISTS idx_search_history_user_id ON search_history (user_id, id)"
+
+
+class HistoryStore:
+    def __init__(self, db_path, pool_size=4, flush_interval=0.05, max_batch=256):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._pool = queue.Queue()
+        self._pending = queue.Queue()
+        self._pending_users = Counter()
+        self._cond = threading.Condition()
+        self._flush_now = threading.Event()
+        self._closed = False
+
+        self._init_schema()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        self._writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    # --- KẾT NỐI ---
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL + WAL: an toàn khi app crash, chỉ bỏ fsync ở mỗi commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute(SCHEMA)
+            # DB cũ do database.py tạo chưa có cột top_book
+            cols = [row[1] for row in conn.execute("PRAGMA table_info(search_history)")]
+            if "top_book" not in cols:
+                conn.execute("ALTER TABLE search_history ADD COLUMN top_book TEXT")
+            conn.execute(INDEX)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Mượn một kết nối từ pool, trả lại khi dùng xong"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # --- GHI ---
+    def log_search(self, user_id, query, top_book=None):
+        """Đưa bản ghi vào hàng đợi, thread ghi nền sẽ commit theo lô"""
+        if self._closed:
+            raise RuntimeError("HistoryStore đã đóng")
+        # Ghi thời điểm lúc gọi (UTC, giống CURRENT_TIMESTAMP) chứ không phải lúc flush
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        with self._cond:
+            self._pending_users[user_id] += 1
+        self._pending.put((user_id, query, top_book, ts))
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            try:
+                first = self._pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            if first is None:
+                break
+
+            batch = [first]
+            stop = False
+            # Chờ thêm một chút để gom lô, trừ khi có người đọc đang đợi
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if self._flush_now.is_set() or remaining <= 0:
+                    try:
+                        item = self._pending.get_nowait()
+                    except queue.Empty:
+                        break
+                else:
+                    try:
+                        item = self._pending.get(timeout=min(remaining, 0.005))
+                    except queue.Empty:
+                        continue
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write_batch(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO search_history (user_id, query, top_book, timestamp) VALUES (?, ?, ?, ?)", batch)
+        except Exception as e:
+            print(f"Lỗi ghi lịch sử: {e}")
+        finally:
+            with self._cond:
+                for user_id, *_ in batch:
+                    self._pending_users[user_id] -= 1
+                    if self._pending_users[user_id] <= 0:
+                        del self._pending_users[user_id]
+                if not self._pending_users:
+                    self._flush_now.clear()
+                self._cond.notify_all()
+
+    def _wait_for_user(self, user_id, timeout=5.0):
+        """Chờ tới khi mọi bản ghi đang treo của user đã được commit"""
+        with self._cond:
+            if not self._pending_users.get(user_id):
+                return
+            self._flush_now.set()
+            self._cond.wait_for(lambda: not self._pending_users.get(user_id), timeout=timeout)
+
+    def flush(self, timeout=5.0):
+        """Commit ngay mọi bản ghi đang chờ"""
+        with self._cond:
+            if not self._pending_users:
+                return
+            self._flush_now.set()
+            self._cond.wait_for(lambda: not self._pending_users, timeout=timeout)
+
+    # --- ĐỌC ---
+    def get_recent_interests(self, user_id, current_query=None, limit=3):
+        """Lấy các từ khóa gần nhất (khác query hiện tại nếu có) để phân tích sở thích"""
+        self._wait_for_user(user_id)
+        with self.connection() as conn:
+            if current_query is None:
+                rows = conn.execute("SELECT DISTINCT query FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                                    (user_id, limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT DISTINCT query FROM search_history WHERE user_id = ? AND query != ? ORDER BY id DESC LIMIT ?",
+                                    (user_id, current_query, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_history_logs(self, user_id="guest", limit=10):
+        """Lấy (thời gian, sách Top 1) của các lần tìm gần nhất"""
+        self._wait_for_user(user_id)
+        with self.connection() as conn:
+            return conn.execute("SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp), top_book FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                                (user_id, limit)).fetchall()
+
+    # --- ĐÓNG ---
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(None)
+        self._writer.join(timeout=10)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(db_path):
+    """Mỗi file DB chỉ có một HistoryStore trong process"""
+    db_path = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = HistoryStore(db_path)
+            # Thread ghi là daemon -> flush nốt hàng đợi khi thoát app
+            atexit.register(store.close)
+        return store
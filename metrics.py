@@ -0,0 +1,350 @@
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter as _Counter, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- ĐO ĐẠC NHẸ: BỘ ĐẾM, HISTOGRAM THỜI GIAN THEO STAGE, LOG THEO MỨC ---
+# Thay cho các dòng print [DEBUG] ở mỗi request (tốn I/O, không có số liệu thời gian):
+#   * timer("embed") / timer("ann_search")...: histogram thời gian từng stage
+#   * inc("requests"): bộ đếm; gauge(name, fn): giá trị đọc lúc export (vd. cache hit)
+#   * render_prometheus(): text cho endpoint /metrics; snapshot()/start_json_dump(): JSON định kỳ
+#   * debug()/info()/error(): log theo LOG_LEVEL = quiet | info | debug (mặc định info,
+#     nên log từng request chỉ hiện khi LOG_LEVEL=debug)
+#   * SamplingProfiler: tùy chọn (PROFILE_SAMPLING=1), lấy mẫu stack mọi thread định kỳ
+# LatencyTracker (p50/p95 end-to-end, trước đây ở latency.py) giờ là một histogram trong registry.
+
+PREFIX = "bookrec"
+LEVELS = {"quiet": 0, "info": 1, "debug": 2}
+# Ngưỡng bucket (giây) cho histogram kiểu Prometheus
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_verbosity = LEVELS.get(os.getenv("LOG_LEVEL", "info").lower(), 1)
+
+
+def set_verbosity(level):
+    """level: "quiet" | "info" | "debug" (hoặc 0/1/2)"""
+    global _verbosity
+    _verbosity = LEVELS[level] if isinstance(level, str) else int(level)
+
+
+def verbosity():
+    return _verbosity
+
+
+def debug(msg):
+    if _verbosity >= 2:
+        print(msg)
+
+
+def info(msg):
+    if _verbosity >= 1:
+        print(msg)
+
+
+def error(msg):
+    # Lỗi luôn in, kể cả chế độ quiet
+    print(msg, file=sys.stderr)
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class Histogram:
+    def __init__(self, name, labels=(), buckets=DEFAULT_BUCKETS, window=1000):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # phần tử cuối: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = int(np.searchsorted(self.buckets, seconds, side="left"))
+        with self._lock:
+            self.bucket_counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self._samples.append(seconds)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def summary(self):
+        """p50/p95/p99/max (ms) trên cửa sổ mẫu gần nhất"""
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * 1000
+            count, total = self.count, self.sum
+        s = {"count": count, "sum_s": round(total, 6)}
+        if len(samples):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            s.update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=samples.max())
+        return s
+
+
+class Registry:
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._counters:
+                self._counters[key] = Counter(name, key[1])
+            return self._counters[key]
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, window=1000, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(name, key[1], buckets, window)
+            return self._histograms[key]
+
+    def gauge(self, name, fn):
+        """Giá trị đọc lúc export (fn() -> số)"""
+        self._gauges[name] = fn
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def _gauge_values(self):
+        values = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                values[name] = float(fn())
+            except Exception:
+                continue
+        return values
+
+    def render_prometheus(self):
+        """Định dạng text exposition của Prometheus"""
+        lines = []
+        with self._lock:
+            counters = list(self._counters.values())
+            histograms = list(self._histograms.values())
+        seen = set()
+        for c in sorted(counters, key=lambda c: (c.name, c.labels)):
+            name = f"{self.prefix}_{c.name}_total"
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_label_str(c.labels)} {c.value}")
+        for h in sorted(histograms, key=lambda h: (h.name, h.labels)):
+            name = f"{self.prefix}_{h.name}_seconds"
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            with h._lock:
+                counts, total, count = list(h.bucket_counts), h.sum, h.count
+            cumulative = np.cumsum(counts)
+            for bound, n in zip(list(h.buckets) + ["+Inf"], cumulative):
+                labels = h.labels + (("le", bound),)
+                lines.append(f"{name}_bucket{_label_str(labels)} {int(n)}")
+            lines.append(f"{name}_sum{_label_str(h.labels)} {total:.6f}")
+            lines.append(f"{name}_count{_label_str(h.labels)} {count}")
+        for gname, value in sorted(self._gauge_values().items()):
+            name = f"{self.prefix}_{gname}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Dạng JSON: counters, histograms (p50/p95/p99 ms), gauges"""
+        with self._lock:
+            counters = list(self._counters.values())
+            histograms = list(self._histograms.values())
+
+        def key(m):
+            return m.name + "".join(f"[{k}={v}]" for k, v in m.labels)
+
+        return {"time": time.time(),
+                "counters": {key(c): c.value for c in counters},
+                "histograms": {key(h): h.summary() for h in histograms},
+                "gauges": self._gauge_values()}
+
+    def dump_json(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=1, default=float)
+        os.replace(tmp, path)
+
+    def start_json_dump(self, path, interval=60.0):
+        """Thread nền ghi snapshot ra file mỗi interval giây (và lần cuối khi thoát)"""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.dump_json(path)
+                except Exception as e:
+                    error(f"Lỗi ghi metrics: {e}")
+
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+        atexit.register(lambda: (stop.set(), self.dump_json(path)))
+        return stop
+
+
+REGISTRY = Registry()
+
+
+def inc(name, n=1, **labels):
+    REGISTRY.counter(name, **labels).inc(n)
+
+
+def timer(stage):
+    """with timer("embed"): ... -> histogram bookrec_stage_seconds{stage="embed"}"""
+    return REGISTRY.histogram("stage", stage=stage).time()
+
+
+def stage_summary():
+    return {h["stage"]: s for h, s in ((dict(k[1]), v.summary()) for k, v in REGISTRY._histograms.items()
+                                      if k[0] == "stage")}
+
+
+def peak_rss_mb():
+    """Peak RSS (MB) của process hiện tại (dùng chung cho các bench_*.py)"""
+    # VmHWM được reset khi exec (ru_maxrss thì kế thừa từ process cha trên Linux)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+render_prometheus = REGISTRY.render_prometheus
+snapshot = REGISTRY.snapshot
+
+
+class LatencyTracker:
+    """p50/p95 end-to-end của một pipeline, in tóm tắt sau mỗi report_every request"""
+
+    def __init__(self, name, window=1000, report_every=50):
+        self.name = name
+        self.report_every = report_every
+        self.histogram = REGISTRY.histogram("request", window=window, pipeline=name)
+
+    @property
+    def count(self):
+        return self.histogram.count
+
+    def record(self, seconds):
+        self.histogram.observe(seconds)
+        if self.report_every and self.histogram.count % self.report_every == 0:
+            info(self.format())
+
+    @contextmanager
+    def track(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def summary(self):
+        s = self.histogram.summary()
+        return {"name": self.name, **s}
+
+    def format(self):
+        s = self.summary()
+        if "p50_ms" not in s:
+            return f"⏱️ {self.name}: chưa có request"
+        return (f"⏱️ {self.name}: p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms "
+                f"max={s['max_ms']:.1f}ms (n={s['count']})")
+
+
+# --- PROFILER LẤY MẪU (TÙY CHỌN) ---
+
+class SamplingProfiler:
+    """Mỗi interval giây chụp stack của mọi thread, đếm theo dạng "collapsed" (dùng cho flamegraph)"""
+
+    def __init__(self, interval=0.01, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = _Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _collapse(self, frame):
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.samples[self._collapse(frame)] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def top(self, n=20):
+        return self.samples.most_common(n)
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profiler_from_env():
+    """PROFILE_SAMPLING=1 -> chạy profiler, ghi stack ra PROFILE_OUTPUT (mặc định profile.collapsed) khi thoát"""
+    if os.getenv("PROFILE_SAMPLING", "0") in ("", "0", "false", "no"):
+        return None
+    profiler = SamplingProfiler(float(os.getenv("PROFILE_INTERVAL", "0.01"))).start()
+    output = os.getenv("PROFILE_OUTPUT", "profile.collapsed")
+    atexit.register(lambda: (profiler.stop(), profiler.dump(output)))
+    info(f"🩺 Sampling profiler bật (mỗi {profiler.interval * 1000:.0f}ms) -> {output}")
+    return profiler
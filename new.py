@@ -1,7 +1,9 @@
 import pandas as pd
-import numpy as np
 import os
 
+from catalog_store import build_catalog, normalize_isbn_series
+from enrichment import apply_enrichment
+
 print("🔄 Đang bắt đầu quy trình tạo lại dữ liệu...")
 
 # --- 1. TÌM FILE DỮ LIỆU GỐC ---
@@ -39,44 +41,23 @@ else:
 # --- 2. SỬA LỖI FORMAT (Cực quan trọng) ---
 # Đảm bảo ISBN là chuỗi văn bản, không phải số khoa học
 if "isbn13" in books.columns:
-    books["isbn13"] = books["isbn13"].astype(str).str.replace(r'\.0$', '', regex=True)
+    books["isbn13"] = normalize_isbn_series(books["isbn13"])
 
 # Đảm bảo có cột thumbnail
 if "thumbnail" not in books.columns:
     books["thumbnail"] = ""
 
 # --- 3. TỰ ĐỘNG PHÂN LOẠI & GÁN CẢM XÚC (Không cần AI) ---
-def classify_and_emotion(row):
-    text = (str(row.get('categories', '')) + " " + str(row.get('description', ''))).lower()
-    
-    # Phân loại Thể loại
-    cat = 'Non-Fiction'
-    if 'sci' in text or 'space' in text: cat = 'Science Fiction'
-    elif 'fantasy' in text or 'dragon' in text: cat = 'Fantasy'
-    elif 'mystery' in text or 'crime' in text: cat = 'Mystery'
-    elif 'horror' in text: cat = 'Horror'
-    elif 'love' in text: cat = 'Romance'
-    elif 'fiction' in text: cat = 'Fiction'
-    
-    # Chấm điểm Cảm xúc (Dựa trên từ khóa)
-    scores = {"joy": 0.0, "sadness": 0.0, "fear": 0.0, "anger": 0.0, "surprise": 0.0}
-    if "happy" in text or "love" in text: scores["joy"] += 1
-    if "sad" in text or "death" in text: scores["sadness"] += 1
-    if "dark" in text or "kill" in text: scores["fear"] += 1
-    if "war" in text or "hate" in text: scores["anger"] += 1
-    if "shock" in text: scores["surprise"] += 1
-    
-    return pd.Series([cat, scores["joy"], scores["sadness"], scores["fear"], scores["anger"], scores["surprise"]], 
-                     index=['simple_categories', 'joy', 'sadness', 'fear', 'anger', 'surprise'])
-
-# Áp dụng vào bảng dữ liệu
+# Luật từ khóa vector hóa theo chunk (xem enrichment.py); muốn dùng model thật:
+#   python enrichment.py --backend model --workers 4
 print("⚙️ Đang xử lý dữ liệu...")
-processed = books.apply(classify_and_emotion, axis=1)
-books = pd.concat([books, processed], axis=1)
+apply_enrichment(books, backend="keyword")
 
 # --- 4. LƯU FILE KẾT QUẢ ---
 output_file = "books_with_emotions.csv"
 books.to_csv(output_file, index=False, encoding="utf-8")
+# Build luôn catalogue nhị phân để các script khác nạp bằng memory-map
+build_catalog(output_file)
 
 print("-" * 30)
 print(f"✅ THÀNH CÔNG! Đã tạo file '{output_file}' với {len(books)} dòng.")
@@ -1,25 +1,44 @@
-import pandas as pd
-import numpy as np
+import argparse
+import os
+
+from catalog_store import build_catalog, read_books
+from enrichment import EMOTIONS, enrich
+
+parser = argparse.ArgumentParser(description="Chấm lại điểm cảm xúc cho books_with_emotions.csv")
+parser.add_argument("--backend", choices=["model", "keyword"], default="model")
+parser.add_argument("--workers", type=int, default=1, help="Số process chạy song song")
+parser.add_argument("--batch-size", type=int, default=32)
+args = parser.parse_args()
 
 print("🔄 Đang cập nhật dữ liệu cảm xúc...")
 
-# 1. Đọc file hiện tại
+# 1. Đọc file hiện tại (catalogue nhị phân)
 try:
-    df = pd.read_csv("books_with_emotions.csv", encoding="utf-8")
+    df = read_books("books_with_emotions.csv")
 except FileNotFoundError:
     print("❌ Lỗi: Không tìm thấy file books_with_emotions.csv")
     exit()
 
-# 2. Điền dữ liệu ngẫu nhiên vào các cột cảm xúc
-# (Giúp việc sắp xếp thay đổi rõ rệt khi bạn chọn Tone khác nhau)
-emotions = ['joy', 'sadness', 'fear', 'anger', 'surprise']
+# 2. Chấm điểm cảm xúc thật thay cho số ngẫu nhiên
+# Chạy theo chunk, có checkpoint: bị ngắt giữa chừng thì chạy lại sẽ tiếp tục từ chỗ dừng
+backend = args.backend
+try:
+    import transformers  # noqa: F401
+except ImportError:
+    if backend == "model":
+        print("⚠️ Chưa cài transformers, dùng tạm backend từ khóa.")
+        backend = "keyword"
 
-for emo in emotions:
-    # Tạo điểm số từ 0.0 đến 1.0 cho mỗi cuốn sách
-    df[emo] = np.random.uniform(0, 1, size=len(df))
+scores = enrich(df, backend=backend, workers=args.workers,
+                checkpoint_dir=os.path.join("enrichment_checkpoint", backend),
+                backend_kwargs={"batch_size": args.batch_size} if backend == "model" else None)
+# Chỉ cập nhật cảm xúc, giữ nguyên simple_categories đang có
+for emo in EMOTIONS:
+    df[emo] = scores[emo]
 
 # 3. Lưu lại file
 df.to_csv("books_with_emotions.csv", index=False, encoding="utf-8")
+build_catalog("books_with_emotions.csv")
 
 print(f"✅ Đã cập nhật xong {len(df)} dòng dữ liệu!")
-print("👉 Hãy khởi động lại App để thấy sự thay đổi.")
\ No newline at end of file
+print("👉 Hãy khởi động lại App để thấy sự thay đổi.")
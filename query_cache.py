@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+# --- CACHE LRU CÓ TTL CHO TRUY VẤN ---
+# Query phổ biến ("Harry Potter") và query lịch sử ghép lại thường lặp y hệt,
+# nên embedding của query và danh sách ISBN trả về từ vector search được cache lại.
+# Lọc Category/Tone vẫn chạy trên danh sách ứng viên đã cache.
+
+def normalize_query(query):
+    """Chuẩn hóa query làm khóa cache: bỏ khoảng trắng thừa, chữ thường
+    (all-MiniLM-L6-v2 dùng tokenizer uncased nên embedding không đổi)"""
+    return " ".join(str(query).split()).lower()
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Trả về giá trị hoặc None nếu không có / đã hết hạn"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._data), "maxsize": self.maxsize}
+
+
+class SearchCache:
+    """Hai tầng: query -> embedding, (query, top_k, thể loại) -> danh sách ISBN. Xóa sạch khi index đổi phiên bản."""
+
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.embeddings = TTLCache(maxsize, ttl)
+        self.results = TTLCache(maxsize, ttl)
+        self.version = None
+        self._lock = threading.Lock()
+
+    def check_version(self, version):
+        """Gọi mỗi request với phiên bản index hiện tại (vd mtime của manifest); đổi thì invalidate"""
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.invalidate()
+                self.version = version
+
+    def invalidate(self):
+        self.embeddings.clear()
+        self.results.clear()
+
+    def embedding(self, query, embed):
+        """Embedding của query qua cache (vd. để cập nhật hồ sơ user sau khi tìm kiếm)"""
+        return self.embeddings.get_or_compute(normalize_query(query), lambda: embed(query))
+
+    def search(self, query, top_k, embed, search_by_vector, category=None):
+        """embed(query) -> vector; search_by_vector(vector, top_k, category) -> danh sách ISBN"""
+        key = normalize_query(query)
+        isbns = self.results.get((key, top_k, category))
+        if isbns is None:
+            vector = self.embedding(query, embed)
+            isbns = search_by_vector(vector, top_k, category)
+            self.results.put((key, top_k, category), isbns)
+        return isbns
+
+    def stats(self):
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+
+# --- XẾP HẠNG LAI: GỘP ĐIỂM NGỮ NGHĨA + CF + CẢM XÚC ---
+# Trước đây recommend_books trả gallery ngữ nghĩa, CF chỉ lấy cho cuốn Top 1, còn Tone thì
+# sắp xếp lại toàn bộ theo một cột cảm xúc (mất hết độ liên quan ngữ nghĩa).
+# HybridRanker lấy ứng viên từ vector search + láng giềng CF của N kết quả đầu, cộng điểm
+# từng nguồn trên mảng numpy (weighted hoặc reciprocal rank fusion) rồi trả một danh sách top-K.
+# Mọi thứ làm trên vị trí trong catalog (CatalogIndex.positions), không đụng tới DataFrame.
+
+TONE_COLUMNS = {"Happy": "joy", "Surprising": "surprise", "Angry": "anger", "Suspenseful": "fear", "Sad": "sadness"}
+METHODS = ("weighted", "rrf")
+
+
+class HybridRanker:
+    def __init__(self, method="weighted", semantic_weight=1.0, cf_weight=0.5, tone_weight=0.5,
+                 rrf_k=60, cf_seeds=5, budget_ms=200.0):
+        if method not in METHODS:
+            raise ValueError(f"method phải là một trong {METHODS}")
+        self.method = method
+        self.semantic_weight = semantic_weight
+        self.cf_weight = cf_weight
+        self.tone_weight = tone_weight
+        self.rrf_k = rrf_k
+        self.cf_seeds = cf_seeds
+        self.budget_ms = budget_ms
+
+    def _rank_scores(self, n):
+        """Điểm theo hạng 0..n-1 của một danh sách"""
+        ranks = np.arange(n, dtype=np.float64)
+        if self.method == "rrf":
+            return 1.0 / (self.rrf_k + ranks + 1.0)
+        return 1.0 - ranks / max(n, 1)
+
+    def fuse(self, semantic_pos, cf_lists=(), tone_values=None, allowed=None, top_k=20):
+        """semantic_pos: vị trí theo thứ tự tương đồng; cf_lists: [(hạng của seed, vị trí láng giềng)];
+        tone_values: cột cảm xúc của cả catalog (hoặc None); allowed: mask bool trên catalog.
+        Trả về (vị trí top-K, điểm)."""
+        semantic_pos = np.asarray(semantic_pos, dtype=np.int64)
+        parts = [semantic_pos]
+        weights = [self.semantic_weight * self._rank_scores(len(semantic_pos))]
+
+        if cf_lists and self.cf_weight:
+            if self.method == "rrf":
+                # Mỗi danh sách láng giềng là một bảng xếp hạng riêng
+                seed_weights = np.ones(len(cf_lists))
+            else:
+                # Láng giềng của kết quả hạng cao đáng tin hơn; chuẩn hóa để tổng trọng số = 1
+                seed_weights = 1.0 / (1.0 + np.array([rank for rank, _ in cf_lists], dtype=np.float64))
+                seed_weights /= seed_weights.sum()
+            for w, (_, neighbors) in zip(seed_weights, cf_lists):
+                neighbors = np.asarray(neighbors, dtype=np.int64)
+                parts.append(neighbors)
+                weights.append(self.cf_weight * w * self._rank_scores(len(neighbors)))
+
+        cand_all = np.concatenate(parts)
+        if len(cand_all) == 0:
+            return cand_all, np.zeros(0)
+        # Gộp ứng viên trùng: cộng điểm, nhớ lần xuất hiện đầu tiên để phá hòa
+        cand, first, inverse = np.unique(cand_all, return_index=True, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights), minlength=len(cand))
+
+        if allowed is not None:
+            keep = allowed[cand]
+            cand, first, scores = cand[keep], first[keep], scores[keep]
+
+        if tone_values is not None and self.tone_weight and len(cand):
+            tone = np.nan_to_num(np.asarray(tone_values[cand], dtype=np.float64))
+            if self.method == "rrf":
+                order = np.argsort(-tone, kind="stable")
+                tone_rank = np.empty(len(cand), dtype=np.float64)
+                tone_rank[order] = np.arange(len(cand))
+                scores = scores + self.tone_weight / (self.rrf_k + tone_rank + 1.0)
+            else:
+                lo, hi = tone.min(), tone.max()
+                scores = scores + self.tone_weight * ((tone - lo) / (hi - lo) if hi > lo else np.zeros_like(tone))
+
+        k = min(top_k, len(cand))
+        if k < len(cand):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(cand))
+        top = top[np.lexsort((first[top], -scores[top]))]
+        return cand[top], scores[top]
+
+    def rank(self, semantic_pos, cf_lookup=None, tone_values=None, allowed=None, top_k=20, started=None):
+        """Như fuse, nhưng tự lấy láng giềng CF của cf_seeds kết quả đầu qua cf_lookup(pos) -> vị trí.
+        Hết ngân sách budget_ms (tính từ started, mặc định là lúc gọi) thì dừng lấy thêm CF.
+        Trả về (vị trí, điểm, info)."""
+        started = time.perf_counter() if started is None else started
+        deadline = started + self.budget_ms / 1000.0
+        cf_lists = []
+        truncated = False
+        if cf_lookup is not None and self.cf_weight:
+            for seed_rank, seed in enumerate(np.asarray(semantic_pos)[:self.cf_seeds]):
+                if time.perf_counter() >= deadline:
+                    truncated = True
+                    break
+                neighbors = cf_lookup(int(seed))
+                if len(neighbors):
+                    cf_lists.append((seed_rank, neighbors))
+        pos, scores = self.fuse(semantic_pos, cf_lists, tone_values, allowed, top_k)
+        info = {"cf_seeds_used": len(cf_lists), "truncated": truncated,
+                "elapsed_ms": (time.perf_counter() - started) * 1000}
+        return pos, scores, info
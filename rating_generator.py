@@ -0,0 +1,142 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- SINH RATING GIẢ LẬP (VECTOR HÓA, CÓ SEED, GHI THEO CHUNK) ---
+# Thay cho các vòng lặp Python append từng rating + np.random.choice từng lần ở
+# create_rating.py và bước 4 của reset_all_data.py. Hai loại rating:
+#   * "Nhà phê bình": user 1..critics đánh giá critic_coverage phần sách (mặc định tất cả),
+#     điểm 3-5, để sách nào tìm ra cũng có dữ liệu CF.
+#   * Rating ngẫu nhiên: user trong [user_min, user_max), sách chọn theo độ phổ biến
+#     Zipf (zipf=0 -> đều), điểm 1-5.
+# Kết quả được ghi theo từng chunk ra CSV hoặc .npy (mảng có cấu trúc, memory-map),
+# nên bộ nhớ chỉ phụ thuộc chunk_size chứ không phụ thuộc tổng số rating.
+
+RATING_DTYPE = np.dtype([("user_id", "<i4"), ("isbn", "<u8"), ("rating", "i1")])
+
+
+class RatingGenerator:
+    def __init__(self, isbns, n_ratings=5000, user_min=10, user_max=1000, critics=3,
+                 critic_coverage=1.0, zipf=0.0, seed=42, chunk_size=1_000_000):
+        self.isbns = np.asarray(isbns)
+        self.n_ratings = n_ratings
+        self.user_min = user_min
+        self.user_max = user_max
+        self.critics = critics
+        self.critic_coverage = critic_coverage
+        self.zipf = zipf
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+        n = len(self.isbns)
+        # Sách nhà phê bình đọc (chọn ngẫu nhiên nếu không phủ 100%)
+        if critic_coverage >= 1.0:
+            self.critic_books = np.arange(n)
+        else:
+            self.critic_books = np.sort(self.rng.choice(n, int(round(n * critic_coverage)), replace=False))
+
+        # Phân phối độ phổ biến: hạng i có trọng số 1/i^zipf, hạng được gán ngẫu nhiên cho sách
+        if zipf > 0:
+            weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** zipf
+            self._cdf = np.cumsum(weights) / weights.sum()
+            self._rank_to_book = self.rng.permutation(n)
+        else:
+            self._cdf = None
+
+    def __len__(self):
+        return len(self.critic_books) * self.critics + self.n_ratings
+
+    def _sample_books(self, size):
+        n = len(self.isbns)
+        if self._cdf is None:
+            return self.rng.integers(0, n, size)
+        ranks = np.searchsorted(self._cdf, self.rng.random(size), side="right")
+        return self._rank_to_book[np.minimum(ranks, n - 1)]
+
+    def chunks(self):
+        """Sinh từng chunk (user_ids, chỉ số sách, ratings)"""
+        # Giai đoạn 1: nhà phê bình, thứ tự giống bản cũ (mỗi sách: critic 1, 2, 3...)
+        books_per_chunk = max(1, self.chunk_size // max(self.critics, 1))
+        for start in range(0, len(self.critic_books) if self.critics else 0, books_per_chunk):
+            books = self.critic_books[start:start + books_per_chunk]
+            users = np.tile(np.arange(1, self.critics + 1, dtype=np.int32), len(books))
+            yield users, np.repeat(books, self.critics), self.rng.integers(3, 6, len(users), dtype=np.int8)
+
+        # Giai đoạn 2: rating ngẫu nhiên (cho tự nhiên)
+        for start in range(0, self.n_ratings, self.chunk_size):
+            size = min(self.chunk_size, self.n_ratings - start)
+            yield (self.rng.integers(self.user_min, self.user_max, size, dtype=np.int32),
+                   self._sample_books(size),
+                   self.rng.integers(1, 6, size, dtype=np.int8))
+
+    def to_frame(self):
+        """Toàn bộ rating trong một DataFrame (chỉ dùng khi vừa bộ nhớ)"""
+        parts = [pd.DataFrame({"user_id": u, "isbn": self.isbns[b], "rating": r}) for u, b, r in self.chunks()]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["user_id", "isbn", "rating"])
+
+    def write_csv(self, path):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("user_id,isbn,rating\n")
+            for users, books, ratings in self.chunks():
+                pd.DataFrame({"user_id": users, "isbn": self.isbns[books], "rating": ratings}) \
+                    .to_csv(f, header=False, index=False)
+        return len(self)
+
+    def write_npy(self, path):
+        """Ghi mảng có cấu trúc (user_id, isbn uint64, rating) vào .npy, đọc lại bằng mmap_mode='r'"""
+        isbns = self.isbns.astype(np.uint64)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=RATING_DTYPE, shape=(len(self),))
+        pos = 0
+        for users, books, ratings in self.chunks():
+            end = pos + len(users)
+            out["user_id"][pos:end] = users
+            out["isbn"][pos:end] = isbns[books]
+            out["rating"][pos:end] = ratings
+            pos = end
+        out.flush()
+        del out
+        return pos
+
+    def write(self, path):
+        return self.write_npy(path) if path.endswith(".npy") else self.write_csv(path)
+
+
+def load_ratings_npy(path):
+    """Đọc file .npy do write_npy ghi thành DataFrame giống ratings.csv"""
+    arr = np.load(path, mmap_mode="r")
+    return pd.DataFrame({"user_id": arr["user_id"], "isbn": arr["isbn"].astype(str), "rating": arr["rating"]})
+
+
+if __name__ == "__main__":
+    from catalog_store import read_books
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Sinh rating giả lập cho Collaborative Filtering")
+    parser.add_argument("--books", default=os.path.join(base_dir, "books_with_emotions.csv"),
+                        help="CSV sách để lấy ISBN")
+    parser.add_argument("--synthetic-books", type=int, default=0, help="Dùng N ISBN giả thay cho file sách")
+    parser.add_argument("--ratings", type=int, default=5000, help="Số rating ngẫu nhiên (ngoài nhà phê bình)")
+    parser.add_argument("--users", type=int, default=1000, help="User ngẫu nhiên có id trong [10, users)")
+    parser.add_argument("--critics", type=int, default=3)
+    parser.add_argument("--critic-coverage", type=float, default=1.0)
+    parser.add_argument("--zipf", type=float, default=0.0, help="Độ lệch phổ biến (0 = đều, ~1.1 = thực tế)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--out", default=os.path.join(base_dir, "ratings.csv"), help=".csv hoặc .npy")
+    args = parser.parse_args()
+
+    if args.synthetic_books:
+        isbns = (9780000000000 + np.arange(args.synthetic_books, dtype=np.uint64)).astype(str)
+    else:
+        isbns = read_books(args.books, columns=["isbn13"])["isbn13"].unique()
+
+    gen = RatingGenerator(isbns, n_ratings=args.ratings, user_max=args.users, critics=args.critics,
+                          critic_coverage=args.critic_coverage, zipf=args.zipf, seed=args.seed,
+                          chunk_size=args.chunk_size)
+    start = time.perf_counter()
+    rows = gen.write(args.out)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Đã ghi {rows:,} rating vào '{args.out}' trong {elapsed:.2f}s ({rows / elapsed:,.0f} dòng/giây)")
@@ -1,37 +1,44 @@
-import pandas as pd
-import numpy as np
 import os
 import shutil
-from langchain_huggingface import HuggingFaceEmbeddings
+import argparse
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
+
+from build_cf_neighbors import build_neighbors, OUTPUT_DIR as NEIGHBORS_OUTPUT_DIR
+from catalog_store import read_books
+from cf_engine import NeighborTable
+from rating_generator import RatingGenerator
+from vector_index import VectorIndex, export_from_chroma, is_fresh, update_from_chroma, vector_index_dir_for
+from vector_quant import QUANTIZATIONS
+from vector_ingest import ingest, sync, make_embedding_model, default_workers
 
 # --- CẤU HÌNH ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_FILE = os.path.join(BASE_DIR, "books_with_emotions.csv")
 CHROMA_DIR = os.path.join(BASE_DIR, "chroma_db")
 RATINGS_FILE = os.path.join(BASE_DIR, "ratings.csv")
+EMBED_CACHE_DIR = os.path.join(BASE_DIR, "embedding_cache")
 
-def reset_data():
+def reset_data(batch_size=256, workers=1, incremental=False, quantization=None):
     print("🚀 Bắt đầu quá trình Reset toàn bộ dữ liệu...")
 
     # 1. ĐỌC FILE SÁCH GỐC
-    if not os.path.exists(CSV_FILE):
+    csv_file = CSV_FILE
+    if not os.path.exists(csv_file):
         # Fallback nếu tên file khác
         backup_file = os.path.join(BASE_DIR, "books_cleaned.csv")
         if os.path.exists(backup_file):
             print(f"⚠️ Không thấy 'books_with_emotions.csv', dùng tạm '{backup_file}'")
-            df = pd.read_csv(backup_file)
+            csv_file = backup_file
         else:
             print("❌ LỖI: Không tìm thấy file csv dữ liệu sách!")
             return
-    else:
-        df = pd.read_csv(CSV_FILE)
+    # Catalogue nhị phân (isbn13 đã chuẩn hóa), tự build lại nếu CSV đổi
+    df = read_books(csv_file)
     
     print(f"📖 Đã đọc {len(df)} cuốn sách.")
 
-    # 2. XÓA DATABASE CŨ (Để tránh xung đột)
-    if os.path.exists(CHROMA_DIR):
+    # 2. XÓA DATABASE CŨ (Để tránh xung đột) - bỏ qua khi đồng bộ tăng dần
+    if os.path.exists(CHROMA_DIR) and not incremental:
         print("🗑️ Đang xóa ChromaDB cũ lỗi...")
         try:
             shutil.rmtree(CHROMA_DIR)
@@ -39,60 +46,56 @@ def reset_data():
             print("⚠️ Không thể xóa folder cũ, hãy thử xóa tay nếu code báo lỗi.")
     
     # 3. TẠO LẠI CHROMADB (Chuẩn định dạng ISBN + Mô tả)
-    print("zzz Đang xây dựng lại Vector Database (Khoảng 1-2 phút)...")
-    
-    # Đảm bảo cột tagged_description tồn tại và xử lý NaN
-    if "tagged_description" not in df.columns:
-        # Nếu chưa có, tự tạo cột này: ISBN + Title + Description
-        print("⚠️ Cột 'tagged_description' thiếu, đang tự tạo lại...")
-        df["tagged_description"] = df["isbn13"].astype(str) + " " + df["title"] + " " + df["description"]
-    
-    df["tagged_description"] = df["tagged_description"].fillna("")
-    
-    # Tạo Documents cho ChromaDB
-    documents = []
-    for _, row in df.iterrows():
-        content = str(row["tagged_description"])
-        # Chỉ thêm nếu content hợp lệ
-        if len(content) > 10: 
-            documents.append(Document(page_content=content, metadata={"isbn": str(row["isbn13"])}))
+    # Đọc CSV theo chunk, embed theo batch lớn, upsert vào một collection với id = ISBN
+    # Cache embedding trên đĩa: corpus không đổi thì không phải chạy lại model
+    embedding_model = make_embedding_model(batch_size=batch_size, cache_dir=EMBED_CACHE_DIR)
+    changed = removed = None
+    if incremental:
+        # Vector index chỉ vá được nếu nó khớp Chroma trước khi đồng bộ (và cùng chế độ nén)
+        index_meta = VectorIndex.read_meta(vector_index_dir_for(CHROMA_DIR))
+        index_matches = (is_fresh(CHROMA_DIR) and index_meta is not None
+                         and index_meta.get("quantization") == (quantization or None))
+        # Chỉ embed sách mới/đã sửa, xóa sách đã bỏ (dựa trên manifest hash cạnh chroma_db/)
+        print("🔁 Đang đồng bộ tăng dần Vector Database...")
+        changed, removed = sync(df, CHROMA_DIR, embedding_model=embedding_model, batch_size=batch_size,
+                                workers=workers)
+        print("✅ ChromaDB đã được đồng bộ!")
+        if not index_matches:
+            changed = removed = None
+    else:
+        print(f"zzz Đang xây dựng lại Vector Database (batch {batch_size}, {workers} process)...")
+        ingest(df, CHROMA_DIR, embedding_model=embedding_model, batch_size=batch_size, workers=workers)
+        print("✅ ChromaDB đã được xây mới hoàn toàn!")
 
-    # Nạp vào ChromaDB
-    embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    # Chia nhỏ batch để nạp cho nhẹ máy
-    batch_size = 500
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i+batch_size]
-        Chroma.from_documents(batch, embedding_model, persist_directory=CHROMA_DIR)
-        print(f"   -> Đã nạp {min(i+batch_size, len(documents))}/{len(documents)} sách...")
-        
-    print("✅ ChromaDB đã được xây mới hoàn toàn!")
+    # 3b. EXPORT EMBEDDING SANG VECTOR INDEX LOCAL (dashboard tìm thẳng trên ma trận memory-map)
+    # quantization="int8"/"pq": thêm mã nén cho catalogue lớn (xem bench_quantization.py)
+    # Đồng bộ tăng dần: không đổi gì thì giữ index; có thay đổi thì chỉ đọc các sách đó từ Chroma
+    if changed is None:
+        export_from_chroma(CHROMA_DIR, quantization=quantization)
+    elif changed or removed:
+        update_from_chroma(CHROMA_DIR, changed, removed, quantization=quantization)
+    else:
+        print("✅ Vector index không đổi.")
 
     # 4. TẠO FILE RATINGS.CSV (Phủ kín 100% sách)
-    print("📊 Đang sinh dữ liệu đánh giá giả lập (Collaborative Filtering)...")
-    
-    all_isbns = df['isbn13'].astype(str).str.replace(r'\.0$', '', regex=True).unique().tolist()
-    
-    user_ids = []
-    book_isbns = []
-    ratings = []
+    # Đồng bộ tăng dần chỉ là sửa catalogue: giữ nguyên ratings.csv đang có (rating thật/trực tuyến,
+    # snapshot CF trực tuyến và cf_neighbors/ đều dựa trên nó). Sách mới chưa có rating thì chưa có gợi ý CF.
+    if incremental and os.path.exists(RATINGS_FILE):
+        print("📊 Giữ nguyên 'ratings.csv' (đồng bộ tăng dần).")
+    else:
+        print("📊 Đang sinh dữ liệu đánh giá giả lập (Collaborative Filtering)...")
+
+        # Mỗi sách được user 1 và 2 rate 3-5 sao, thêm 2000 rating ngẫu nhiên từ user 10-499
+        generator = RatingGenerator(df['isbn13'].unique(), n_ratings=2000, user_min=10, user_max=500, critics=2)
+        num_rows = generator.write_csv(RATINGS_FILE)
+        print(f"✅ Đã tạo 'ratings.csv' với {num_rows} dòng.")
 
-    # Tạo rating cho MỌI cuốn sách (mỗi sách ít nhất 2 đánh giá)
-    for isbn in all_isbns:
-        for u in range(1, 3): # User 1 và User 2 đọc hết sách
-            user_ids.append(u)
-            book_isbns.append(isbn)
-            ratings.append(np.random.randint(3, 6)) # Rate 3-5 sao
-            
-    # Tạo thêm rating ngẫu nhiên
-    for _ in range(2000):
-        user_ids.append(np.random.randint(10, 500))
-        book_isbns.append(np.random.choice(all_isbns))
-        ratings.append(np.random.randint(1, 6))
-        
-    df_ratings = pd.DataFrame({'user_id': user_ids, 'isbn': book_isbns, 'rating': ratings})
-    df_ratings.to_csv(RATINGS_FILE, index=False)
-    print(f"✅ Đã tạo 'ratings.csv' với {len(df_ratings)} dòng.")
+    # 4b. TÍNH TRƯỚC BẢNG LÁNG GIỀNG CF (dashboard sẽ memory-map)
+    # Bảng đã dựng từ đúng ratings.csv hiện tại (source.json) thì không tính lại
+    if incremental and NeighborTable.matches_ratings(NEIGHBORS_OUTPUT_DIR, RATINGS_FILE):
+        print("🔗 Bảng láng giềng CF vẫn khớp 'ratings.csv', bỏ qua.")
+    else:
+        build_neighbors(RATINGS_FILE)
 
     # 5. TỰ KIỂM TRA (SELF-TEST)
     print("\n🔎 Đang chạy thử kiểm tra hệ thống...")
@@ -116,4 +119,15 @@ def reset_data():
     print("\n🎉 HOÀN TẤT! Bây giờ bạn hãy chạy lại file 'gradio-dashboard.py' nhé.")
 
 if __name__ == "__main__":
-    reset_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Reset toàn bộ dữ liệu: ChromaDB, ratings.csv, bảng láng giềng CF")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size khi embed")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Số process embed song song trên CPU (máy này gợi ý {default_workers()})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Không xóa chroma_db/, chỉ embed sách mới/đã sửa và xóa sách đã bỏ; "
+                             "giữ ratings.csv và bảng láng giềng CF nếu đã có")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="Nén vector index (int8: nhỏ 4 lần, pq: nhỏ 32 lần), rerank chính xác từ vectors.npy")
+    args = parser.parse_args()
+    reset_data(batch_size=args.batch_size, workers=args.workers, incremental=args.incremental,
+               quantization=args.quantization)
\ No newline at end of file
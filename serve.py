@@ -0,0 +1,314 @@
+import argparse
+import gc
+import json
+import multiprocessing as mp
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from batch_recommend import BatchRecommender
+from history_store import get_store
+from user_profiles import get_profiles, profiles_path_for
+from vector_ingest import MODEL_NAME, make_embedding_model
+
+# --- CHẾ ĐỘ PHỤC VỤ NHIỀU PROCESS (DỮ LIỆU CHỈ ĐỌC DÙNG CHUNG) ---
+# Dashboard chạy một process: phần việc nặng CPU (embed, nhân ma trận, gộp điểm) tranh nhau GIL,
+# thêm worker thì nhân bản cả catalogue/index. Ở đây:
+#   * Process trước (front) nạp catalogue, vector index, bảng láng giềng CF MỘT lần: các mảng số và
+#     ma trận vector là memory-map (page cache của OS, mọi process dùng chung); phần còn lại được
+#     gc.freeze() rồi fork -> copy-on-write, worker chỉ đọc nên hầu như không bị sao chép.
+#   * Fork N worker, mỗi worker tự nạp model embedding (torch 1 luồng) + kết nối SQLite lịch sử,
+#     lấy request từ hàng đợi chung, gom tối đa batch_size request đang chờ rồi chạy
+#     BatchRecommender.recommend_batch (embed theo lô + một phép nhân ma trận cho cả lô).
+#   * Front là HTTP server nhỏ (thư viện chuẩn): nhận request, đẩy vào hàng đợi, chờ kết quả.
+# API (JSON, cùng định dạng kết quả với batch_recommend.py):
+#   GET  /recommend?query=...&category=...&tone=...&user_id=...
+#   POST /recommend   body: một object hoặc list object {"query"|"user_id", "category", "tone"}
+#   GET  /health (trạng thái + bộ nhớ từng worker)     GET /metrics (Prometheus)
+# Chỉ chạy trên hệ có fork (Linux/macOS). Dashboard Gradio vẫn là chế độ một process như cũ.
+
+BASE_DIR = os.getenv("BOOKREC_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
+
+
+def process_memory(pid):
+    """RSS / PSS / phần dùng chung (MB) của một process, đọc từ /proc (Linux); {} nếu không có"""
+    mem = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ("Rss:", "Pss:", "Shared_Clean:", "Shared_Dirty:", "Private_Clean:", "Private_Dirty:"):
+                    mem[parts[0][:-1].lower() + "_mb"] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    return mem
+
+
+# --- WORKER ---
+
+def _worker_main(worker_id, recommender, base_dir, model_name, tasks, results, batch_size, ready):
+    try:
+        import torch
+        # Song song hóa bằng số process, không phải số luồng của torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    # Model + kết nối SQLite nạp SAU khi fork (thread/handle không sống sót qua fork).
+    # Không dùng cache embedding trên đĩa: cache chỉ cho một process ghi.
+    recommender.embedding_model = make_embedding_model(model_name)
+    recommender.embed(["test"])  # làm nóng
+    history_db = os.path.join(base_dir, "user_history.db")
+    history = recommender.history = get_store(history_db)
+    # Hồ sơ sở thích: request chỉ có user_id tra thẳng vector hồ sơ; query mới được cộng vào hồ sơ
+    profiles = recommender.profiles = get_profiles(profiles_path_for(history_db), model_name)
+    recommender.record_profiles = True
+    ready.put(worker_id)
+
+    stop = False
+    while not stop:
+        item = tasks.get()
+        if item is None:
+            break
+        batch = [item]
+        # Gom các request đang chờ thành một lô (không chờ thêm nếu hàng đợi rỗng)
+        while len(batch) < batch_size:
+            try:
+                item = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+
+        ids = [request_id for request_id, _ in batch]
+        requests = [request for _, request in batch]
+        try:
+            out = recommender.recommend_batch(requests)
+            for request, result in zip(requests, out):
+                # Lưu lịch sử như dashboard: query + tên sách Top 1
+                if request.get("query") and request.get("user_id") is not None:
+                    top = result["results"][0]["title"] if result.get("results") else "Không tìm thấy"
+                    history.log_search(str(request["user_id"]), request["query"], top)
+        except Exception as e:
+            out = [{"error": f"{type(e).__name__}: {e}"}] * len(batch)
+        results.put((worker_id, len(batch), list(zip(ids, out))))
+    history.close()
+    profiles.close()
+
+
+# --- FRONT: PHÂN PHỐI REQUEST CHO WORKER ---
+
+class WorkerPool:
+    def __init__(self, recommender, workers=2, base_dir=BASE_DIR, model_name=MODEL_NAME, batch_size=16):
+        self.recommender = recommender
+        self.n_workers = workers
+        self.base_dir = base_dir
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._ctx = mp.get_context("fork")
+        self._ids = count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.processes = []
+
+    @classmethod
+    def from_paths(cls, base_dir=BASE_DIR, workers=2, model_name=MODEL_NAME, batch_size=16, **kwargs):
+        """Nạp phần dữ liệu dùng chung một lần ở front; model embedding để worker tự nạp"""
+        recommender = BatchRecommender.from_paths(base_dir, load_model=False, open_history=False, **kwargs)
+        return cls(recommender, workers, base_dir, model_name, batch_size)
+
+    def start(self, timeout=300.0):
+        self.tasks = self._ctx.Queue()
+        self.results = self._ctx.Queue()
+        ready = self._ctx.Queue()
+        # Đưa mọi object hiện có ra khỏi vòng quét của GC -> GC trong worker không ghi vào
+        # header của chúng (tránh copy-on-write cả catalogue)
+        gc.collect()
+        gc.freeze()
+        for i in range(self.n_workers):
+            p = self._ctx.Process(target=_worker_main, name=f"bookrec-worker-{i}", daemon=True,
+                                  args=(i, self.recommender, self.base_dir, self.model_name,
+                                        self.tasks, self.results, self.batch_size, ready))
+            p.start()
+            self.processes.append(p)
+        threading.Thread(target=self._collect, name="result-collector", daemon=True).start()
+
+        deadline = time.monotonic() + timeout
+        for _ in range(self.n_workers):
+            try:
+                worker_id = ready.get(timeout=max(deadline - time.monotonic(), 0.1))
+            except queue.Empty:
+                raise TimeoutError("Worker chưa sẵn sàng sau thời gian chờ")
+            metrics.info(f"   ✅ Worker {worker_id} sẵn sàng")
+        return self
+
+    def _collect(self):
+        while True:
+            try:
+                worker_id, size, items = self.results.get()
+            except (EOFError, OSError):
+                return
+            metrics.inc("worker_batches", worker=worker_id)
+            metrics.inc("worker_requests", size, worker=worker_id)
+            with self._lock:
+                futures = [(self._pending.pop(request_id, None), result) for request_id, result in items]
+            for future, result in futures:
+                if future is not None:
+                    future.set_result(result)
+
+    def submit(self, request):
+        """Đẩy request vào hàng đợi chung -> (request_id, Future)"""
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = future
+        self.tasks.put((request_id, request))
+        return request_id, future
+
+    def recommend(self, requests, timeout=30.0):
+        submitted = [self.submit(r) for r in requests]
+        deadline = time.monotonic() + timeout
+        try:
+            return [future.result(max(deadline - time.monotonic(), 0)) for _, future in submitted]
+        except FutureTimeout:
+            with self._lock:
+                for request_id, _ in submitted:
+                    self._pending.pop(request_id, None)
+            raise
+
+    def alive(self):
+        return sum(p.is_alive() for p in self.processes)
+
+    def status(self):
+        with self._lock:
+            pending = len(self._pending)
+        workers = [{"pid": p.pid, "alive": p.is_alive(), **process_memory(p.pid)} for p in self.processes]
+        return {"workers": workers, "alive": self.alive(), "pending": pending,
+                "front": {"pid": os.getpid(), **process_memory(os.getpid())}}
+
+    def stop(self, timeout=10.0):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+
+
+class FrontServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Mặc định listen(5): nhiều client đồng thời sẽ bị SYN retry (trễ ~1s)
+    request_queue_size = 1024
+
+
+def _parse_request(query):
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    return {k: params[k] for k in ("id", "query", "user_id", "category", "tone") if params.get(k)}
+
+
+def make_handler(pool, timeout=30.0):
+    request_latency = metrics.LatencyTracker("serve_recommend", report_every=500)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            metrics.debug(f"[HTTP] {self.address_string()} {format % args}")
+
+        def _send(self, status, body, content_type="application/json; charset=utf-8"):
+            data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _recommend(self, requests, single):
+            if not pool.alive():
+                return self._send(503, {"error": "không còn worker nào chạy"})
+            try:
+                with request_latency.track():
+                    results = pool.recommend(requests, timeout)
+            except FutureTimeout:
+                metrics.inc("serve_timeouts")
+                return self._send(504, {"error": "quá thời gian chờ worker"})
+            self._send(200, results[0] if single else results)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/recommend":
+                request = _parse_request(url.query)
+                if not request.get("query") and not request.get("user_id"):
+                    return self._send(400, {"error": "cần query hoặc user_id"})
+                return self._recommend([request], single=True)
+            if url.path == "/health":
+                status = pool.status()
+                return self._send(200 if status["alive"] == pool.n_workers else 503, status)
+            if url.path == "/metrics":
+                return self._send(200, metrics.render_prometheus(), "text/plain; version=0.0.4")
+            self._send(404, {"error": "không có đường dẫn này"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/recommend":
+                return self._send(404, {"error": "không có đường dẫn này"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"null")
+            except json.JSONDecodeError:
+                return self._send(400, {"error": "body không phải JSON"})
+            if isinstance(body, dict):
+                return self._recommend([body], single=True)
+            if isinstance(body, list) and all(isinstance(r, dict) for r in body):
+                return self._recommend(body, single=False)
+            self._send(400, {"error": "body phải là object hoặc list object"})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phục vụ gợi ý qua HTTP bằng nhiều process dùng chung dữ liệu")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=16, help="Số request tối đa một worker gom thành một lô")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", MODEL_NAME))
+    parser.add_argument("--data-dir", default=BASE_DIR)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Thời gian chờ worker tối đa cho một request (giây)")
+    args = parser.parse_args()
+
+    if "fork" not in mp.get_all_start_methods():
+        sys.exit("❌ Chế độ nhiều process cần fork (Linux/macOS).")
+
+    print(f"🚀 Nạp dữ liệu dùng chung từ '{args.data_dir}'...")
+    start = time.perf_counter()
+    pool = WorkerPool.from_paths(args.data_dir, args.workers, args.model, args.batch_size,
+                                 top_k=args.top_k, candidates=args.candidates)
+    print(f"⏳ Fork {args.workers} worker (model '{args.model}')...")
+    pool.start()
+    print(f"✅ Sẵn sàng sau {time.perf_counter() - start:.1f}s")
+
+    server = FrontServer((args.host, args.port), make_handler(pool, args.timeout))
+    print(f"🌐 http://{args.host}:{args.port}/recommend?query=... (trạng thái: /health, /metrics)")
+    # SIGTERM -> thoát như Ctrl+C, để dừng các worker thay vì bỏ chúng lại
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
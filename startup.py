@@ -0,0 +1,106 @@
+import threading
+import time
+
+# --- KHỞI ĐỘNG THEO GIAI ĐOẠN (LAZY + THREAD NỀN) ---
+# Mỗi thành phần nặng (CF, catalog, model embedding, ChromaDB...) là một "stage" chạy
+# trong thread riêng ngay khi các stage nó phụ thuộc đã xong. UI được bind ngay,
+# request nào cần thành phần chưa sẵn sàng thì chờ (có timeout).
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class Stage:
+    def __init__(self, name, loader, deps=()):
+        self.name = name
+        self.loader = loader
+        self.deps = tuple(deps)
+        self.state = PENDING
+        self.error = None
+        self.started_at = None
+        self.load_time = None
+        self.done = threading.Event()
+
+    def status(self):
+        s = {"state": self.state}
+        if self.load_time is not None:
+            s["load_time_s"] = round(self.load_time, 3)
+        elif self.started_at is not None:
+            s["elapsed_s"] = round(time.perf_counter() - self.started_at, 3)
+        if self.error:
+            s["error"] = self.error
+        return s
+
+
+class StagedStartup:
+    def __init__(self):
+        self.stages = {}
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._on_complete = []
+
+    def stage(self, name, deps=()):
+        """Decorator đăng ký một stage: @startup.stage("catalog", deps=["history"])"""
+        def register(loader):
+            self.stages[name] = Stage(name, loader, deps)
+            return loader
+        return register
+
+    def on_complete(self, callback):
+        self._on_complete.append(callback)
+
+    def start(self):
+        """Chạy mọi stage trong thread nền, không chặn luồng chính"""
+        self.started_at = time.perf_counter()
+        for stage in self.stages.values():
+            threading.Thread(target=self._run, args=(stage,), name=f"startup-{stage.name}", daemon=True).start()
+
+    def _run(self, stage):
+        for dep in stage.deps:
+            self.stages[dep].done.wait()
+        failed = [dep for dep in stage.deps if self.stages[dep].state != READY]
+        stage.started_at = time.perf_counter()
+        if failed:
+            stage.state, stage.error = FAILED, f"phụ thuộc lỗi: {', '.join(failed)}"
+        else:
+            stage.state = LOADING
+            try:
+                stage.loader()
+                stage.state = READY
+            except BaseException as e:
+                # Bắt cả SystemExit (exit() trong loader) để không làm chết thread ngầm
+                stage.state, stage.error = FAILED, f"{type(e).__name__}: {e}"
+                print(f"❌ Stage '{stage.name}' lỗi: {stage.error}")
+        stage.load_time = time.perf_counter() - stage.started_at
+        stage.done.set()
+
+        with self._lock:
+            finished = all(s.done.is_set() for s in self.stages.values())
+            callbacks, self._on_complete = (self._on_complete, []) if finished else ([], self._on_complete)
+        for callback in callbacks:
+            callback()
+
+    def wait(self, name, timeout=120.0):
+        """Chờ stage xong; True nếu sẵn sàng"""
+        stage = self.stages[name]
+        stage.done.wait(timeout)
+        return stage.state == READY
+
+    def is_ready(self, name=None):
+        stages = [self.stages[name]] if name else self.stages.values()
+        return all(s.state == READY for s in stages)
+
+    def status(self):
+        return {
+            "ready": self.is_ready(),
+            "uptime_s": round(time.perf_counter() - self.started_at, 3) if self.started_at else 0.0,
+            "stages": {name: stage.status() for name, stage in self.stages.items()},
+        }
+
+    def report(self):
+        """In bảng thời gian từng stage"""
+        total = time.perf_counter() - self.started_at
+        print("⏱️ Thời gian khởi động theo giai đoạn:")
+        for stage in self.stages.values():
+            offset = stage.started_at - self.started_at if stage.started_at else 0.0
+            print(f"   {stage.name:<12} {stage.state:<8} {stage.load_time or 0:7.2f}s  (bắt đầu sau {offset:.2f}s)")
+        print(f"   {'TỔNG':<12} {'':<8} {total:7.2f}s")
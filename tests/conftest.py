@@ -0,0 +1,19 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Các module nằm phẳng ở thư mục gốc dự án
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def ratings_frame():
+    """Rating giả lập nhỏ: 120 sách x 80 user, có rating trùng (cùng user, cùng sách)"""
+    rng = np.random.default_rng(0)
+    n = 1500
+    return pd.DataFrame({"user_id": [f"u{u}" for u in rng.integers(0, 80, n)],
+                         "isbn": [str(9780000000000 + b) for b in rng.integers(0, 120, n)],
+                         "rating": rng.integers(1, 6, n).astype(float)})
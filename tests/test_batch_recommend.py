@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_recommend import BatchRecommender, read_requests, run
+from bench_suite import make_dataset, phase_build
+from history_store import get_store
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory):
+    # Catalogue giả lập nhỏ + vector index (HashEmbeddings) + bảng láng giềng CF, như bench_suite.py
+    directory = str(tmp_path_factory.mktemp("batch"))
+    make_dataset(directory, n_books=300, n_queries=10, ratings_per_book=5, seed=0)
+    phase_build(directory, "hash")
+    return directory
+
+
+def write_input(path):
+    lines = [json.dumps({"id": "a", "query": "dragon wizard magic forest", "category": "Children's Fiction"}),
+             "history science economy",
+             "",
+             json.dumps({"id": "c", "query": "love war family secret", "tone": "Sad", "category": "All"}),
+             json.dumps({"id": "d", "user_id": "reader-1"}),
+             json.dumps({"id": "e", "user_id": "nobody"})]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def run_to_lines(data_dir, input_path, **kwargs):
+    out = io.StringIO()
+    recommender = None
+    if kwargs.get("workers", 1) == 1:
+        recommender = BatchRecommender.from_paths(base_dir=data_dir, model_name="hash", top_k=5)
+    done = run(read_requests(str(input_path)), out, {"base_dir": data_dir, "model_name": "hash", "top_k": 5},
+               recommender=recommender, **kwargs)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert done == len(lines)
+    return lines
+
+
+def test_jsonl_round_trip(data_dir, tmp_path):
+    get_store(os.path.join(data_dir, "user_history.db")).log_search("reader-1", "planet space rocket", "x")
+    input_path = tmp_path / "requests.jsonl"
+    write_input(input_path)
+
+    # batch_size nhỏ: nhiều lô, kết quả vẫn đúng thứ tự đầu vào
+    lines = run_to_lines(data_dir, input_path, batch_size=2)
+    assert [r.get("id") for r in lines] == ["a", None, "c", "d", "e"]
+    assert lines[1]["query"] == "history science economy"
+    assert lines[2]["tone"] == "Sad"
+    # Chỉ có user_id -> query ghép từ lịch sử; user chưa tìm gì -> báo lỗi, không có kết quả
+    assert lines[3]["user_id"] == "reader-1" and lines[3]["query"] == "planet space rocket"
+    assert lines[4]["results"] == [] and "error" in lines[4]
+
+    books = pd.read_csv(os.path.join(data_dir, "books_with_emotions.csv"), dtype={"isbn13": str}).set_index("isbn13")
+    for r in lines[:4]:
+        assert 0 < len(r["results"]) <= 5
+        scores = [item["score"] for item in r["results"]]
+        assert scores == sorted(scores, reverse=True)
+        for item in r["results"]:
+            assert books.loc[item["isbn13"], "title"] == item["title"]
+    assert all(books.loc[item["isbn13"], "simple_categories"] == "Children's Fiction" for item in lines[0]["results"])
+
+    # Cùng đầu vào, một lô duy nhất -> cùng kết quả
+    assert run_to_lines(data_dir, input_path, batch_size=256) == lines
+
+
+def test_workers_match_single_process(data_dir, tmp_path):
+    input_path = tmp_path / "requests.jsonl"
+    input_path.write_text(open(os.path.join(data_dir, "queries.jsonl"), encoding="utf-8").read(), encoding="utf-8")
+    single = run_to_lines(data_dir, input_path, batch_size=3)
+    assert len(single) == 10
+    assert run_to_lines(data_dir, input_path, batch_size=3, workers=2) == single
+
+
+def test_stale_neighbor_table_is_rebuilt(data_dir, tmp_path, capsys):
+    directory = str(tmp_path / "data")
+    shutil.copytree(data_dir, directory)
+    assert BatchRecommender.from_paths(base_dir=directory, model_name="hash", open_history=False).neighbors.k
+    assert "không khớp" not in capsys.readouterr().err
+
+    # ratings.csv đổi sau khi dựng cf_neighbors/ -> không dùng bảng cũ
+    with open(os.path.join(directory, "ratings.csv"), "a", encoding="utf-8") as f:
+        f.write("u-new,9999999999999,5\nu-new,9780000000000,5\n")
+    recommender = BatchRecommender.from_paths(base_dir=directory, model_name="hash", open_history=False)
+    assert "9999999999999" in np.asarray(recommender.neighbors.isbns).astype(str)
+    assert "không khớp ratings.csv" in capsys.readouterr().err
+
+
+def test_profile_only_user_gets_recommendations(data_dir):
+    recommender = BatchRecommender.from_paths(base_dir=data_dir, model_name="hash", top_k=5)
+    # Có hồ sơ sở thích nhưng không còn lịch sử tìm kiếm (vd user_history.db đã bị xóa)
+    vector = recommender.embed(["dragon wizard magic forest"])[0]
+    recommender.profiles.update("profile-only", vector)
+    by_profile, by_query, unknown = recommender.recommend_batch(
+        [{"user_id": "profile-only"}, {"query": "dragon wizard magic forest"}, {"user_id": "no-profile"}])
+    assert "error" not in by_profile
+    assert by_profile["results"] == by_query["results"] != []
+    assert unknown["results"] == [] and "error" in unknown
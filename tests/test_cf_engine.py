@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+
+from cf_engine import CFEngine, NeighborTable
+
+
+def legacy_model(df):
+    # Cách cũ của gradio-dashboard.py: pivot dày -> fillna(0) -> CSR -> kneighbors
+    df = df.copy()
+    df['isbn'] = df['isbn'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
+    pivot = df.pivot_table(index='isbn', columns='user_id', values='rating').fillna(0)
+    model = NearestNeighbors(metric='cosine', algorithm='brute')
+    model.fit(csr_matrix(pivot.values))
+    return pivot, model
+
+
+def legacy_recommend(pivot, model, isbn, n_neighbors=6):
+    query_index = pivot.index.get_loc(isbn)
+    distances, indices = model.kneighbors(pivot.iloc[query_index, :].values.reshape(1, -1), n_neighbors=n_neighbors)
+    return [pivot.index[idx] for idx in indices.flatten()[1:]]
+
+
+def cosine_distances_to(pivot, isbn, recs):
+    # Khoảng cách của từng gợi ý tới sách gốc: so theo khoảng cách để thứ tự khi hòa không quan trọng
+    values = pivot.values
+    q = values[pivot.index.get_loc(isbn)]
+    rows = values[[pivot.index.get_loc(r) for r in recs]]
+    return 1.0 - rows @ q / (np.linalg.norm(rows, axis=1) * np.linalg.norm(q))
+
+
+def test_sparse_matrix_matches_pivot(ratings_frame):
+    pivot, _ = legacy_model(ratings_frame)
+    engine = CFEngine.from_frame(ratings_frame)
+    assert list(engine.isbns) == list(pivot.index)
+    # Rating trùng được lấy trung bình như pivot_table
+    np.testing.assert_allclose(engine.matrix.toarray(), pivot.values)
+
+
+def test_recommend_matches_pivot_kneighbors(ratings_frame):
+    pivot, model = legacy_model(ratings_frame)
+    engine = CFEngine.from_frame(ratings_frame)
+    for isbn in pivot.index:
+        old = legacy_recommend(pivot, model, isbn)
+        new = engine.recommend(isbn)
+        assert len(new) == len(old) == 5
+        np.testing.assert_allclose(cosine_distances_to(pivot, isbn, new),
+                                   cosine_distances_to(pivot, isbn, old), atol=1e-9)
+
+
+def test_float_isbn_and_unknown_isbn(ratings_frame):
+    engine = CFEngine.from_frame(ratings_frame)
+    isbn = engine.isbns[0]
+    # ISBN đọc từ CSV dạng float ("...0.0") vẫn tra được; ISBN lạ -> không gợi ý
+    assert engine.recommend(isbn + ".0") == engine.recommend(isbn)
+    assert engine.recommend("0000000000000") == []
+    # ratings.csv có ISBN dạng float
+    floats = ratings_frame.assign(isbn=ratings_frame['isbn'] + ".0")
+    assert list(CFEngine.from_frame(floats).isbns) == list(engine.isbns)
+    assert pd.Index(engine.isbns).is_monotonic_increasing
+
+
+def test_neighbor_table_matches_pivot_kneighbors(ratings_frame, tmp_path):
+    pivot, model = legacy_model(ratings_frame)
+    table = NeighborTable.build(CFEngine.from_frame(ratings_frame), k=8, block_size=7)
+    table.save(str(tmp_path))
+    loaded = NeighborTable.load(str(tmp_path))
+    for isbn in pivot.index:
+        old = legacy_recommend(pivot, model, isbn)
+        new = loaded.recommend(isbn)
+        np.testing.assert_allclose(cosine_distances_to(pivot, isbn, new),
+                                   cosine_distances_to(pivot, isbn, old), atol=1e-6)
+        # scores lưu sẵn = 1 - khoảng cách cosine
+        row = list(loaded.isbns).index(isbn)
+        np.testing.assert_allclose(1.0 - loaded.scores[row, :5], cosine_distances_to(pivot, isbn, new), atol=1e-6)
+    # n_neighbors lớn hơn K: chỉ trả tối đa K láng giềng
+    assert len(loaded.recommend(pivot.index[0], n_neighbors=50)) == 8
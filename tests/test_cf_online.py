@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cf_engine import rating_matrices
+from cf_online import OnlineCF
+
+
+def exact_similarities(df):
+    """Cosine chính xác (dày) giữa mọi cặp sách, dựng lại từ đầu: (isbns, ma trận sim, chính nó = -inf)"""
+    isbns, _, total, count = rating_matrices(df)
+    means = total.copy()
+    means.data = means.data / count.data
+    dense = means.toarray()
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    dense = dense / np.where(norms == 0, 1.0, norms)
+    sims = dense @ dense.T
+    np.fill_diagonal(sims, -np.inf)
+    return isbns, sims
+
+
+def assert_matches_rebuild(engine, df):
+    """Mỗi danh sách láng giềng trực tuyến = top-K của bản dựng lại (so điểm, không phụ thuộc thứ tự hòa)"""
+    isbns, sims = exact_similarities(df)
+    row_of = {isbn: i for i, isbn in enumerate(isbns)}
+    online_isbns = engine.isbns
+    k = min(engine.k, len(isbns) - 1)
+    for r, isbn in enumerate(online_isbns):
+        i = row_of[str(isbn)]
+        expected = np.sort(sims[i])[::-1][:k]
+        idx, sc = engine.indices[r, :k], engine.scores[r, :k]
+        assert (idx >= 0).all()
+        np.testing.assert_allclose(sc, expected, atol=1e-5)
+        actual = [sims[i, row_of[str(online_isbns[j])]] for j in idx]
+        np.testing.assert_allclose(actual, sc, atol=1e-5)
+
+
+def test_incremental_updates_match_full_rebuild(ratings_frame):
+    isbns, users, total, count = rating_matrices(ratings_frame)
+    engine = OnlineCF(isbns, users, total, count, k=5)
+    assert_matches_rebuild(engine, ratings_frame)
+
+    rng = np.random.default_rng(1)
+    df = ratings_frame
+    for batch in range(5):
+        n = 60
+        # Sách/user cũ và mới, rating cao/thấp (điểm tương đồng vừa tăng vừa giảm)
+        events = pd.DataFrame({"user_id": [f"u{u}" for u in rng.integers(0, 90, n)],
+                               "isbn": [str(9780000000000 + b) for b in rng.integers(0, 130, n)],
+                               "rating": rng.integers(1, 6, n).astype(float)})
+        engine.apply(events.itertuples(index=False, name=None))
+        df = pd.concat([df, events], ignore_index=True)
+        assert_matches_rebuild(engine, df)
+
+
+def test_compact_keeps_neighbors(ratings_frame, tmp_path):
+    isbns, users, total, count = rating_matrices(ratings_frame)
+    engine = OnlineCF(isbns, users, total, count, k=5)
+    events = [("u_new", "9780000000999", 5.0), ("u1", "9780000000999", 4.0), ("u_new", isbns[0], 5.0)]
+    engine.apply(events)
+    engine.compact(str(tmp_path / "snapshot"))
+    df = pd.concat([ratings_frame, pd.DataFrame(events, columns=["user_id", "isbn", "rating"])], ignore_index=True)
+    assert_matches_rebuild(engine, df)
+    assert list(engine.isbns) == sorted(engine.isbns)
+
+
+def test_recommend_not_blocked_while_applying(ratings_frame):
+    isbns, users, total, count = rating_matrices(ratings_frame)
+    engine = OnlineCF(isbns, users, total, count, k=5)
+    before = engine.recommend(isbns[0])
+    # Giữ khóa ghi như một lô đang tính dở: recommend vẫn trả kết quả của bản đã công bố
+    with engine._write_lock:
+        done = []
+        thread = threading.Thread(target=lambda: done.append(engine.recommend(isbns[0])))
+        thread.start()
+        thread.join(timeout=5)
+        assert done == [before]
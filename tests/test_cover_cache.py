@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from cover_cache import CoverCache
+from cover_standin import start_standin
+
+PLACEHOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cover-not-found.jpg")
+
+
+@pytest.fixture
+def server():
+    server = start_standin(missing_rate=0.0, blank_rate=0.0)
+    yield server
+    server.shutdown()
+
+
+def make_cache(tmp_path, **kwargs):
+    return CoverCache(str(tmp_path / "covers"), placeholder=PLACEHOLDER, workers=2, **kwargs)
+
+
+def test_miss_then_local_hit(tmp_path, server):
+    cache = make_cache(tmp_path)
+    url = f"{server.base_url}/cover/1.jpg"
+    assert cache.resolve(url) == url  # chưa có: trả URL gốc, tải nền
+    assert cache.wait(10)
+    path = cache.resolve(url)
+    assert os.path.isfile(path) and path.startswith(cache.cache_dir)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+    reopened = make_cache(tmp_path)
+    assert reopened.resolve(url) == path
+    reopened.close()
+
+
+def test_missing_cover_maps_to_placeholder_and_retries_after_ttl(tmp_path, server):
+    server.missing_rate = 1.0
+    cache = make_cache(tmp_path, missing_ttl=3600)
+    url = f"{server.base_url}/cover/404.jpg"
+    cache.prefetch([url])
+    assert cache.wait(10)
+    assert cache.resolve(url) == cache.placeholder
+    assert cache.resolve("") == cache.placeholder
+
+    # Ảnh xuất hiện sau đó; chỉ được tải lại khi ghi nhớ "không có ảnh" đã hết hạn
+    server.missing_rate = 0.0
+    cache.resolve(url)
+    assert cache.wait(10) and cache.stats()["fetched"] == 0
+    cache.missing_ttl = 0
+    assert cache.resolve(url) == cache.placeholder
+    assert cache.wait(10)
+    assert os.path.isfile(cache.resolve(url)) and cache.resolve(url) != cache.placeholder
+    cache.close()
+
+
+def test_identical_images_share_one_file(tmp_path, server):
+    server.blank_rate = 1.0
+    cache = make_cache(tmp_path)
+    urls = [f"{server.base_url}/cover/{i}.jpg" for i in range(5)]
+    cache.prefetch(urls)
+    assert cache.wait(10)
+    assert len({cache.resolve(u) for u in urls}) == 1
+    assert cache.stats()["files"] == 2  # ảnh trống + ảnh thay thế
+    cache.close()
+
+
+@pytest.mark.parametrize("recent_s, kept", [(0.0, False), (3600.0, True)])
+def test_eviction_skips_recently_served_files(tmp_path, server, recent_s, kept):
+    cache = make_cache(tmp_path, recent_s=recent_s)
+    first = f"{server.base_url}/cover/first.jpg"
+    cache.prefetch([first])
+    assert cache.wait(10)
+    path = cache.resolve(first)
+    assert os.path.isfile(path)
+    cache.max_bytes = 1
+    # Ảnh mới vượt giới hạn -> LRU xóa ảnh cũ, trừ khi vừa trả cho gallery
+    cache.prefetch([f"{server.base_url}/cover/second.jpg"])
+    assert cache.wait(10)
+    assert os.path.isfile(path) == kept
+    cache.close()
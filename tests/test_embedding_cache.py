@@ -0,0 +1,109 @@
+import numpy as np
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingModel:
+    """Model giả: vector xác định theo văn bản, đếm số văn bản đã embed"""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = 0
+
+    def vector(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % 2**32)
+        return rng.standard_normal(self.dim).astype(np.float32)
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self.vector(t).tolist() for t in texts]
+
+
+def test_reopen_serves_cached_vectors(tmp_path):
+    model = CountingModel()
+    texts = [f"book {i}" for i in range(50)]
+    cache = EmbeddingCache(str(tmp_path), "test-model")
+    first = CachedEmbeddings(model, cache).embed_documents(texts)
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "test-model")
+    second = CachedEmbeddings(model, reopened).embed_documents(texts)
+    assert model.calls == len(texts)
+    assert second == first
+    assert reopened.stats()["hits"] == len(texts)
+
+
+def test_other_model_does_not_share_entries(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    CachedEmbeddings(model, cache).embed_documents(["x"])
+    cache.flush()
+    other = EmbeddingCache(str(tmp_path), "model-b")
+    assert other.get_many(["x"]) == [None]
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(str(tmp_path), "test-model", max_entries=100)
+    embeddings = CachedEmbeddings(model, cache)
+    embeddings.embed_documents([f"old {i}" for i in range(100)])
+    embeddings.embed_documents(["old 99"])  # dùng lại gần đây
+    embeddings.embed_documents([f"new {i}" for i in range(20)])
+    assert len(cache) <= 100
+    assert cache.stats()["evictions"] >= 20
+    hits = cache.get_many(["old 99", "new 19"])
+    assert all(v is not None for v in hits)
+    np.testing.assert_allclose(hits[0], model.vector("old 99"))
+
+
+def test_crash_after_slot_reuse_never_returns_wrong_vector(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(str(tmp_path), "test-model", max_entries=100)
+    embeddings = CachedEmbeddings(model, cache)
+    embeddings.embed_documents([f"old {i}" for i in range(100)])
+    cache.flush()
+    # Evict + ghi đè slot cũ bằng vector mới, rồi "crash" (không flush)
+    embeddings.embed_documents([f"new {i}" for i in range(30)])
+
+    reopened = EmbeddingCache(str(tmp_path), "test-model", max_entries=100)
+    texts = [f"old {i}" for i in range(100)] + [f"new {i}" for i in range(30)]
+    for text, vec in zip(texts, reopened.get_many(texts)):
+        if vec is not None:
+            np.testing.assert_allclose(vec, model.vector(text))
+
+
+def test_torn_index_write_opens_consistent_prefix(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache(str(tmp_path), "test-model")
+    embeddings = CachedEmbeddings(model, cache)
+    embeddings.embed_documents([f"book {i}" for i in range(10)])
+    cache.flush()
+    directory = tmp_path / "test-model"
+    old_meta = (directory / "meta.json").read_text()
+    embeddings.embed_documents([f"book {i}" for i in range(10, 30)])
+    cache.flush()
+    # Crash sau khi ghi chỉ mục mới, trước khi ghi meta.json: meta cũ + chỉ mục mới vẫn mở được
+    (directory / "meta.json").write_text(old_meta)
+    reopened = EmbeddingCache(str(tmp_path), "test-model")
+    assert len(reopened) == 30
+
+    # Định dạng cũ (keys.npy / last_used.npy / meta["size"] riêng), crash giữa các lần ghi:
+    # keys.npy đã có 30 slot, last_used.npy và meta["size"] còn 10 -> mở được 10 mục đầu
+    with np.load(directory / "index.npz") as data:
+        np.save(directory / "keys.npy", data["keys"])
+        np.save(directory / "last_used.npy", data["last_used"][:10])
+    (directory / "index.npz").unlink()
+    (directory / "meta.json").write_text('{"model": "test-model", "dim": 8, "size": 10}')
+    legacy = EmbeddingCache(str(tmp_path), "test-model")
+    texts = [f"book {i}" for i in range(30)]
+    vectors = legacy.get_many(texts)
+    assert sum(v is not None for v in vectors) == 10
+    for text, vec in zip(texts, vectors):
+        if vec is not None:
+            np.testing.assert_allclose(vec, model.vector(text))
+
+    # Lần flush sau chuyển sang index.npz và bỏ các file cũ
+    CachedEmbeddings(model, legacy).embed_documents(texts)
+    legacy.flush()
+    assert (directory / "index.npz").exists() and not (directory / "keys.npy").exists()
+    assert len(EmbeddingCache(str(tmp_path), "test-model")) == 30
@@ -0,0 +1,74 @@
+import re
+import sqlite3
+import threading
+import time
+
+from history_store import HistoryStore, get_store
+
+
+def make_store(tmp_path, **kwargs):
+    return HistoryStore(str(tmp_path / "history.db"), **kwargs)
+
+
+def test_read_your_writes(tmp_path):
+    # Cửa sổ gom lô dài: đọc ngay sau khi log vẫn phải thấy bản ghi (không chờ hết cửa sổ)
+    store = make_store(tmp_path, flush_interval=2.0)
+    for query, book in [("dragons", "A"), ("space", "B"), ("dragons", "C"), ("ocean", "D")]:
+        store.log_search("u1", query, book)
+    store.log_search("u2", "history", "E")
+
+    start = time.perf_counter()
+    assert store.get_recent_interests("u1", current_query="ocean") == ["dragons", "space"]
+    assert time.perf_counter() - start < 1.0
+    assert store.get_recent_interests("u1", limit=2) == ["ocean", "dragons"]
+
+    logs = store.get_history_logs("u1")
+    assert [book for _, book in logs] == ["D", "C", "B", "A"]
+    assert all(re.fullmatch(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}", ts) for ts, _ in logs)
+    assert [book for _, book in store.get_history_logs("u2")] == ["E"]
+    assert store.get_history_logs("nobody") == []
+    store.close()
+
+
+def test_close_flushes_and_reopen_sees_everything(tmp_path):
+    store = make_store(tmp_path, flush_interval=0.5, max_batch=16)
+
+    def worker(w):
+        for i in range(50):
+            store.log_search(f"u{w}", f"q{i}", f"b{i}")
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    store.close()
+
+    reopened = make_store(tmp_path)
+    for w in range(4):
+        # Thứ tự ghi của từng user được giữ nguyên
+        assert [book for _, book in reopened.get_history_logs(f"u{w}", limit=100)] == [f"b{i}" for i in reversed(range(50))]
+    reopened.close()
+
+
+def test_upgrades_db_without_top_book(tmp_path):
+    # DB kiểu cũ chưa có cột top_book
+    path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE search_history (id INTEGER PRIMARY KEY, user_id TEXT, query TEXT, "
+                 "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO search_history (user_id, query) VALUES ('u1', 'old query')")
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    store.log_search("u1", "new query", "Book")
+    assert store.get_recent_interests("u1") == ["new query", "old query"]
+    assert [book for _, book in store.get_history_logs("u1")] == ["Book", None]
+    store.close()
+
+
+def test_get_store_is_shared_per_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = get_store("shared.db")
+    assert get_store(str(tmp_path / "shared.db")) is store
+    assert get_store("other.db") is not store
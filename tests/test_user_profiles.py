@@ -0,0 +1,46 @@
+import numpy as np
+
+from user_profiles import ProfileStore
+
+
+def make_store(tmp_path):
+    # flush_interval lớn: chỉ ghi khi test gọi flush()
+    return ProfileStore(str(tmp_path / "profiles.db"), "test-model", flush_interval=3600)
+
+
+def test_pending_updates_visible_before_and_after_flush(tmp_path):
+    store = make_store(tmp_path)
+    v = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    store.update("u1", v, ts=1000.0)
+    np.testing.assert_allclose(store.get("u1"), v)
+    store.flush()
+    np.testing.assert_allclose(store.get("u1"), v, atol=1e-3)
+    assert store.stats()["pending"] == 0
+    store.close()
+
+
+def test_failed_flush_keeps_pending_updates(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    store.update("u1", [1.0, 0.0, 0.0], ts=1000.0)
+
+    def broken(pending):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(store, "_write", broken)
+    store.flush()
+    # Không mất: vẫn đọc được, vẫn còn trong hàng chờ, cộng tiếp được
+    np.testing.assert_allclose(store.get("u1"), [1.0, 0.0, 0.0])
+    store.update("u1", [0.0, 1.0, 0.0], ts=1000.0)
+    monkeypatch.undo()
+    store.flush()
+    np.testing.assert_allclose(store.get("u1"), np.array([1.0, 1.0, 0.0]) / np.sqrt(2), atol=1e-3)
+    store.close()
+
+
+def test_profiles_survive_reopen(tmp_path):
+    store = make_store(tmp_path)
+    store.update("u1", [0.0, 0.0, 2.0], ts=1000.0)
+    store.close()
+    reopened = make_store(tmp_path)
+    np.testing.assert_allclose(reopened.get("u1"), [0.0, 0.0, 1.0], atol=1e-3)
+    assert reopened.stats()["users"] == 1
+    reopened.close()
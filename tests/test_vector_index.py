@@ -0,0 +1,55 @@
+import numpy as np
+
+from vector_index import VectorIndex, update_index
+
+
+def random_rows(rng, n, dim=8):
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def test_update_index_matches_full_build(tmp_path):
+    rng = np.random.default_rng(0)
+    isbns = 9780000000000 + np.arange(200, dtype=np.uint64)
+    vectors = random_rows(rng, 200)
+    categories = np.array(["Fiction", "Nonfiction", ""])[rng.integers(0, 3, 200)]
+    index_dir = str(tmp_path / "index")
+    VectorIndex.build(index_dir, isbns, vectors, categories, model_name="test-model", source_version=1.0)
+
+    # 10 sách bị xóa, 5 sách sửa (vector + thể loại mới), 20 sách mới (có cả thể loại chưa từng có)
+    removed = isbns[:10]
+    changed = np.concatenate([isbns[10:15], 9790000000000 + np.arange(20, dtype=np.uint64)])
+    changed_vectors = random_rows(rng, 25)
+    changed_categories = ["Children's Fiction"] * 5 + list(np.array(["Fiction", ""])[rng.integers(0, 2, 20)])
+    total = update_index(index_dir, changed, changed_vectors, changed_categories, removed, source_version=2.0)
+    assert total == 190 + 20
+
+    # Dựng lại từ đầu với cùng nội dung -> cùng kết quả tìm kiếm
+    expected = {int(i): (v, c) for i, v, c in zip(isbns, vectors, categories)}
+    for i in removed:
+        del expected[int(i)]
+    expected.update({int(i): (v, c) for i, v, c in zip(changed, changed_vectors, changed_categories)})
+    full_dir = str(tmp_path / "full")
+    keys = sorted(expected)
+    VectorIndex.build(full_dir, keys, np.stack([expected[k][0] for k in keys]), [expected[k][1] for k in keys])
+
+    patched, full = VectorIndex.load(index_dir), VectorIndex.load(full_dir)
+    assert len(patched) == len(full) == len(expected)
+    assert VectorIndex.read_meta(index_dir)["source_version"] == 2.0
+    assert VectorIndex.read_meta(index_dir)["model"] == "test-model"
+    queries = random_rows(rng, 20)
+    for category in (None, "Fiction", "Nonfiction", "Children's Fiction"):
+        for q in queries:
+            assert list(patched.search(q, 10, category)) == list(full.search(q, 10, category))
+    # Sách đã sửa chỉ còn một hàng, mang thể loại mới
+    assert list(patched.search(changed_vectors[0], 1, "Children's Fiction")) == [str(changed[0])]
+
+
+def test_update_index_without_changes_keeps_rows(tmp_path):
+    rng = np.random.default_rng(1)
+    isbns = 9780000000000 + np.arange(30, dtype=np.uint64)
+    index_dir = str(tmp_path / "index")
+    VectorIndex.build(index_dir, isbns, random_rows(rng, 30))
+    assert update_index(index_dir, [], [], removed=isbns[:3]) == 27
+    index = VectorIndex.load(index_dir)
+    assert not index.has_categories
+    assert set(np.asarray(index.isbns).tolist()) == set(isbns[3:].tolist())
@@ -0,0 +1,263 @@
+import argparse
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# --- HỒ SƠ SỞ THÍCH THEO USER (TRUNG BÌNH EMBEDDING CÓ SUY GIẢM) ---
+# Thay cho kiểu "ghép 3 query gần nhất thành một câu rồi embed + vector search lại mỗi request":
+#   * Mỗi lần log_search, embedding của query (đã có sẵn trong cache tìm kiếm) được cộng dồn
+#     vào trung bình có trọng số của user; trọng số cũ giảm một nửa sau mỗi half_life giây.
+#   * Gợi ý fallback chỉ cần một lần tra vector đã tính sẵn, không embed lại.
+#   * Lưu gọn trong user_profiles.db cạnh user_history.db: một dòng/user, vector float16.
+# Nhiều process (serve.py) dùng chung file: mỗi process chỉ giữ phần cộng thêm chưa ghi,
+# thread nền gộp vào dòng trong DB (đọc-sửa-ghi trong một transaction) nên không ghi đè nhau.
+# Phần đang ghi dở vẫn thuộc về process cho tới khi commit xong; ghi lỗi thì gộp trả lại hàng chờ.
+
+PROFILES_DB = "user_profiles.db"
+DEFAULT_HALF_LIFE = 7 * 24 * 3600.0
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS user_profiles
+            (user_id TEXT PRIMARY KEY, mean BLOB NOT NULL, weight REAL NOT NULL,
+             updated REAL NOT NULL, queries INTEGER NOT NULL)'''
+META_SCHEMA = "CREATE TABLE IF NOT EXISTS profile_meta (key TEXT PRIMARY KEY, value TEXT)"
+
+
+def profiles_path_for(history_db):
+    """user_history.db -> user_profiles.db cùng thư mục"""
+    return os.path.join(os.path.dirname(os.path.abspath(history_db)), PROFILES_DB)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class ProfileStore:
+    def __init__(self, db_path, model_name, half_life=DEFAULT_HALF_LIFE, flush_interval=1.0):
+        self.db_path = db_path
+        self.model_name = str(model_name)
+        self.half_life = half_life
+        self.flush_interval = flush_interval
+
+        # user_id -> [tổng vector, tổng trọng số, thời điểm, số query] chưa ghi xuống DB
+        self._pending = {}
+        self._lock = threading.Lock()
+        # flush giữ suốt lúc ghi; get() giữ khi đọc -> không bao giờ thấy phần đã lấy khỏi hàng chờ mà chưa commit
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._closed = False
+        self._local = threading.local()
+        # False khi DB được dựng bằng model embedding khác (vector khác không gian) cho tới khi dựng lại
+        self.enabled = True
+
+        self._init_schema()
+        self._writer = threading.Thread(target=self._writer_loop, name="profile-writer", daemon=True)
+        self._writer.start()
+
+    # --- KẾT NỐI ---
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self):
+        """Một kết nối cho mỗi thread đọc"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(SCHEMA)
+                conn.execute(META_SCHEMA)
+                row = conn.execute("SELECT value FROM profile_meta WHERE key = 'model'").fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO profile_meta (key, value) VALUES ('model', ?)", (self.model_name,))
+                elif row[0] != self.model_name:
+                    # Không xóa: process khác có thể vẫn đang dùng đúng model cũ
+                    print(f"⚠️ Hồ sơ user dựng bằng model '{row[0]}', không phải '{self.model_name}' -> tạm tắt. "
+                          f"Chạy 'python user_profiles.py --model {self.model_name}' để dựng lại.")
+                    self.enabled = False
+        finally:
+            conn.close()
+
+    def _decay(self, since, now):
+        return 0.5 ** (max(now - since, 0.0) / self.half_life)
+
+    def _merge(self, older, newer):
+        """Gộp hai phần cộng thêm [tổng vector, trọng số, thời điểm, số query] của cùng một user"""
+        now = max(older[2], newer[2])
+        d_old, d_new = self._decay(older[2], now), self._decay(newer[2], now)
+        return [older[0] * d_old + newer[0] * d_new, older[1] * d_old + newer[1] * d_new, now, older[3] + newer[3]]
+
+    # --- GHI ---
+    def update(self, user_id, vector, ts=None):
+        """Cộng embedding (đã chuẩn hóa) của một query vào hồ sơ; ghi xuống DB ở thread nền"""
+        if self._closed:
+            raise RuntimeError("ProfileStore đã đóng")
+        if not self.enabled:
+            return
+        ts = time.time() if ts is None else ts
+        vector = _normalize(vector)
+        with self._lock:
+            entry = self._pending.get(user_id)
+            if entry is None:
+                self._pending[user_id] = [vector.copy(), 1.0, ts, 1]
+            else:
+                d = self._decay(entry[2], ts)
+                entry[0] = entry[0] * d + vector
+                entry[1] = entry[1] * d + 1.0
+                entry[2] = max(entry[2], ts)
+                entry[3] += 1
+
+    def _writer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Gộp mọi phần cộng thêm đang chờ vào DB trong một transaction.
+        Lỗi ghi -> trả phần đó về hàng chờ (lần flush sau thử lại), không mất query nào."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self._write(pending)
+            except Exception as e:
+                with self._lock:
+                    for user_id, entry in pending.items():
+                        newer = self._pending.get(user_id)
+                        self._pending[user_id] = entry if newer is None else self._merge(entry, newer)
+                print(f"Lỗi ghi hồ sơ user: {e}")
+
+    def _write(self, pending):
+        conn = self._conn()
+        with conn:
+            # BEGIN IMMEDIATE: process khác không chen vào giữa đọc và ghi
+            conn.execute("BEGIN IMMEDIATE")
+            for user_id, (total, weight, ts, n) in pending.items():
+                row = conn.execute("SELECT mean, weight, updated, queries FROM user_profiles WHERE user_id = ?",
+                                   (user_id,)).fetchone()
+                if row is not None and len(row[0]) == total.size * 2:
+                    now = max(ts, row[2])
+                    old_weight = row[1] * self._decay(row[2], now)
+                    total = total * self._decay(ts, now) + np.frombuffer(row[0], dtype=np.float16) * old_weight
+                    weight = weight * self._decay(ts, now) + old_weight
+                    ts, n = now, n + row[3]
+                mean = (total / weight).astype(np.float16)
+                conn.execute("INSERT OR REPLACE INTO user_profiles (user_id, mean, weight, updated, queries) "
+                             "VALUES (?, ?, ?, ?, ?)", (user_id, mean.tobytes(), weight, ts, n))
+
+    # --- ĐỌC ---
+    def get(self, user_id):
+        """Vector sở thích đã chuẩn hóa (float32) hoặc None nếu user chưa có hồ sơ.
+        Gồm cả các query vừa cộng mà chưa ghi xuống DB."""
+        if not self.enabled:
+            return None
+        with self._flush_lock:
+            row = self._conn().execute("SELECT mean, weight, updated FROM user_profiles WHERE user_id = ?",
+                                       (user_id,)).fetchone()
+            with self._lock:
+                entry = self._pending.get(user_id)
+                entry = None if entry is None else (entry[0].copy(), entry[1], entry[2])
+        if row is None and entry is None:
+            return None
+        if row is None:
+            return _normalize(entry[0])
+        total = np.frombuffer(row[0], dtype=np.float16).astype(np.float32)
+        if entry is not None and entry[0].size == total.size:
+            # Trọng số tương đối giữa phần trong DB và phần đang chờ
+            now = max(entry[2], row[2])
+            total = total * (row[1] * self._decay(row[2], now)) + entry[0] * self._decay(entry[2], now)
+        return _normalize(total)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        users = self._conn().execute("SELECT COUNT(*) FROM user_profiles").fetchone()[0]
+        return {"users": users, "pending": pending, "model": self.model_name, "enabled": self.enabled,
+                "half_life_s": self.half_life}
+
+    # --- DỰNG LẠI TỪ LỊCH SỬ ---
+    def rebuild_from_history(self, history_db, embed_documents, batch_size=256):
+        """Xóa hồ sơ rồi cộng lại toàn bộ search_history theo thứ tự thời gian.
+        embed_documents(list câu) -> list vector. Dùng cho lịch sử có từ trước khi có hồ sơ."""
+        with self._lock:
+            self._pending.clear()
+        with self._conn() as conn:
+            conn.execute("DELETE FROM user_profiles")
+            conn.execute("INSERT OR REPLACE INTO profile_meta (key, value) VALUES ('model', ?)", (self.model_name,))
+        self.enabled = True
+        src = sqlite3.connect(history_db)
+        try:
+            rows = src.execute("SELECT user_id, query, CAST(strftime('%s', timestamp) AS REAL) FROM search_history "
+                               "WHERE TRIM(COALESCE(query, '')) != '' ORDER BY id").fetchall()
+        finally:
+            src.close()
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            vectors = embed_documents([q for _, q, _ in chunk])
+            for (user_id, _, ts), vector in zip(chunk, vectors):
+                self.update(user_id, vector, ts)
+        self.flush()
+        return len(rows)
+
+    # --- ĐÓNG ---
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._writer.join(timeout=10)
+        self.flush()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_profiles(db_path, model_name, **kwargs):
+    """Mỗi file DB chỉ có một ProfileStore trong process"""
+    db_path = os.path.abspath(db_path)
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = ProfileStore(db_path, model_name, **kwargs)
+            # Thread ghi là daemon -> ghi nốt phần đang chờ khi thoát app
+            atexit.register(store.close)
+        return store
+
+
+def main():
+    from vector_ingest import MODEL_NAME, make_embedding_model
+
+    parser = argparse.ArgumentParser(description="Dựng lại hồ sơ sở thích user từ user_history.db")
+    parser.add_argument("--data-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", MODEL_NAME))
+    parser.add_argument("--half-life-days", type=float, default=DEFAULT_HALF_LIFE / 86400)
+    args = parser.parse_args()
+
+    history_db = os.path.join(args.data_dir, "user_history.db")
+    if not os.path.exists(history_db):
+        print(f"❌ Không tìm thấy {history_db}")
+        return
+    model = make_embedding_model(args.model)
+    store = ProfileStore(profiles_path_for(history_db), args.model, half_life=args.half_life_days * 86400)
+    start = time.perf_counter()
+    n = store.rebuild_from_history(history_db, model.embed_documents)
+    stats = store.stats()
+    store.close()
+    print(f"✅ Đã dựng {stats['users']} hồ sơ từ {n} lượt tìm trong {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from vector_quant import QUANTIZATIONS, load_quantizer, train_and_encode
+
+# --- VECTOR SEARCH TRONG PROCESS (KHÔNG QUA LANGCHAIN/CHROMA) ---
+# Mỗi query qua wrapper Chroma của LangChain: mở lại segment HNSW trong chroma_db/, dựng các
+# object Document, rồi dashboard lại parse Document để lấy ISBN. Ở đây ma trận embedding
+# float32 (đã chuẩn hóa L2) được memory-map cạnh một mảng ISBN, tìm kiếm trả thẳng mảng ISBN:
+#   * catalogue nhỏ: tìm chính xác bằng nhân ma trận theo từng khối
+#   * catalogue lớn: index HNSW (hnswlib, cài sẵn cùng chromadb qua chroma-hnswlib)
+# Thư mục chroma_db.vectors/ (cạnh chroma_db/):
+#   vectors.npy  float32 (n, d)      isbns.npy  uint64 (n,)
+#   categories.codes.npy  int32 (n,), -1 = không có      hnsw.bin  (tùy chọn)
+#   meta.json    model, số chiều, danh sách thể loại, mtime manifest của Chroma lúc export
+#   codes.int8.npy / codes.pq.npy + tham số  (tùy chọn, chế độ nén: vector_quant.py)
+# Vector đã chuẩn hóa -> xếp hạng theo cosine trùng với xếp hạng L2 mặc định của Chroma.
+# Chế độ nén (catalogue hàng triệu sách): quét mã nén lấy rerank*k ứng viên, rồi tính lại điểm
+# chính xác cho các ứng viên đó từ vectors.npy memory-map -> chỉ mã nén cần nằm trong RAM.
+
+META_FILE = "meta.json"
+HNSW_FILE = "hnsw.bin"
+# Từ ngưỡng này trở lên mới dựng/dùng HNSW; nhỏ hơn thì tìm chính xác vẫn nhanh hơn
+HNSW_MIN_ROWS = 200_000
+# Khối mã nén nhỏ hơn: bản float32 giải nén của khối còn nằm trong cache CPU (khối lớn chậm gấp ~3 lần)
+QUANT_BLOCK_SIZE = 8192
+
+
+def vector_index_dir_for(persist_dir):
+    """chroma_db/ -> chroma_db.vectors/"""
+    return os.path.normpath(persist_dir) + ".vectors"
+
+
+def _source_version(persist_dir):
+    from vector_ingest import manifest_path
+    path = manifest_path(persist_dir)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _advise_random(array):
+    """Chế độ nén chỉ đọc rải rác vài trăm hàng float32 mỗi query: tắt readahead/fault-around
+    của memory-map để không kéo cả vùng lân cận vào RAM"""
+    try:
+        import mmap
+        array._mmap.madvise(mmap.MADV_RANDOM)
+    except (AttributeError, OSError, ValueError):
+        pass
+
+
+def _hnswlib():
+    try:
+        import hnswlib
+        return hnswlib
+    except ImportError:
+        return None
+
+
+class VectorIndex:
+    def __init__(self, vectors, isbns, category_codes=None, categories=(), hnsw=None, block_size=65536, ef=128,
+                 quantizer=None, codes=None, rerank=4):
+        self.vectors = vectors
+        self.isbns = isbns
+        self.category_codes = category_codes
+        self.categories = list(categories)
+        self._category_id = {c: i for i, c in enumerate(self.categories)}
+        self.hnsw = hnsw
+        self.block_size = block_size
+        self.ef = ef
+        # Chế độ nén: bộ nén + mã (n, số byte/vector); rerank = số ứng viên tính lại chính xác / k
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rerank = rerank
+
+    def __len__(self):
+        return len(self.isbns)
+
+    @property
+    def backend(self):
+        if self.quantizer is not None:
+            return self.quantizer.kind
+        return "hnsw" if self.hnsw is not None else "exact"
+
+    @property
+    def has_categories(self):
+        return self.category_codes is not None
+
+    # --- DỰNG / NẠP ---
+
+    @classmethod
+    def build(cls, out_dir, isbns, vectors, categories=None, model_name=None, source_version=None, hnsw="auto",
+              quantization=None):
+        """Ghi index ra out_dir (ghi thư mục tạm rồi đổi tên). hnsw: True/False/"auto" (theo HNSW_MIN_ROWS).
+        quantization: None, "int8" hoặc "pq" -> ghi thêm mã nén; khi đó hnsw="auto" không dựng HNSW (HNSW giữ cả float32)."""
+        vectors = _normalize(vectors)
+        isbns = np.asarray(isbns, dtype=np.uint64)
+        tmp_dir = out_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+        np.save(os.path.join(tmp_dir, "isbns.npy"), isbns)
+        names = []
+        if categories is not None:
+            import pandas as pd
+            codes, uniques = pd.factorize(pd.Series(categories).replace("", np.nan))
+            np.save(os.path.join(tmp_dir, "categories.codes.npy"), codes.astype(np.int32))
+            names = [str(u) for u in uniques]
+
+        if quantization:
+            start = time.perf_counter()
+            vectors_mmap = np.load(os.path.join(tmp_dir, "vectors.npy"), mmap_mode="r")
+            train_and_encode(tmp_dir, vectors_mmap, quantization)
+            print(f"   🗜️ Nén {len(isbns):,} vector ({quantization}) trong {time.perf_counter() - start:.1f}s")
+
+        use_hnsw = hnsw is True or (hnsw == "auto" and not quantization and len(isbns) >= HNSW_MIN_ROWS
+                                    and _hnswlib() is not None)
+        if use_hnsw:
+            hnswlib = _hnswlib()
+            if hnswlib is None:
+                raise ImportError("Cần hnswlib (chroma-hnswlib) để dựng index HNSW")
+            start = time.perf_counter()
+            index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            index.init_index(max_elements=max(len(isbns), 1), ef_construction=200, M=16)
+            index.add_items(vectors, np.arange(len(isbns)))
+            index.save_index(os.path.join(tmp_dir, HNSW_FILE))
+            print(f"   🕸️ Dựng HNSW cho {len(isbns):,} vector trong {time.perf_counter() - start:.1f}s")
+
+        meta = {"model": model_name, "count": int(len(isbns)), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                "categories": names if categories is not None else None, "source_version": source_version,
+                "quantization": quantization or None}
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+        return out_dir
+
+    @staticmethod
+    def read_meta(directory):
+        try:
+            with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @classmethod
+    def load(cls, directory, backend="auto", ef=128, rerank=4):
+        """Memory-map index. backend: "exact", "hnsw", "int8", "pq" hoặc "auto"
+        (bản nén nếu index dựng với quantization, không thì HNSW nếu có file và đủ lớn)."""
+        meta = cls.read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"Không có vector index ở {directory}")
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        isbns = np.load(os.path.join(directory, "isbns.npy"), mmap_mode="r")
+        codes_path = os.path.join(directory, "categories.codes.npy")
+        codes = np.load(codes_path, mmap_mode="r") if os.path.exists(codes_path) else None
+
+        quantization = backend if backend in QUANTIZATIONS else meta.get("quantization") if backend == "auto" else None
+        if quantization:
+            try:
+                quantizer, qcodes = load_quantizer(directory, quantization)
+            except FileNotFoundError:
+                if backend == quantization:
+                    raise FileNotFoundError(f"Index ở {directory} chưa có mã nén {quantization}")
+            else:
+                _advise_random(vectors)
+                return cls(vectors, isbns, codes, meta.get("categories") or (), ef=ef,
+                           quantizer=quantizer, codes=qcodes, rerank=rerank)
+
+        hnsw = None
+        hnsw_path = os.path.join(directory, HNSW_FILE)
+        want_hnsw = backend == "hnsw" or (backend == "auto" and len(isbns) >= HNSW_MIN_ROWS)
+        if want_hnsw and os.path.exists(hnsw_path) and _hnswlib() is not None:
+            hnsw = _hnswlib().Index(space="ip", dim=meta["dim"])
+            hnsw.load_index(hnsw_path, max_elements=len(isbns))
+        elif backend == "hnsw":
+            raise FileNotFoundError(f"Không dùng được HNSW ở {directory} (thiếu {HNSW_FILE} hoặc hnswlib)")
+        return cls(vectors, isbns, codes, meta.get("categories") or (), hnsw, ef=ef)
+
+    # --- TÌM KIẾM ---
+
+    def _category_mask_code(self, category):
+        if category is None:
+            return None
+        if self.category_codes is None:
+            raise ValueError("Index không có thông tin thể loại")
+        return self._category_id.get(category, -2)  # -2: không sách nào khớp
+
+    def _exact(self, queries, k, code=None):
+        """Nhân ma trận theo khối, giữ top-k chạy dần. Trả về (rows, scores), hàng -1 = không đủ kết quả."""
+        return self._scan(queries, k, code, lambda start, stop: queries @ np.asarray(self.vectors[start:stop]).T)
+
+    def _quantized(self, queries, k, code=None):
+        """Quét mã nén lấy rerank*k ứng viên, tính lại điểm chính xác từ vectors memory-map"""
+        score = self.quantizer.scorer(queries)
+        shortlist, _ = self._scan(queries, min(k * self.rerank, len(self.isbns)), code,
+                                  lambda start, stop: score(np.asarray(self.codes[start:stop])), QUANT_BLOCK_SIZE)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, rows in enumerate(shortlist):
+            # Đọc theo thứ tự hàng tăng dần: truy cập memory-map gần tuần tự hơn
+            rows = np.sort(rows[rows >= 0])
+            exact = np.asarray(self.vectors[rows]) @ queries[i]
+            top = np.argsort(-exact, kind="stable")[:k]
+            out_rows[i, :len(top)], out_scores[i, :len(top)] = rows[top], exact[top]
+        return out_rows, out_scores
+
+    def _scan(self, queries, k, code, score_block, block_size=None):
+        """score_block(start, stop) -> điểm (m, stop - start); giữ top-k chạy dần qua các khối"""
+        m = len(queries)
+        block_size = block_size or self.block_size
+        best_rows = np.full((m, 0), -1, dtype=np.int64)
+        best_scores = np.full((m, 0), -np.inf, dtype=np.float32)
+        for start in range(0, len(self.isbns), block_size):
+            stop = min(start + block_size, len(self.isbns))
+            scores = score_block(start, stop)  # (m, b)
+            if code is not None:
+                scores[:, np.asarray(self.category_codes[start:stop]) != code] = -np.inf
+            rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[~np.isfinite(best_scores)] = -1
+        return best_rows, best_scores
+
+    def _hnsw(self, queries, k, code=None):
+        if code is None:
+            self.hnsw.set_ef(max(self.ef, k))
+            rows, dist = self.hnsw.knn_query(queries, k=min(k, len(self.isbns)))
+            return rows.astype(np.int64), (1.0 - dist).astype(np.float32)
+        # Lọc thể loại: lấy dư rồi lọc, không đủ thì tăng gấp đôi; quá nhiều thì tìm chính xác
+        fetch = k * 4
+        while fetch < len(self.isbns) // 4:
+            self.hnsw.set_ef(max(self.ef, fetch))
+            rows, dist = self.hnsw.knn_query(queries, k=fetch)
+            keep = np.asarray(self.category_codes)[rows] == code
+            if keep.sum(axis=1).min() >= k:
+                out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+                out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+                for i in range(len(queries)):
+                    sel = np.flatnonzero(keep[i])[:k]
+                    out_rows[i], out_scores[i] = rows[i, sel], 1.0 - dist[i, sel]
+                return out_rows, out_scores
+            fetch *= 2
+        return self._exact(queries, k, code)
+
+    def search_batch(self, queries, k, category=None):
+        """Nhiều query cùng lúc -> (rows (m, k), scores (m, k)); hàng -1 = thiếu kết quả"""
+        queries = _normalize(np.atleast_2d(queries))
+        code = self._category_mask_code(category)
+        if len(self.isbns) == 0 or k <= 0:
+            return np.full((len(queries), 0), -1, dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        if self.quantizer is not None:
+            return self._quantized(queries, k, code)
+        if self.hnsw is not None:
+            return self._hnsw(queries, k, code)
+        return self._exact(queries, k, code)
+
+    def isbns_of(self, rows):
+        """Hàng -> ISBN dạng chuỗi (bỏ hàng -1)"""
+        rows = np.asarray(rows)
+        return np.asarray(self.isbns)[rows[rows >= 0]].astype(str)
+
+    def search(self, query, k, category=None):
+        """Một query -> mảng ISBN (chuỗi) theo thứ tự tương đồng"""
+        rows, _ = self.search_batch(query, k, category)
+        return self.isbns_of(rows[0])
+
+
+# --- EXPORT TỪ CHROMA (KHÔNG EMBED LẠI) ---
+
+def _parse_rows(page):
+    """Một trang collection.get(...) -> các bộ (isbn, vector, thể loại) có ISBN hợp lệ"""
+    for isbn, vec, meta in zip(page["ids"], page["embeddings"], page["metadatas"]):
+        isbn = str((meta or {}).get("isbn", isbn)).replace(".0", "").strip()
+        if isbn.isdigit():
+            yield int(isbn), vec, (meta or {}).get("simple_categories", "")
+
+
+def export_from_chroma(persist_dir, out_dir=None, collection_name=None, page_size=5000, hnsw="auto", quantization=None):
+    """Đọc toàn bộ embedding + thể loại từ collection Chroma, ghi ra VectorIndex. Trả về thư mục đã ghi."""
+    from vector_ingest import COLLECTION_NAME, open_collection, load_manifest
+
+    out_dir = out_dir or vector_index_dir_for(persist_dir)
+    _, collection = open_collection(persist_dir, collection_name or COLLECTION_NAME)
+    isbns, vectors, categories = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        for isbn, vec, category in _parse_rows(page):
+            isbns.append(isbn)
+            vectors.append(vec)
+            categories.append(category)
+        offset += len(page["ids"])
+
+    has_categories = any(categories)
+    manifest = load_manifest(persist_dir) or {}
+    VectorIndex.build(out_dir, isbns, np.asarray(vectors, dtype=np.float32).reshape(len(isbns), -1),
+                      categories if has_categories else None, manifest.get("model"),
+                      _source_version(persist_dir), hnsw, quantization)
+    print(f"✅ Đã export {len(isbns):,} vector sang '{out_dir}'")
+    return out_dir
+
+
+# --- CẬP NHẬT TĂNG DẦN (CHỈ ĐỌC SÁCH MỚI / ĐÃ SỬA TỪ CHROMA) ---
+# Sau vector_ingest.sync(): giữ các hàng cũ của index, bỏ ISBN đã xóa / đã sửa, nối thêm vector của
+# ISBN mới / đã sửa. Chỉ các ISBN thay đổi được đọc từ Chroma; phần còn lại chép từ vectors.npy.
+
+def update_index(index_dir, isbns, vectors, categories=None, removed=(), source_version=None, hnsw="auto",
+                 quantization=None):
+    """Vá index ở index_dir: bỏ hàng của removed và của isbns (ghi lại), thêm (isbns, vectors, categories)"""
+    meta = VectorIndex.read_meta(index_dir)
+    if meta is None:
+        raise FileNotFoundError(f"Không có vector index ở {index_dir}")
+    old_isbns = np.load(os.path.join(index_dir, "isbns.npy"))
+    old_vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+    isbns = np.asarray(isbns, dtype=np.uint64)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(isbns), old_vectors.shape[1])
+
+    keep = np.flatnonzero(~np.isin(old_isbns, np.concatenate([isbns, np.asarray(removed, dtype=np.uint64)])))
+    old_categories = None
+    codes_path = os.path.join(index_dir, "categories.codes.npy")
+    if meta.get("categories") is not None and os.path.exists(codes_path):
+        # Mã -1 (không có thể loại) -> phần tử cuối ""
+        lookup = np.array(list(meta["categories"]) + [""], dtype=object)
+        old_categories = lookup[np.load(codes_path)[keep]]
+
+    new_categories = list(categories) if categories is not None else [""] * len(isbns)
+    merged = None
+    if old_categories is not None or any(new_categories):
+        merged = (list(old_categories) if old_categories is not None else [""] * len(keep)) + new_categories
+    VectorIndex.build(index_dir, np.concatenate([old_isbns[keep], isbns]),
+                      np.concatenate([old_vectors[keep], vectors]), merged, meta.get("model"), source_version,
+                      hnsw, quantization)
+    return len(keep) + len(isbns)
+
+
+def update_from_chroma(persist_dir, changed, removed, out_dir=None, collection_name=None, page_size=5000,
+                       hnsw="auto", quantization=None):
+    """changed/removed: id (ISBN) do vector_ingest.sync() trả về. Chỉ đọc các id đã đổi từ Chroma."""
+    from vector_ingest import COLLECTION_NAME, open_collection
+
+    out_dir = out_dir or vector_index_dir_for(persist_dir)
+    _, collection = open_collection(persist_dir, collection_name or COLLECTION_NAME)
+    isbns, vectors, categories = [], [], []
+    for i in range(0, len(changed), page_size):
+        page = collection.get(ids=list(changed[i:i + page_size]), include=["embeddings", "metadatas"])
+        for isbn, vec, category in _parse_rows(page):
+            isbns.append(isbn)
+            vectors.append(vec)
+            categories.append(category)
+    removed_isbns = [int(r) for r in (str(r).replace(".0", "").strip() for r in removed) if r.isdigit()]
+
+    total = update_index(out_dir, isbns, vectors, categories, removed_isbns, _source_version(persist_dir),
+                         hnsw, quantization)
+    print(f"✅ Đã cập nhật vector index '{out_dir}': +{len(isbns):,} / -{len(removed_isbns):,} "
+          f"({total:,} vector)")
+    return out_dir
+
+
+def is_fresh(persist_dir, index_dir=None):
+    """Index đã export từ đúng phiên bản Chroma hiện tại (theo mtime manifest)"""
+    meta = VectorIndex.read_meta(index_dir or vector_index_dir_for(persist_dir))
+    return meta is not None and meta.get("source_version") == _source_version(persist_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export embedding từ chroma_db/ sang vector index memory-map")
+    parser.add_argument("--persist-dir", default=os.path.join(base_dir, "chroma_db"))
+    parser.add_argument("--hnsw", choices=["auto", "yes", "no"], default="auto")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="Ghi thêm mã nén (int8: nhỏ 4 lần, pq: nhỏ 32 lần) cho catalogue lớn")
+    args = parser.parse_args()
+    export_from_chroma(args.persist_dir, hnsw={"auto": "auto", "yes": True, "no": False}[args.hnsw],
+                       quantization=args.quantization)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from catalog_store import normalize_isbn_series
+from embedding_cache import CachedEmbeddings, cached_embedding_model
+from hash_embedding import HashEmbeddings, is_hash_model
+
+# --- NẠP VECTOR THEO LÔ (STREAMING + BATCH LỚN + UPSERT MỘT COLLECTION) ---
+# Bản cũ: iterrows() tạo Document rồi gọi Chroma.from_documents cho từng lát 500 sách,
+# mỗi lần lại mở client/collection mới và embed với batch mặc định của model.
+# Ở đây: đọc CSV theo từng chunk, embed theo batch lớn (có thể song song nhiều process),
+# rồi upsert thẳng vào MỘT collection đang mở với id = ISBN (chạy lại không bị trùng).
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Tên collection mặc định của langchain_chroma.Chroma (dashboard mở collection này)
+COLLECTION_NAME = "langchain"
+# Các cột catalogue được ghi vào metadata của từng vector
+STRING_FIELDS = ["simple_categories", "title", "authors"]
+FLOAT_FIELDS = ["joy", "sadness", "fear", "anger", "surprise"]
+
+def make_embedding_model(model_name=MODEL_NAME, batch_size=256, cache_dir=None):
+    """HuggingFaceEmbeddings với batch_size tùy chỉnh; có cache_dir thì bọc thêm cache embedding trên đĩa.
+    model_name "hash"/"hash-<số chiều>" -> HashEmbeddings chạy offline (không cache: tính còn nhanh hơn đọc cache)"""
+    if is_hash_model(model_name):
+        return HashEmbeddings.from_name(model_name)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+    if cache_dir:
+        return cached_embedding_model(model, cache_dir, model_name)
+    return model
+
+def open_collection(persist_dir, collection_name=COLLECTION_NAME):
+    """Mở (hoặc tạo) collection Chroma một lần cho cả quá trình nạp"""
+    import chromadb
+    client = chromadb.PersistentClient(path=persist_dir)
+    return client, client.get_or_create_collection(collection_name)
+
+def _iter_chunks(source, chunksize):
+    if isinstance(source, pd.DataFrame):
+        # Catalogue đã nạp (catalog_store.read_books): cắt lát theo vị trí, không copy cả bảng
+        for i in range(0, len(source), chunksize):
+            yield source.iloc[i:i+chunksize].copy()
+    else:
+        for chunk in pd.read_csv(source, dtype={"isbn13": str}, chunksize=chunksize):
+            chunk["isbn13"] = normalize_isbn_series(chunk["isbn13"])
+            yield chunk
+
+def iter_documents(source, chunksize=2048):
+    """Duyệt sách theo chunk (source = đường dẫn CSV hoặc DataFrame), trả về (ids, texts, metadatas)"""
+    for chunk in _iter_chunks(source, chunksize):
+        if "tagged_description" not in chunk.columns:
+            # Nếu chưa có, tự tạo cột này: ISBN + Title + Description
+            chunk["tagged_description"] = chunk["isbn13"] + " " + chunk["title"] + " " + chunk["description"]
+        chunk["tagged_description"] = chunk["tagged_description"].fillna("").astype(str)
+
+        # Chỉ thêm nếu content hợp lệ; ISBN trùng trong chunk -> giữ bản cuối (upsert không nhận id trùng)
+        chunk = chunk[chunk["tagged_description"].str.len() > 10].drop_duplicates("isbn13", keep="last")
+        if chunk.empty:
+            continue
+        ids = chunk["isbn13"].tolist()
+        yield ids, chunk["tagged_description"].tolist(), build_metadatas(chunk)
+
+def build_metadatas(chunk):
+    """Metadata cho Chroma: ISBN + thể loại + điểm cảm xúc + vài trường catalogue,
+    để vector search lọc thẳng theo thể loại (không phải lấy 100 rồi bỏ bớt)"""
+    # Chroma không nhận None/NaN trong metadata
+    columns = {"isbn": chunk["isbn13"]}
+    for col in STRING_FIELDS:
+        if col in chunk.columns:
+            columns[col] = chunk[col].fillna("").astype(str)
+    for col in FLOAT_FIELDS:
+        if col in chunk.columns:
+            columns[col] = pd.to_numeric(chunk[col], errors="coerce").fillna(0.0).astype(float)
+    return pd.DataFrame(columns).to_dict("records")
+
+# --- EMBED TRONG PROCESS CON ---
+_worker_model = None
+
+def _init_worker(model_name, batch_size):
+    global _worker_model
+    import torch
+    # Mỗi process một luồng, song song hóa bằng số process
+    torch.set_num_threads(1)
+    _worker_model = make_embedding_model(model_name, batch_size)
+
+def _embed_in_worker(texts):
+    return _worker_model.embed_documents(texts)
+
+class _PoolEmbedder:
+    """Chia một lô văn bản cho các process con, ghép lại embedding theo đúng thứ tự"""
+
+    def __init__(self, pool, workers):
+        self.pool = pool
+        self.workers = workers
+
+    def embed_documents(self, texts):
+        size = max(1, -(-len(texts) // self.workers))
+        parts = [texts[i:i+size] for i in range(0, len(texts), size)]
+        return [vec for part in self.pool.map(_embed_in_worker, parts) for vec in part]
+
+def _embed_and_upsert(batches, client, collection, embedding_model=None, model_name=MODEL_NAME,
+                      batch_size=256, workers=1):
+    """Embed từng lô (ids, texts, metadatas) rồi upsert. Trả về số sách đã nạp."""
+    # Chroma giới hạn số bản ghi mỗi lần upsert
+    max_upsert = getattr(client, "max_batch_size", 5000) or 5000
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name, batch_size))
+        embedder = _PoolEmbedder(pool, workers)
+        # Vẫn tra cache embedding ở process chính, chỉ gửi phần chưa có cho các process con
+        cache = getattr(embedding_model, "cache", None)
+        if cache is not None:
+            embedder = CachedEmbeddings(embedder, cache)
+    else:
+        embedder = embedding_model or make_embedding_model(model_name, batch_size)
+
+    done = 0
+    start = time.perf_counter()
+    try:
+        for ids, texts, metadatas in batches:
+            embeddings = embedder.embed_documents(texts)
+            for i in range(0, len(ids), max_upsert):
+                collection.upsert(ids=ids[i:i+max_upsert], embeddings=embeddings[i:i+max_upsert],
+                                  documents=texts[i:i+max_upsert], metadatas=metadatas[i:i+max_upsert])
+            done += len(ids)
+            elapsed = time.perf_counter() - start
+            print(f"   -> Đã nạp {done} sách ({done / elapsed:,.0f} docs/giây)")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    if done:
+        print(f"✅ Nạp xong {done} sách trong {elapsed:.1f}s ({done / elapsed:,.0f} docs/giây)")
+    cache = getattr(embedder, "cache", None)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"   💾 Cache embedding: {stats['hits']} hit / {stats['misses']} miss ({stats['size']} vector)")
+        cache.flush()
+    return done
+
+def ingest(source, persist_dir, embedding_model=None, model_name=MODEL_NAME, batch_size=256,
+           workers=1, chunksize=2048, collection_name=COLLECTION_NAME):
+    """Embed toàn bộ sách (đường dẫn CSV hoặc DataFrame) và upsert vào Chroma. Trả về số sách đã nạp."""
+    client, collection = open_collection(persist_dir, collection_name)
+    hashes = {}
+
+    def batches():
+        for ids, texts, metadatas in iter_documents(source, chunksize):
+            hashes.update(zip(ids, map(content_hash, texts, metadatas)))
+            yield ids, texts, metadatas
+
+    done = _embed_and_upsert(batches(), client, collection, embedding_model, model_name, batch_size, workers)
+    save_manifest(persist_dir, {"model": model_name, "collection": collection_name, "hashes": hashes})
+    return done
+
+# --- ĐỒNG BỘ TĂNG DẦN (CHỈ EMBED SÁCH MỚI / ĐÃ SỬA) ---
+# Manifest lưu hash của tagged_description (+ metadata) theo ISBN, nằm cạnh thư mục chroma_db/.
+# Lần sau chỉ embed + upsert ISBN mới hoặc có nội dung đổi, và xóa ISBN đã bị bỏ.
+
+def content_hash(text, metadata=None):
+    """Hash nội dung + metadata (đổi thể loại/cảm xúc cũng phải upsert lại)"""
+    h = hashlib.blake2b(text.encode("utf-8"), digest_size=8)
+    if metadata:
+        h.update(json.dumps(metadata, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def manifest_path(persist_dir):
+    """chroma_db/ -> chroma_db.manifest.json (cùng thư mục cha)"""
+    return os.path.normpath(persist_dir) + ".manifest.json"
+
+def load_manifest(persist_dir):
+    try:
+        with open(manifest_path(persist_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_manifest(persist_dir, manifest):
+    # Ghi ra file tạm rồi đổi tên để không bao giờ để lại manifest dở dang
+    path = manifest_path(persist_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def sync(source, persist_dir, embedding_model=None, model_name=MODEL_NAME, batch_size=256,
+         workers=1, chunksize=2048, collection_name=COLLECTION_NAME):
+    """Đồng bộ Chroma với source (CSV hoặc DataFrame), chỉ embed phần thay đổi.
+    Trả về (id thêm/sửa, id bị xóa); (None, None) nếu phải dựng lại toàn bộ collection."""
+    manifest = load_manifest(persist_dir)
+    if not manifest or manifest.get("model") != model_name or manifest.get("collection") != collection_name:
+        # Chưa có manifest (DB cũ dùng id ngẫu nhiên) hoặc đổi model -> phải dựng lại từ đầu
+        print("⚠️ Không có manifest hợp lệ -> dựng lại toàn bộ collection.")
+        client, _ = open_collection(persist_dir, collection_name)
+        try:
+            client.delete_collection(collection_name)
+        except Exception:
+            pass
+        ingest(source, persist_dir, embedding_model, model_name, batch_size, workers, chunksize, collection_name)
+        return None, None
+
+    old_hashes = manifest["hashes"]
+    new_hashes = {}
+    changed = {}
+    for ids, texts, metadatas in iter_documents(source, chunksize):
+        for isbn, text, meta in zip(ids, texts, metadatas):
+            h = content_hash(text, meta)
+            new_hashes[isbn] = h
+            if old_hashes.get(isbn) != h:
+                changed[isbn] = (isbn, text, meta)
+            else:
+                changed.pop(isbn, None)
+    removed = [isbn for isbn in old_hashes if isbn not in new_hashes]
+    print(f"🔁 Đồng bộ tăng dần: {len(changed)} sách mới/đã sửa, {len(removed)} sách bị xóa, "
+          f"{len(new_hashes) - len(changed)} giữ nguyên.")
+
+    client, collection = open_collection(persist_dir, collection_name)
+    max_batch = getattr(client, "max_batch_size", 5000) or 5000
+    for i in range(0, len(removed), max_batch):
+        collection.delete(ids=removed[i:i+max_batch])
+
+    changed_ids = list(changed)
+    changed = list(changed.values())
+
+    def batches():
+        for i in range(0, len(changed), chunksize):
+            part = changed[i:i+chunksize]
+            yield [p[0] for p in part], [p[1] for p in part], [p[2] for p in part]
+
+    if changed:
+        _embed_and_upsert(batches(), client, collection, embedding_model, model_name, batch_size, workers)
+    # Không đổi gì -> giữ nguyên manifest (và mtime của nó): vector index đã export vẫn được coi là mới
+    if changed or removed:
+        manifest["hashes"] = new_hashes
+        save_manifest(persist_dir, manifest)
+    return changed_ids, removed
+
+def default_workers():
+    """Số process gợi ý: mỗi nhân CPU một process, tối đa 8"""
+    return max(1, min(8, os.cpu_count() or 1))
@@ -0,0 +1,162 @@
+import os
+
+import numpy as np
+
+# --- NÉN VECTOR: INT8 VÔ HƯỚNG / PRODUCT QUANTIZATION ---
+# Ma trận float32 (n, 384) của all-MiniLM-L6-v2 = 1.5KB/sách -> hàng triệu sách không nằm gọn trong RAM.
+# Lượt tìm đầu chỉ quét mã nén (luôn nằm trong RAM), rồi VectorIndex tính lại điểm chính xác
+# cho danh sách ngắn bằng vectors.npy memory-map (chỉ vài trăm hàng được đọc mỗi query).
+#   * int8: mỗi chiều một hệ số scale = max|x| / 127 -> 1 byte/chiều (nhỏ 4 lần), gần như không mất recall.
+#   * pq:   chia vector thành m đoạn con, mỗi đoạn thay bằng số thứ tự của 1 trong 256 tâm k-means
+#           -> m byte/vector (m = dim/8: nhỏ 32 lần); điểm = tổng bảng tra (query . tâm) theo từng đoạn.
+# Mỗi loại có encode(vectors) -> mã, scorer(queries) -> hàm tính điểm xấp xỉ cho một khối mã,
+# save/load vào thư mục index (cạnh vectors.npy).
+
+QUANTIZATIONS = ("int8", "pq")
+
+
+def _blocks(n, block_size):
+    for start in range(0, n, block_size):
+        yield start, min(start + block_size, n)
+
+
+class ScalarQuantizer:
+    kind = "int8"
+
+    def __init__(self, scale):
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def train(cls, vectors, block_size=65536):
+        """scale theo từng chiều từ toàn bộ ma trận (đọc theo khối, chạy được trên memory-map)"""
+        peak = np.zeros(vectors.shape[1], dtype=np.float32)
+        for start, stop in _blocks(len(vectors), block_size):
+            np.maximum(peak, np.abs(np.asarray(vectors[start:stop])).max(axis=0), out=peak)
+        peak[peak == 0] = 1.0
+        return cls(peak / 127.0)
+
+    def encode(self, vectors):
+        return np.clip(np.rint(np.asarray(vectors) / self.scale), -127, 127).astype(np.int8)
+
+    def scorer(self, queries):
+        """q . x ≈ (q * scale) . mã"""
+        scaled = (queries * self.scale).astype(np.float32)
+        return lambda codes: scaled @ codes.astype(np.float32).T
+
+    @property
+    def code_bytes(self):
+        return len(self.scale)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "int8.scale.npy"), self.scale)
+
+    @classmethod
+    def load(cls, directory):
+        return cls(np.load(os.path.join(directory, "int8.scale.npy")))
+
+
+class ProductQuantizer:
+    kind = "pq"
+
+    def __init__(self, centroids):
+        # (m, 256, dsub)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+
+    @classmethod
+    def train(cls, vectors, m=None, n_centroids=256, sample=20_000, iterations=10, seed=42):
+        """k-means trên mẫu ngẫu nhiên cho từng đoạn con. m mặc định = dim/8 (8 chiều mỗi đoạn)."""
+        dim = vectors.shape[1]
+        m = m or max(1, dim // 8)
+        if dim % m:
+            raise ValueError(f"Số chiều {dim} không chia hết cho m={m}")
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(len(vectors), min(sample, len(vectors)), replace=False))
+        data = np.asarray(vectors[rows], dtype=np.float32).reshape(len(rows), m, dim // m)
+        k = min(n_centroids, len(rows))
+        centroids = np.empty((m, n_centroids, dim // m), dtype=np.float32)
+        for j in range(m):
+            sub = data[:, j]
+            c = sub[rng.choice(len(sub), k, replace=False)].copy()
+            for _ in range(iterations):
+                assign = cls._nearest(sub, c)
+                counts = np.bincount(assign, minlength=k)
+                sums = np.stack([np.bincount(assign, weights=sub[:, d], minlength=k) for d in range(sub.shape[1])],
+                                axis=1)
+                # Tâm rỗng giữ nguyên vị trí cũ
+                filled = counts > 0
+                c[filled] = sums[filled] / counts[filled, None]
+            centroids[j, :k] = c
+            centroids[j, k:] = c[0]
+        return cls(centroids)
+
+    @staticmethod
+    def _nearest(sub, c):
+        # argmin |x - c|^2 = argmin (|c|^2 - 2 x.c); đoạn con phải liền bộ nhớ để matmul chạy qua BLAS
+        dist = np.ascontiguousarray(sub) @ (-2.0 * c).T
+        dist += (c * c).sum(axis=1)
+        return np.argmin(dist, axis=1)
+
+    @property
+    def m(self):
+        return self.centroids.shape[0]
+
+    def encode(self, vectors, block_size=65536):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        dsub = self.centroids.shape[2]
+        for start, stop in _blocks(len(vectors), block_size):
+            block = vectors[start:stop].reshape(stop - start, self.m, dsub)
+            for j in range(self.m):
+                codes[start:stop, j] = self._nearest(block[:, j], self.centroids[j])
+        return codes
+
+    def scorer(self, queries):
+        """Bảng tra (số query, m, 256) một lần cho mỗi lô query, rồi cộng theo mã của từng đoạn"""
+        dsub = self.centroids.shape[2]
+        lut = np.einsum("qjd,jcd->qjc", queries.reshape(len(queries), self.m, dsub), self.centroids)
+
+        def score(codes):
+            out = np.zeros((len(queries), len(codes)), dtype=np.float32)
+            for j in range(self.m):
+                out += lut[:, j, codes[:, j]]
+            return out
+        return score
+
+    @property
+    def code_bytes(self):
+        return self.m
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "pq.centroids.npy"), self.centroids)
+
+    @classmethod
+    def load(cls, directory):
+        return cls(np.load(os.path.join(directory, "pq.centroids.npy")))
+
+
+_KINDS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+def codes_path(directory, kind):
+    return os.path.join(directory, f"codes.{kind}.npy")
+
+
+def train_and_encode(directory, vectors, kind, block_size=65536, **kwargs):
+    """Huấn luyện bộ nén trên vectors (có thể là memory-map), ghi mã + tham số vào directory"""
+    if kind not in _KINDS:
+        raise ValueError(f"Kiểu nén không hỗ trợ: {kind} (chọn {', '.join(QUANTIZATIONS)})")
+    quantizer = _KINDS[kind].train(vectors, **kwargs)
+    codes = np.lib.format.open_memmap(codes_path(directory, kind), mode="w+",
+                                      dtype=np.int8 if kind == "int8" else np.uint8,
+                                      shape=(len(vectors), quantizer.code_bytes))
+    for start, stop in _blocks(len(vectors), block_size):
+        codes[start:stop] = quantizer.encode(vectors[start:stop])
+    codes.flush()
+    del codes
+    quantizer.save(directory)
+    return quantizer
+
+
+def load_quantizer(directory, kind):
+    """(bộ nén, mã memory-map). Mã nhỏ nên nằm luôn trong page cache, các process dùng chung."""
+    return _KINDS[kind].load(directory), np.load(codes_path(directory, kind), mmap_mode="r")